@@ -26,4 +26,5 @@ else:
 # Parser global options
 autofix = True            # Enable Autofix? see hachoir_core.field.GenericFieldSet
 check_padding_pattern = True   # Check padding fields pattern?
+detailed_huffman = False       # Create a field for each Huffman code? (slow)
 
@@ -25,6 +25,10 @@ class BasicFieldSet(Field):
     is_field_set = True
     endian = None
 
+    # Charset of the first non-ASCII string without explicit charset,
+    # only used on the root field set (see GenericString)
+    _charset_hint = None
+
     def __init__(self, parent, name, stream, description, size):
         # Sanity checks (preconditions)
         assert not parent or issubclass(parent.__class__, BasicFieldSet)
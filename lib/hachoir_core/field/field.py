@@ -80,6 +80,11 @@ class Field(Logger):
     def _logger(self):
         return self.path
 
+    def _logContext(self):
+        if self._parent:
+            return self._parent.root
+        return self
+
     def createDescription(self):
         return ""
     def _getDescription(self):
@@ -112,7 +117,7 @@ class Field(Logger):
         try:
             value = self.createValue()
         except HACHOIR_ERRORS, err:
-            self.error(_("Unable to create value: %s") % unicode(err))
+            self.error(_("Unable to create value: %s"), unicode(err))
             value = None
         self._getValue = lambda: value
         return value
@@ -129,7 +134,7 @@ class Field(Logger):
             try:
                 self.__display = self.createDisplay()
             except HACHOIR_ERRORS, err:
-                self.error("Unable to create display: %s" % err)
+                self.error("Unable to create display: %s", err)
                 self.__display = u""
         return self.__display
     display = property(lambda self: self._getDisplay(),
@@ -146,7 +151,7 @@ class Field(Logger):
             try:
                 self.__raw_display = self.createRawDisplay()
             except HACHOIR_ERRORS, err:
-                self.error("Unable to create raw display: %s" % err)
+                self.error("Unable to create raw display: %s", err)
                 self.__raw_display = u""
         return self.__raw_display
     raw_display = property(lambda self: self._getRawDisplay(),
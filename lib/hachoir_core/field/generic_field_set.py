@@ -2,6 +2,8 @@ from hachoir_core.field import (MissingField, BasicFieldSet, Field, ParserError,
     createRawField, createNullField, createPaddingField, FakeArray)
 from hachoir_core.dict import Dict, UniqKeyError
 from hachoir_core.error import HACHOIR_ERRORS
+from hachoir_core.log import LazyValue
+from hachoir_core.instrument import instrument
 from hachoir_core.tools import lowerBound, makeUnicode
 import hachoir_core.config as config
 
@@ -63,10 +65,16 @@ class GenericFieldSet(BasicFieldSet):
         """
         BasicFieldSet.__init__(self, parent, name, stream, description, size)
         self._fields = Dict()
-        self._field_generator = self.createFields()
+        self._field_generator = self._createFieldGenerator()
         self._array_cache = {}
         self.__is_feeding = False
 
+    def _createFieldGenerator(self):
+        generator = self.createFields()
+        if instrument.enabled:
+            generator = instrument.timeGenerator(generator, self.__class__.__name__)
+        return generator
+
     def array(self, key):
         try:
             return self._array_cache[key]
@@ -87,7 +95,7 @@ class GenericFieldSet(BasicFieldSet):
         """
         BasicFieldSet.reset(self)
         self._fields = Dict()
-        self._field_generator = self.createFields()
+        self._field_generator = self._createFieldGenerator()
         self._current_size = 0
         self._array_cache = {}
 
@@ -151,13 +159,15 @@ class GenericFieldSet(BasicFieldSet):
         assert isinstance(field._name, str)
         if field._name.endswith("[]"):
             self.setUniqueFieldName(field)
+        if instrument.enabled:
+            instrument.count("fields", field.__class__.__name__)
         if config.debug:
-            self.info("[+] DBG: _addField(%s)" % field.name)
+            self.info("[+] DBG: _addField(%s)", field.name)
 
         # required for the msoffice parser
         if field._address != self._current_size:
-            self.warning("Fix address of %s to %s (was %s)" %
-                (field.path, self._current_size, field._address))
+            self.warning("Fix address of %s to %s (was %s)",
+                LazyValue(getattr, field, "path"), self._current_size, field._address)
             field._address = self._current_size
 
         ask_stop = False
@@ -167,11 +177,11 @@ class GenericFieldSet(BasicFieldSet):
             field_size = field.size
         except HACHOIR_ERRORS, err:
             if field.is_field_set and field.current_length and field.eof:
-                self.warning("Error when getting size of '%s': %s" % (field.name, err))
+                self.warning("Error when getting size of '%s': %s", field.name, err)
                 field._stopFeeding()
                 ask_stop = True
             else:
-                self.warning("Error when getting size of '%s': delete it" % field.name)
+                self.warning("Error when getting size of '%s': delete it", field.name)
                 self.__is_feeding = False
                 raise
         self.__is_feeding = False
@@ -204,7 +214,10 @@ class GenericFieldSet(BasicFieldSet):
             # Don't add the field <=> delete item
             if self._size is None:
                 self._size = self._current_size + new_size
-        self.warning("[Autofix] Delete '%s' (too large)" % field.path)
+        if instrument.enabled:
+            instrument.count("autofix", self.root.__class__.__name__)
+        self.warning("[Autofix] Delete '%s' (too large)",
+            LazyValue(getattr, field, "path"))
         raise StopIteration()
 
     def _getField(self, name, const):
@@ -268,6 +281,8 @@ class GenericFieldSet(BasicFieldSet):
 
         # Stop parser
         message = ["stop parser"]
+        if instrument.enabled:
+            instrument.count("autofix", self.root.__class__.__name__)
         self._field_generator = None
 
         # If last field is too big, delete it
@@ -319,8 +334,8 @@ class GenericFieldSet(BasicFieldSet):
         """
         if self.__is_feeding \
         or (self._field_generator and self._field_generator.gi_running):
-            self.warning("Unable to get %s (and generator is already running)"
-                % field_name)
+            self.warning("Unable to get %s (and generator is already running)",
+                field_name)
             return None
         try:
             while True:
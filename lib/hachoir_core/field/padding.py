@@ -36,7 +36,7 @@ class PaddingBits(Bits):
             self.warning("padding contents doesn't look normal (invalid pattern)")
             return False
         if self.MAX_SIZE < self._size:
-            self.info("only check first %u bits" % self.MAX_SIZE)
+            self.info("only check first %u bits", self.MAX_SIZE)
         return True
 
     def createDisplay(self):
@@ -75,7 +75,7 @@ class PaddingBytes(Bytes):
             return False
 
         if self.MAX_SIZE < self._size/8:
-            self.info("only check first %s of padding" % humanFilesize(self.MAX_SIZE))
+            self.info("only check first %s of padding", humanFilesize(self.MAX_SIZE))
             content = self._parent.stream.readBytes(
                 self.absolute_address, self.MAX_SIZE)
         else:
@@ -86,8 +86,8 @@ class PaddingBytes(Bytes):
             if content[index:index+pattern_len] != self.pattern:
                 self.warning(
                     "padding contents doesn't look normal"
-                    " (invalid pattern at byte %u)!"
-                    % index)
+                    " (invalid pattern at byte %u)!",
+                    index)
                 return False
             index += pattern_len
         return True
@@ -1,5 +1,6 @@
 from hachoir_core.field import BasicFieldSet, GenericFieldSet, ParserError, createRawField
 from hachoir_core.error import HACHOIR_ERRORS
+from hachoir_core.instrument import instrument
 
 # getgaps(int, int, [listof (int, int)]) -> generator of (int, int)
 # Gets all the gaps not covered by a block in `blocks` from `start` for `length` units.
@@ -33,6 +34,12 @@ class RootSeekableFieldSet(GenericFieldSet):
     def seekByte(self, address, relative=True):
         return self.seekBit(address*8, relative)
 
+    def _setSize(self, size):
+        # Called by the stream (see InputStream.askSize()) when its size
+        # becomes known
+        self._size = size
+        self.raiseEvent("field-resized", self)
+
     def _fixLastField(self):
         """
         Try to fix last field when we know current field set size.
@@ -42,6 +49,8 @@ class RootSeekableFieldSet(GenericFieldSet):
 
         # Stop parser
         message = ["stop parser"]
+        if instrument.enabled:
+            instrument.count("autofix", self.root.__class__.__name__)
         self._field_generator = None
 
         # If last field is too big, delete it
@@ -226,7 +226,7 @@ class GenericString(Bytes):
     def _convertText(self, text):
         if not self._charset:
             # charset is still unknown: guess the charset
-            self._charset = guessBytesCharset(text, default=FALLBACK_CHARSET)
+            self._charset = self._guessBytesCharset(text)
 
         # Try to convert to Unicode
         try:
@@ -243,19 +243,49 @@ class GenericString(Bytes):
         and self._charset == "UTF-16-LE":
             try:
                 text = unicode(text+"\0", self._charset, "strict")
-                self.warning("Fix truncated %s string: add missing nul byte" % self._charset)
+                self.warning("Fix truncated %s string: add missing nul byte", self._charset)
                 return text
             except UnicodeDecodeError, err:
                 pass
 
         # On error, use FALLBACK_CHARSET
-        self.warning(u"Unable to convert string to Unicode: %s" % err)
+        self.warning(u"Unable to convert string to Unicode: %s", err)
         return unicode(text, FALLBACK_CHARSET, "strict")
 
+    def _guessBytesCharset(self, bytes):
+        r"""
+        The charset of the first non-ASCII string is stored in the root
+        field set and used as hint for the next strings: it only chooses
+        between charsets giving the same text, so the value of a string
+        doesn't depend on the order in which strings are read.
+
+        >>> from hachoir_core.field import Parser
+        >>> from hachoir_core.stream import StringInputStream
+        >>> class StringsParser(Parser):
+        ...     endian = BIG_ENDIAN
+        ...     def createFields(self):
+        ...         yield String(self, "greek", 6)
+        ...         yield String(self, "french", 4)
+        >>> data = "\xb8\xea\xe4\xef\xf3\xe7" "caf\xe9"
+        >>> parser = StringsParser(StringInputStream(data))
+        >>> parser["greek"].value, parser["french"].value
+        (u'\u0388\u03ba\u03b4\u03bf\u03c3\u03b7', u'caf\xe9')
+        >>> parser = StringsParser(StringInputStream(data))
+        >>> parser["french"].value, parser["greek"].value
+        (u'caf\xe9', u'\u0388\u03ba\u03b4\u03bf\u03c3\u03b7')
+        """
+        root = self._parent.root
+        charset = guessBytesCharset(bytes, hint=root._charset_hint)
+        if not charset:
+            return FALLBACK_CHARSET
+        if charset != "ASCII" and root._charset_hint is None:
+            root._charset_hint = charset
+        return charset
+
     def _guessCharset(self):
         addr = self.absolute_address + self._content_offset * 8
         bytes = self._parent.stream.readBytes(addr, self._content_size)
-        return guessBytesCharset(bytes, default=FALLBACK_CHARSET)
+        return self._guessBytesCharset(bytes)
 
     def createValue(self, human=True):
         # Compress data address (in bits) and size (in bytes)
@@ -0,0 +1,364 @@
+"""
+Canonical Huffman decoding using lookup tables.
+
+A Huffman tree is a dictionary (code length, code) => symbol, see
+buildHuffmanTree(). Instead of reading a code bit per bit, the decoder
+peeks max_length bits from a BitCursor and finds the symbol with one
+lookup in a primary table (indexed by the first PRIMARY_BITS bits), or two
+lookups for longer codes (secondary table indexed by the next bits).
+
+Decode a run of symbols:
+
+    cursor = BitCursor(stream, address, LITTLE_ENDIAN)
+    table = tree.getTable(LITTLE_ENDIAN)
+    symbols = table.decodeRun(cursor, 50)
+    size = cursor.address - address
+"""
+
+from hachoir_core.endian import BIG_ENDIAN, LITTLE_ENDIAN, MIDDLE_ENDIAN
+from hachoir_core.error import HachoirError
+from hachoir_core.tools import alignValue
+from collections import deque
+
+# Number of bits used to index the primary table
+PRIMARY_BITS = 9
+
+# Size in bytes of the blocks read by BitCursor
+BLOCK_SIZE = 4096
+
+class HuffmanError(HachoirError):
+    pass
+
+def reverseBits(value, nbits):
+    """
+    Reverse the order of the nbits lowest bits of value.
+
+    >>> reverseBits(1, 3)
+    4
+    >>> reverseBits(6, 4)
+    6
+    >>> reverseBits(11, 4)
+    13
+    """
+    result = 0
+    for index in xrange(nbits):
+        result = (result << 1) | (value & 1)
+        value >>= 1
+    return result
+
+def buildHuffmanTree(lengths):
+    """
+    Build a canonical Huffman tree from a list of lengths: the ith entry
+    of the list is the length of the code of the symbol i, or 0 if the
+    symbol is unused. Returns a HuffmanTree.
+
+    >>> tree = buildHuffmanTree([2, 1, 3, 3])
+    >>> sorted(tree.items())
+    [((1, 0), 1), ((2, 2), 0), ((3, 6), 2), ((3, 7), 3)]
+    """
+    max_length = max(lengths) + 1
+    bit_counts = [0]*max_length
+    next_code = [0]*max_length
+    tree = HuffmanTree()
+    for i in lengths:
+        if i:
+            bit_counts[i] += 1
+    code = 0
+    for i in xrange(1, len(bit_counts)):
+        next_code[i] = code = (code + bit_counts[i-1]) << 1
+    for i, ln in enumerate(lengths):
+        if ln:
+            tree[(ln, next_code[ln])] = i
+            next_code[ln] += 1
+    return tree
+
+class HuffmanTree(dict):
+    """
+    Huffman tree: dictionary (code length, code) => symbol which caches
+    its lookup tables. The tree must not be modified after getTable().
+    """
+    def __init__(self, *args):
+        dict.__init__(self, *args)
+        self._tables = {}
+
+    def remap(self, symbols):
+        """
+        Create a new tree where each symbol is replaced by symbols[symbol].
+        """
+        return HuffmanTree((key, symbols[symbol])
+            for key, symbol in self.iteritems())
+
+    def getTable(self, endian):
+        """
+        Get the lookup table used to decode bits read with this endian.
+        """
+        reverse = (endian is LITTLE_ENDIAN)
+        try:
+            return self._tables[reverse]
+        except KeyError:
+            table = HuffmanTable(self, reverse)
+            self._tables[reverse] = table
+            return table
+
+def getHuffmanTable(tree, endian):
+    """
+    Get the lookup table of a tree, which may also be a plain dictionary
+    (the table is not cached in this case).
+    """
+    if isinstance(tree, HuffmanTree):
+        return tree.getTable(endian)
+    return HuffmanTable(tree, endian is LITTLE_ENDIAN)
+
+class HuffmanTable(object):
+    """
+    Lookup table of a Huffman tree. Each entry is a tuple (symbol, length,
+    code), None for an invalid code, or a secondary table (list) for codes
+    longer than the primary table index.
+
+    If reverse is True, the first bit of a code is the least significant
+    bit of the value peeked from the cursor (LITTLE_ENDIAN streams).
+    Otherwise it is the most significant bit.
+    """
+    def __init__(self, tree, reverse=False):
+        if not tree:
+            raise HuffmanError("Empty Huffman tree")
+        self.reverse = reverse
+        self.max_length = max(length for length, code in tree)
+        self.primary_bits = min(PRIMARY_BITS, self.max_length)
+        self.secondary_bits = self.max_length - self.primary_bits
+        self.primary_mask = (1 << self.primary_bits) - 1
+        self.secondary_mask = (1 << self.secondary_bits) - 1
+        self.primary = [None] * (1 << self.primary_bits)
+        for (length, code), symbol in tree.iteritems():
+            if code >> length:
+                raise HuffmanError("Invalid Huffman code length")
+            self._addCode(length, code, (symbol, length, code))
+
+    def _getSecondary(self, index):
+        table = self.primary[index]
+        if table is None:
+            table = [None] * (1 << self.secondary_bits)
+            self.primary[index] = table
+        elif table.__class__ is not list:
+            raise HuffmanError("Invalid Huffman code lengths")
+        return table
+
+    def _addCode(self, length, code, entry):
+        primary_bits = self.primary_bits
+        if length <= primary_bits:
+            table = self.primary
+            nbits = primary_bits - length
+        else:
+            extra = length - primary_bits
+            prefix = code >> extra
+            if self.reverse:
+                prefix = reverseBits(prefix, primary_bits)
+            table = self._getSecondary(prefix)
+            code &= (1 << extra) - 1
+            length = extra
+            nbits = self.secondary_bits - extra
+        if self.reverse:
+            code = reverseBits(code, length)
+            indexes = (code | (index << length) for index in xrange(1 << nbits))
+        else:
+            code <<= nbits
+            indexes = xrange(code, code + (1 << nbits))
+        for index in indexes:
+            if table[index] is not None:
+                raise HuffmanError("Invalid Huffman code lengths")
+            table[index] = entry
+
+    def lookup(self, bits):
+        """
+        Find the code starting a value of max_length bits peeked from a
+        cursor. Returns (symbol, length, code).
+        """
+        if self.reverse:
+            entry = self.primary[bits & self.primary_mask]
+            if entry.__class__ is list:
+                entry = entry[(bits >> self.primary_bits) & self.secondary_mask]
+        else:
+            entry = self.primary[bits >> self.secondary_bits]
+            if entry.__class__ is list:
+                entry = entry[bits & self.secondary_mask]
+        if entry is None:
+            raise HuffmanError("Invalid Huffman code")
+        return entry
+
+    def decode(self, cursor):
+        """
+        Decode a symbol and move the cursor after its code.
+        """
+        symbol, length, code = self.lookup(cursor.peek(self.max_length))
+        cursor.skip(length)
+        return symbol
+
+    def decodeRun(self, cursor, count, stop=None):
+        """
+        Decode at most count symbols: stop after the symbol stop.
+        Returns the list of the symbols.
+        """
+        lookup = self.lookup
+        peek = cursor.peek
+        skip = cursor.skip
+        max_length = self.max_length
+        symbols = []
+        for index in xrange(count):
+            symbol, length, code = lookup(peek(max_length))
+            skip(length)
+            symbols.append(symbol)
+            if symbol == stop:
+                break
+        return symbols
+
+class BitCursor(object):
+    """
+    Sequential bit reader: read the stream by blocks of bytes and keep
+    the next bits in an integer. Bits are read as InputStream.readBits()
+    would read them with the same endian.
+
+    The cursor may read after the end of the data: null bits are returned
+    by peek(), but skip() raises an HuffmanError.
+
+    With unstuff=True (JPEG entropy-coded data), a null byte following
+    a 0xFF byte is skipped, and the data end before a marker (0xFF byte
+    followed by a non null byte).
+    """
+    def __init__(self, stream, address, endian, unstuff=False, block_size=BLOCK_SIZE):
+        assert endian in (BIG_ENDIAN, LITTLE_ENDIAN, MIDDLE_ENDIAN)
+        if endian is MIDDLE_ENDIAN:
+            # read 16 bits words
+            unit = 16
+            block_size = alignValue(block_size, 2)
+        else:
+            unit = 8
+        if unstuff and address % 8 == 0 and 8 <= address \
+        and stream.readBytes(address - 8, 2) == "\xff\x00":
+            address += 8
+        self.stream = stream
+        self.endian = endian
+        self.unstuff = unstuff
+        self.block_size = block_size
+        self._base = address - address % unit
+        self._offset = self._base // 8
+        self._data = ""
+        self._index = 0
+        self._eof = False
+        self._bits = 0
+        self._count = 0
+        self._consumed = 0
+        self._padding = 0
+        self._stuffed = deque()
+        self._skipped = 0
+        if address % unit:
+            self.skip(address % unit)
+
+    def _getAddress(self):
+        stuffed = self._stuffed
+        while stuffed and stuffed[0] <= self._consumed:
+            stuffed.popleft()
+            self._skipped += 1
+        return self._base + self._consumed + self._skipped * 8
+    address = property(_getAddress, doc="Address (in bits) of the next bit")
+
+    def _readBlock(self):
+        """
+        Read the next block of bytes. Returns False at the end of data.
+        """
+        if self._eof:
+            return False
+        stream = self.stream
+        size = self.block_size
+        if not stream.sizeGe((self._offset + size) * 8):
+            size = stream.size // 8 - self._offset
+            if self.endian is MIDDLE_ENDIAN:
+                size -= size % 2
+            if size <= 0:
+                self._eof = True
+                return False
+        data = stream.readBytes(self._offset * 8, size)
+        self._offset += size
+        self._data = self._data[self._index:] + data
+        self._index = 0
+        return True
+
+    def _stop(self):
+        self._eof = True
+        self._data = ""
+        self._index = 0
+
+    def _fill(self, nbits):
+        endian = self.endian
+        while self._count < nbits:
+            data = self._data
+            index = self._index
+            if len(data) <= index:
+                if self._readBlock():
+                    continue
+                # End of data: add null bits
+                missing = nbits - self._count
+                if endian is not LITTLE_ENDIAN:
+                    self._bits <<= missing
+                self._count += missing
+                self._padding += missing
+                return
+            if endian is MIDDLE_ENDIAN:
+                value = ord(data[index+1]) << 8 | ord(data[index])
+                index += 2
+                size = 16
+            else:
+                value = ord(data[index])
+                index += 1
+                size = 8
+                if value == 0xFF and self.unstuff:
+                    if len(data) <= index:
+                        if not self._readBlock():
+                            self._stop()
+                        continue
+                    if data[index] != "\0":
+                        # Marker: end of entropy-coded data
+                        self._stop()
+                        continue
+                    index += 1
+                    self._stuffed.append(self._consumed + self._count + 8)
+            self._index = index
+            if endian is LITTLE_ENDIAN:
+                self._bits |= value << self._count
+            else:
+                self._bits = (self._bits << size) | value
+            self._count += size
+
+    def peek(self, nbits):
+        """
+        Get the value of the next nbits bits without moving the cursor.
+        """
+        if self._count < nbits:
+            self._fill(nbits)
+        if self.endian is LITTLE_ENDIAN:
+            return self._bits & ((1 << nbits) - 1)
+        else:
+            return self._bits >> (self._count - nbits)
+
+    def skip(self, nbits):
+        """
+        Move the cursor nbits bits forward.
+        """
+        if self._count < nbits:
+            self._fill(nbits)
+        if self._count - nbits < self._padding:
+            raise HuffmanError("Unexpected end of data at address %s"
+                % self.address)
+        self._count -= nbits
+        self._consumed += nbits
+        if self.endian is LITTLE_ENDIAN:
+            self._bits >>= nbits
+        else:
+            self._bits &= (1 << self._count) - 1
+
+    def read(self, nbits):
+        """
+        Read the value of the next nbits bits and move the cursor.
+        """
+        value = self.peek(nbits)
+        self.skip(nbits)
+        return value
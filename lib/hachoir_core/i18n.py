@@ -164,9 +164,66 @@ CHARSET_CHARACTERS = (
     (set(u"©®".encode("MacRoman")), "MacRoman"),
     (set(u"εδηιθκμοΡσςυΈί".encode("ISO-8859-7")), "ISO-8859-7"),
 )
+CHARSET_SET = dict( (charset, characters)
+    for characters, charset in CHARSET_CHARACTERS )
 
-def guessBytesCharset(bytes, default=None):
+# All ASCII bytes: used to delete them with str.translate()
+ASCII_BYTES = "".join( chr(code) for code in xrange(128) )
+
+# Cache of guessBytesCharset() results of non-ASCII strings:
+# (bytes, hint) => charset (or None). Only short strings are cached,
+# the cache is cleared when it is full
+CHARSET_CACHE_SIZE = 1024
+CHARSET_CACHE_MAX_LENGTH = 256
+_charset_cache = {}
+
+def _checkCharset(bytes, non_ascii, charset):
+    """
+    Check if bytes (non_ascii: bytes without ASCII characters) are valid
+    in the specified charset.
+    """
+    if charset == "UTF-8":
+        try:
+            unicode(bytes, 'UTF-8', 'strict')
+            return True
+        except UnicodeDecodeError:
+            return False
+    if charset in CHARSET_SET:
+        return CHARSET_SET[charset].issuperset(non_ascii)
+    return False
+
+def _guessBytesCharset(bytes, non_ascii, hint):
+    # Check for UTF BOM
+    for bom_bytes, charset in UTF_BOMS:
+        if bytes.startswith(bom_bytes):
+            return charset
+
+    # Valid UTF-8?
+    if _checkCharset(bytes, non_ascii, "UTF-8"):
+        return 'UTF-8'
+
+    # Compare the set of non-ASCII characters
+    non_ascii = set(non_ascii)
+    for characters, charset in CHARSET_CHARACTERS:
+        if characters.issuperset(non_ascii):
+            break
+    else:
+        return None
+
+    # Prefer the hint if it gives the same text (eg. ISO-8859-15
+    # instead of ISO-8859-1 for "\xE9")
+    if hint and hint != charset and hint in CHARSET_SET \
+    and CHARSET_SET[hint].issuperset(non_ascii) \
+    and unicode(bytes, hint) == unicode(bytes, charset):
+        return hint
+    return charset
+
+def guessBytesCharset(bytes, default=None, hint=None):
     r"""
+    Guess the charset of a byte string. If hint is set (eg. charset of
+    a previous string), it is preferred to the guessed charset if both
+    decode the string to the same text: the hint never changes the text.
+
     >>> guessBytesCharset("abc")
     'ASCII'
     >>> guessBytesCharset("\xEF\xBB\xBFabc")
@@ -177,36 +234,34 @@ def guessBytesCharset(bytes, default=None):
     'MacRoman'
     >>> guessBytesCharset("\xE9l\xE9phant")
     'ISO-8859-1'
+    >>> guessBytesCharset("\xE9l\xE9phant", hint="ISO-8859-15")
+    'ISO-8859-15'
+    >>> guessBytesCharset("caf\xE9", hint="ISO-8859-7")
+    'ISO-8859-1'
     >>> guessBytesCharset("100 \xA4")
     'ISO-8859-15'
     >>> guessBytesCharset('Word \xb8\xea\xe4\xef\xf3\xe7 - Microsoft Outlook 97 - \xd1\xf5\xe8\xec\xdf\xf3\xe5\xe9\xf2 e-mail')
     'ISO-8859-7'
     """
-    # Check for UTF BOM
-    for bom_bytes, charset in UTF_BOMS:
-        if bytes.startswith(bom_bytes):
-            return charset
-
     # Pure ASCII?
-    try:
-        text = unicode(bytes, 'ASCII', 'strict')
+    non_ascii = bytes.translate(None, ASCII_BYTES)
+    if not non_ascii:
         return 'ASCII'
-    except UnicodeDecodeError:
-        pass
-
-    # Valid UTF-8?
-    try:
-        text = unicode(bytes, 'UTF-8', 'strict')
-        return 'UTF-8'
-    except UnicodeDecodeError:
-        pass
 
-    # Create a set of non-ASCII characters
-    non_ascii_set = set( byte for byte in bytes if ord(byte) >= 128 )
-    for characters, charset in CHARSET_CHARACTERS:
-        if characters.issuperset(non_ascii_set):
-            return charset
-    return default
+    if len(bytes) <= CHARSET_CACHE_MAX_LENGTH:
+        key = (bytes, hint)
+        try:
+            charset = _charset_cache[key]
+        except KeyError:
+            charset = _guessBytesCharset(bytes, non_ascii, hint)
+            if CHARSET_CACHE_SIZE <= len(_charset_cache):
+                _charset_cache.clear()
+            _charset_cache[key] = charset
+    else:
+        charset = _guessBytesCharset(bytes, non_ascii, hint)
+    if charset is None:
+        return default
+    return charset
 
 # Initialize _(), gettext() and ngettext() functions
 gettext, ngettext = _initGettext()
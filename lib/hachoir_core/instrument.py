@@ -0,0 +1,125 @@
+"""
+Instrumentation: counters and timings of the hot paths of Hachoir.
+
+When instrumentation is disabled (default), hooks only cost a test of
+instrument.enabled, and streams and field sets created are not wrapped.
+Counters (dictionaries key => value):
+- "fields": fields created per class ;
+- "read_calls", "read_bytes": InputStream.read() calls and bytes read
+  per stream class ;
+- "search_bytes": bytes scanned by InputStream.searchBytes() per stream
+  class ;
+- "autofix": autofix events per parser class ;
+- "validate", "validate_failed": validate attempts of each parser in
+  QueryParser.doparse().
+
+Timings: wall time spent in the createFields() generator of each field set
+class, including the time spent to create sub-field sets.
+
+Example:
+
+    parser, snapshot = collectStats(createParser, filename)
+    print snapshot["counters"]["fields"]
+"""
+
+from time import time
+
+try:
+    import json
+except ImportError:
+    json = None
+
+class Instrumentation(object):
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.timings = {}
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def count(self, name, key, value=1):
+        """
+        Add value to the counter key of the counter group name
+        """
+        try:
+            counter = self.counters[name]
+        except KeyError:
+            counter = self.counters[name] = {}
+        counter[key] = counter.get(key, 0) + value
+
+    def addTime(self, key, duration):
+        try:
+            timing = self.timings[key]
+        except KeyError:
+            self.timings[key] = [1, duration, duration]
+            return
+        timing[0] += 1
+        timing[1] += duration
+        if timing[2] < duration:
+            timing[2] = duration
+
+    def snapshot(self):
+        """
+        Copy of the counters and the timings as a dictionary:
+        {"counters": {name: {key: value}},
+         "timings": {key: {"calls": int, "total": float, "max": float}}}
+        """
+        counters = dict((name, dict(counter))
+            for name, counter in self.counters.iteritems())
+        timings = dict((key, {"calls": calls, "total": total, "max": max})
+            for key, (calls, total, max) in self.timings.iteritems())
+        return {"counters": counters, "timings": timings}
+
+    def toJSON(self, **kw):
+        if json is None:
+            raise ImportError("json module is missing")
+        kw.setdefault("sort_keys", True)
+        return json.dumps(self.snapshot(), **kw)
+
+    def countRead(self, stream):
+        """
+        Wrap the read() method of a stream to count calls and bytes read.
+        """
+        read = stream.read
+        key = stream.__class__.__name__
+        def countedRead(address, size):
+            if self.enabled:
+                self.count("read_calls", key)
+                self.count("read_bytes", key, size // 8)
+            return read(address, size)
+        stream.read = countedRead
+
+    def timeGenerator(self, generator, key):
+        """
+        Wrap a field generator to measure the time spent in next() calls.
+        """
+        while True:
+            start = time()
+            try:
+                field = generator.next()
+            finally:
+                if self.enabled:
+                    self.addTime(key, time() - start)
+            yield field
+
+instrument = Instrumentation()
+
+def collectStats(func, *args, **kw):
+    """
+    Call func(*args, **kw) with a fresh instrumentation enabled.
+    Returns (result, snapshot).
+    """
+    instrument.reset()
+    instrument.enable()
+    try:
+        result = func(*args, **kw)
+    finally:
+        instrument.disable()
+    return result, instrument.snapshot()
@@ -1,6 +1,19 @@
 import os, sys, time
 import hachoir_core.config as config
 from hachoir_core.i18n import _
+from hachoir_core.tools import makeUnicode
+from collections import deque
+
+# Maximum number of messages kept per level when use_buffer is set
+BUFFER_SIZE = 1000
+
+# Maximum number of messages with the same template emitted by a context
+# (a parser and its fields), next ones are counted and dropped
+MAX_REPEAT = 50
+
+# Maximum number of distinct templates counted per context: next templates
+# share the same counter
+MAX_TEMPLATES = 500
 
 class Log:
     LOG_INFO   = 0
@@ -16,10 +29,61 @@ class Log:
     def __init__(self):
         self.__buffer = {}
         self.__file = None
+        self.__counters = {}
         self.use_print = True
         self.use_buffer = False
+        self.buffer_size = BUFFER_SIZE
+        self.max_repeat = MAX_REPEAT
+        self.dropped = 0
         self.on_new_message = None # Prototype: def func(level, prefix, text, context)
 
+    def getBuffer(self, level):
+        """
+        Get the last messages of a level stored in the buffer
+        (see use_buffer), oldest first.
+        """
+        return list(self.__buffer.get(level, ()))
+
+    def clearBuffer(self):
+        self.__buffer.clear()
+
+    def resetLimits(self):
+        """
+        Forget the messages counted by the rate limit of messages written
+        without context. guessParser() calls it before each parsing, so
+        these messages are limited per file. log.dropped is not reset.
+        """
+        self.__counters.clear()
+
+    def _countMessage(self, level, text, ctxt):
+        """
+        Count a message for the rate limit: returns (drop, last) where drop
+        is True if the message has to be dropped, and last is True if it
+        is the last emitted message of its template.
+        """
+        if ctxt is None:
+            counters = self.__counters
+        else:
+            if hasattr(ctxt, "_logContext"):
+                ctxt = ctxt._logContext()
+            try:
+                counters = ctxt._log_counters
+            except AttributeError:
+                counters = {}
+                try:
+                    ctxt._log_counters = counters
+                except AttributeError:
+                    counters = self.__counters
+        key = (level, text)
+        if key not in counters and MAX_TEMPLATES <= len(counters):
+            key = level
+        count = counters.get(key, 0) + 1
+        counters[key] = count
+        if self.max_repeat < count:
+            self.dropped += 1
+            return True, False
+        return False, count == self.max_repeat
+
     def shutdown(self):
         if self.__file:
             self._writeIntoFile(_("Stop Hachoir"))
@@ -58,22 +122,42 @@ class Log:
         self.__file.write(u"%s - %s\n" % (timestamp, message))
         self.__file.flush()
 
-    def newMessage(self, level, text, ctxt=None):
+    def newMessage(self, level, text, ctxt=None, args=None):
         """
         Write a new message : append it in the buffer,
         display it to the screen (if needed), and write
         it in the log file (if needed).
 
+        The message is only formatted (text % args, context
+        prefix) if it is emitted: a context emits at most
+        max_repeat messages with the same text template.
+
         @param level: Message level.
         @type level: C{int}
-        @param text: Message content.
+        @param text: Message content, or template if args is set.
         @type text: C{str}
         @param ctxt: The caller instance.
+        @param args: Arguments of the template (tuple or single value).
         """
 
         if level < self.LOG_ERROR and config.quiet or \
            level <= self.LOG_INFO and not config.verbose:
             return
+        last = False
+        if self.max_repeat:
+            drop, last = self._countMessage(level, text, ctxt)
+            if drop:
+                return
+        if args is not None:
+            # Compute lazy values first: a unicode value gives an unicode
+            # message, as with an eager formatting
+            if isinstance(args, tuple):
+                args = tuple(getLazyValue(arg) for arg in args)
+            else:
+                args = getLazyValue(args)
+            text = text % args
+        if last:
+            text += " " + _("(next similar messages are ignored)")
         if config.debug:
             from hachoir_core.error import getBacktrace
             backtrace = getBacktrace(None)
@@ -89,7 +173,7 @@ class Log:
         # Add message to log buffer
         if self.use_buffer:
             if not self.__buffer.has_key(level):
-                self.__buffer[level] = [text]
+                self.__buffer[level] = deque([text], self.buffer_size)
             else:
                 self.__buffer[level].append(text)
 
@@ -110,35 +194,70 @@ class Log:
         if self.on_new_message:
             self.on_new_message (level, prefix, _text, ctxt)
 
-    def info(self, text):
+    def info(self, text, *args):
         """
         New informative message.
         @type text: C{str}
         """
-        self.newMessage(Log.LOG_INFO, text)
+        self.newMessage(Log.LOG_INFO, text, None, args or None)
 
-    def warning(self, text):
+    def warning(self, text, *args):
         """
         New warning message.
         @type text: C{str}
         """
-        self.newMessage(Log.LOG_WARN, text)
+        self.newMessage(Log.LOG_WARN, text, None, args or None)
 
-    def error(self, text):
+    def error(self, text, *args):
         """
         New error message.
         @type text: C{str}
         """
-        self.newMessage(Log.LOG_ERROR, text)
+        self.newMessage(Log.LOG_ERROR, text, None, args or None)
 
 log = Log()
 
+class LazyValue(object):
+    """
+    Message argument only computed if the message is formatted, eg.
+    self.warning("Delete %s", LazyValue(getattr, field, "path"))
+    """
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def get(self):
+        return self.func(*self.args)
+
+    def __str__(self):
+        value = self.get()
+        if isinstance(value, unicode):
+            return value.encode("ASCII", "backslashreplace")
+        return str(value)
+
+    def __unicode__(self):
+        return makeUnicode(self.get())
+
+def getLazyValue(value):
+    if isinstance(value, LazyValue):
+        return value.get()
+    return value
+
 class Logger(object):
+    """
+    Messages can be formatted lazily: self.warning("Invalid size: %s", size)
+    only formats the text if the message is emitted.
+    """
     def _logger(self):
         return "<%s>" % self.__class__.__name__
-    def info(self, text):
-        log.newMessage(Log.LOG_INFO, text, self)
-    def warning(self, text):
-        log.newMessage(Log.LOG_WARN, text, self)
-    def error(self, text):
-        log.newMessage(Log.LOG_ERROR, text, self)
+    def _logContext(self):
+        """
+        Object sharing the rate limit counters of this logger.
+        """
+        return self
+    def info(self, text, *args):
+        log.newMessage(Log.LOG_INFO, text, self, args or None)
+    def warning(self, text, *args):
+        log.newMessage(Log.LOG_WARN, text, self, args or None)
+    def error(self, text, *args):
+        log.newMessage(Log.LOG_ERROR, text, self, args or None)
@@ -1,31 +1,299 @@
-from hotshot import Profile
-from hotshot.stats import load as loadStats
-from os import unlink
+"""
+Profiling tools:
+- runProfiler(): profile a function call with cProfile ;
+- StackSampler: low-overhead statistical profiler (SIGPROF stack sampling)
+  which aggregates samples by parser class and field class, and writes
+  collapsed stacks (input format of flamegraph.pl) ;
+- profileDirectory(): parse all files of a directory under a profiler.
+"""
 
-def runProfiler(func, args=tuple(), kw={}, verbose=True, nb_func=25, sort_by=('cumulative', 'calls')):
-    profile_filename = "/tmp/profiler"
-    prof = Profile(profile_filename)
+import os
+import sys
+from time import time
+from tempfile import mkstemp
+
+try:
+    from cProfile import Profile
+except ImportError:
+    from profile import Profile
+from pstats import Stats
+from hachoir_core.error import HachoirError
+
+try:
+    import signal
+    if not hasattr(signal, "setitimer"):
+        signal = None
+except ImportError:
+    signal = None
+
+# Sampling interval in seconds of StackSampler
+SAMPLE_INTERVAL = 0.001
+
+# Maximum number of frames of a sampled stack
+MAX_STACK_DEPTH = 200
+
+class ProfilerError(HachoirError):
+    pass
+
+def runProfiler(func, args=tuple(), kw={}, verbose=True, nb_func=25,
+sort_by=('cumulative', 'calls'), filename=None, call_tree=False):
+    """
+    Call func(*args, **kw) with cProfile and display the statistics of the
+    nb_func first functions. Returns the result of func.
+
+    If filename is set, write the raw statistics into this file
+    (see the pstats module). If call_tree is True, also display the
+    functions called by each function.
+    """
+    prof = Profile()
     try:
         if verbose:
             print "[+] Run profiler"
-        result = prof.runcall(func, *args, **kw)
-        prof.close()
+        return prof.runcall(func, *args, **kw)
+    finally:
         if verbose:
             print "[+] Stop profiler"
             print "[+] Process data..."
-        stat = loadStats(profile_filename)
-        if verbose:
-            print "[+] Strip..."
+        if filename:
+            prof.dump_stats(filename)
+        stat = Stats(prof)
         stat.strip_dirs()
-        if verbose:
-            print "[+] Sort data..."
         stat.sort_stats(*sort_by)
         if verbose:
             print
             print "[+] Display statistics"
             print
         stat.print_stats(nb_func)
-        return result
-    finally:
-        unlink(profile_filename)
+        if call_tree:
+            stat.print_callees(nb_func)
+
+def createTempFile(prefix="hachoir-profile-", suffix=".txt"):
+    """
+    Create a new temporary file which can not be replaced by another user.
+    Returns (file object, filename).
+    """
+    fd, filename = mkstemp(suffix=suffix, prefix=prefix)
+    return os.fdopen(fd, "w"), filename
+
+class StackSampler(object):
+    """
+    Statistical profiler: every interval seconds of CPU time, SIGPROF
+    interrupts the program and the current stack is recorded. Only works
+    in the main thread of Unix systems.
+
+    A frame of a method of a field is named "Class.method" using the class
+    of the field. Samples are also counted by parser class (root of the
+    outermost field of the stack) and by field class (innermost field of
+    the stack).
+
+    Example:
+
+        sampler = StackSampler()
+        sampler.start()
+        ...
+        sampler.stop()
+        sampler.writeCollapsed(open("stacks.txt", "w"))
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        if signal is None:
+            raise ProfilerError("Stack sampling requires signal.setitimer() (Unix)")
+        from hachoir_core.field import Field
+        self.field_class = Field
+        self.interval = interval
+        self.stacks = {}
+        self.by_parser = {}
+        self.by_field = {}
+        self.samples = 0
+        self._old_handler = None
+        self._labels = {}
+
+    def start(self):
+        try:
+            self._old_handler = signal.signal(signal.SIGPROF, self._sample)
+        except ValueError, err:
+            # signal.signal() only works in the main thread
+            raise ProfilerError("Unable to start stack sampling: %s" % err)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._old_handler or signal.SIG_DFL)
+        self._old_handler = None
+
+    def run(self, func, *args, **kw):
+        self.start()
+        try:
+            return func(*args, **kw)
+        finally:
+            self.stop()
+
+    def _label(self, code, obj):
+        key = (code, obj.__class__)
+        try:
+            return self._labels[key]
+        except KeyError:
+            if obj is None:
+                label = "%s (%s:%s)" % (code.co_name,
+                    os.path.basename(code.co_filename), code.co_firstlineno)
+            else:
+                label = "%s.%s" % (obj.__class__.__name__, code.co_name)
+            self._labels[key] = label
+            return label
+
+    def _sample(self, signum, frame):
+        field_class = self.field_class
+        field = None
+        outer = None
+        names = []
+        while frame is not None and len(names) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            if code.co_varnames and code.co_varnames[0] == "self":
+                obj = frame.f_locals.get("self")
+                if not isinstance(obj, field_class):
+                    obj = None
+            else:
+                obj = None
+            if obj is not None:
+                if field is None:
+                    field = obj.__class__
+                outer = obj
+            names.append(self._label(code, obj))
+            frame = frame.f_back
+        names.reverse()
+        stack = ";".join(names)
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+        if outer is not None:
+            # Fields of a parser are iterated outside the parser frames:
+            # use the root of the field
+            key = outer.root.__class__.__name__
+            self.by_parser[key] = self.by_parser.get(key, 0) + 1
+        if field is not None:
+            key = field.__name__
+            self.by_field[key] = self.by_field.get(key, 0) + 1
+        self.samples += 1
+
+    def writeCollapsed(self, out):
+        """
+        Write the stacks in the collapsed format: "frame;frame;... count"
+        """
+        for stack, count in sorted(self.stacks.iteritems()):
+            out.write("%s %s\n" % (stack.replace(" ", "_"), count))
+
+    def printSummary(self, out=sys.stdout, count=15):
+        print >>out, "Samples: %s (interval: %s ms)" % (
+            self.samples, self.interval * 1000)
+        for title, values in (("Parser", self.by_parser), ("Field", self.by_field)):
+            print >>out
+            print >>out, "%s class: samples" % title
+            values = sorted(values.iteritems(), key=lambda item: -item[1])
+            for key, value in values[:count]:
+                print >>out, "  %s: %s" % (key, value)
+
+def parseFile(filename):
+    """
+    Parse a file: create its parser and all its fields with their value.
+    Returns (parser class, number of fields), or (None, 0) if no parser
+    was found.
+    """
+    from hachoir_parser import createParser
+    from hachoir_core.error import HACHOIR_ERRORS
+    if isinstance(filename, unicode):
+        name = filename
+    else:
+        name = unicode(filename, sys.getfilesystemencoding() or "ascii", "replace")
+    parser = createParser(name, real_filename=filename)
+    if parser is None:
+        return None, 0
+    count = 0
+    todo = [parser]
+    while todo:
+        fieldset = todo.pop()
+        try:
+            for field in fieldset:
+                count += 1
+                if field.is_field_set:
+                    todo.append(field)
+                elif field.hasValue():
+                    field.value
+        except HACHOIR_ERRORS:
+            pass
+    input = getattr(parser.stream, "_input", None)
+    if hasattr(input, "close"):
+        input.close()
+    return parser.__class__, count
+
+def profileDirectory(directory, sampling=False, interval=SAMPLE_INTERVAL,
+out=sys.stdout, nb_func=25, sort_by=('cumulative', 'calls')):
+    """
+    Parse all files of a directory (recursively) under the cProfile profiler,
+    or under a StackSampler if sampling is True, and display the statistics
+    and the slowest files. Parsing time is also summed by parser class.
+    Sampling only works on Unix, in the main thread: it raises a
+    ProfilerError otherwise.
+
+    An exception raised when parsing a file (eg. a bug of a parser) is
+    displayed and the next file is parsed.
+
+    Returns the filename of the statistics file: raw cProfile statistics,
+    or collapsed stacks when sampling. The file is created in the temporary
+    directory.
+    """
+    filenames = []
+    for dirpath, dirnames, files in os.walk(directory):
+        dirnames.sort()
+        for name in sorted(files):
+            filenames.append(os.path.join(dirpath, name))
+
+    durations = []
+    by_parser = {}
+    def parseAll():
+        for filename in filenames:
+            start = time()
+            try:
+                parser_class, count = parseFile(filename)
+            except Exception, err:
+                print >>out, "Unable to parse %s: %s: %s" % (
+                    filename, err.__class__.__name__, err)
+                continue
+            duration = time() - start
+            durations.append((duration, filename))
+            if parser_class is not None:
+                key = parser_class.__name__
+            else:
+                key = "(no parser)"
+            total, files = by_parser.get(key, (0.0, 0))
+            by_parser[key] = (total + duration, files + 1)
+
+    if sampling:
+        sampler = StackSampler(interval)
+        sampler.run(parseAll)
+        sampler.printSummary(out)
+        output, filename = createTempFile(suffix=".collapsed")
+        try:
+            sampler.writeCollapsed(output)
+        finally:
+            output.close()
+    else:
+        prof = Profile()
+        prof.runcall(parseAll)
+        output, filename = createTempFile(suffix=".prof")
+        output.close()
+        prof.dump_stats(filename)
+        stat = Stats(prof, stream=out)
+        stat.strip_dirs()
+        stat.sort_stats(*sort_by)
+        stat.print_stats(nb_func)
 
+    print >>out
+    print >>out, "Slowest files (%s files):" % len(durations)
+    durations.sort(reverse=True)
+    for duration, name in durations[:10]:
+        print >>out, "  %.3f sec: %s" % (duration, name)
+    print >>out
+    print >>out, "Time by parser class:"
+    values = sorted(by_parser.iteritems(), key=lambda item: -item[1][0])
+    for key, (duration, files) in values:
+        print >>out, "  %s: %.3f sec (%s files)" % (key, duration, files)
+    print >>out
+    print >>out, "Statistics written into %s" % filename
+    return filename
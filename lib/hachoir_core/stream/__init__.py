@@ -1,9 +1,9 @@
 from hachoir_core.endian import BIG_ENDIAN, LITTLE_ENDIAN
 from hachoir_core.stream.stream import StreamError
 from hachoir_core.stream.input import (
-        InputStreamError,
+        InputStreamError, MissingDataError,
         InputStream, InputIOStream, StringInputStream,
-        InputSubStream, InputFieldStream,
+        InputSubStream, InputFieldStream, InputFeedStream,
         FragmentedStream, ConcatStream)
 from hachoir_core.stream.input_helper import FileInputStream, guessStreamCharset
 from hachoir_core.stream.output import (OutputStreamError,
@@ -1,6 +1,7 @@
 from hachoir_core.endian import BIG_ENDIAN, LITTLE_ENDIAN, MIDDLE_ENDIAN
 from hachoir_core.error import info
 from hachoir_core.log import Logger
+from hachoir_core.instrument import instrument
 from hachoir_core.bits import str2long
 from hachoir_core.i18n import getTerminalCharset
 from hachoir_core.tools import lowerBound
@@ -30,6 +31,17 @@ class NullStreamError(InputStreamError):
         msg = _("Input size is nul (source='%s')!") % self.source
         InputStreamError.__init__(self, msg)
 
+class MissingDataError(Exception):
+    """
+    Data are not available yet in an L{InputFeedStream}: feed more data and
+    parse again. This exception is not a L{HachoirError} on purpose: field
+    sets must not try to fix it (they would truncate the parsed data).
+    """
+    def __init__(self, address):
+        self.address = address
+        Exception.__init__(self,
+            "Data at address %u are not available yet" % address)
+
 class FileFromInputStream:
     _offset = 0
     _from_end = False
@@ -125,10 +137,12 @@ class InputStream(Logger):
     def __init__(self, source=None, size=None, packets=None, **args):
         self.source = source
         self._size = size   # in bits
-        if size == 0:
+        if size == 0 and not args.get("allow_empty", False):
             raise NullStreamError(source)
         self.tags = tuple(args.get("tags", tuple()))
         self.packets = packets
+        if instrument.enabled:
+            instrument.countRead(self)
 
     def askSize(self, client):
         if self._size != self._current_size:
@@ -243,6 +257,8 @@ class InputStream(Logger):
                         return None
                     size = todo
             data = self.readBytes(start_address, size)
+            if instrument.enabled:
+                instrument.count("search_bytes", self.__class__.__name__, size)
             if end_address is None and self._size:
                 end_address = self._size
                 size = (end_address - start_address) >> 3
@@ -435,6 +451,39 @@ class StringInputStream(InputStream):
         return shift, data, False
 
 
+class InputFeedStream(InputStream):
+    """
+    Input stream filled by the caller with feed(), eg. data of an upload
+    which is still being received. Reading data which are not available
+    yet raises L{MissingDataError}. Call close() when all data are fed:
+    the stream size is known and reads behave as for other streams.
+    """
+    def __init__(self, source="<feed>", **args):
+        self._data = bytearray()
+        InputStream.__init__(self, source=source, **args)
+
+    _current_size = property(lambda self: len(self._data) * 8)
+    closed = property(lambda self: self._size is not None)
+
+    def feed(self, data):
+        if self._size is not None:
+            raise InputStreamError(_("Unable to feed a closed stream"))
+        self._data.extend(data)
+
+    def close(self):
+        if self._size is None:
+            self._setSize()
+
+    def read(self, address, size):
+        byte_address, shift = divmod(address, 8)
+        nbytes = (size + shift + 7) >> 3
+        end = byte_address + nbytes
+        if len(self._data) < end and self._size is None:
+            raise MissingDataError(address + size)
+        data = str(self._data[byte_address:end])
+        missing = len(data) != nbytes
+        return shift, data, missing
+
 class InputSubStream(InputStream):
     def __init__(self, stream, offset, size=None, source=None, **args):
         if offset is None:
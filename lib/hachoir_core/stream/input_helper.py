@@ -31,8 +31,8 @@ def FileInputStream(filename, real_filename=None, **args):
         args.setdefault("tags",[]).append(("filename", filename))
         return InputIOStream(inputio, source=source, **args)
 
-def guessStreamCharset(stream, address, size, default=None):
+def guessStreamCharset(stream, address, size, default=None, hint=None):
     size = min(size, 1024*8)
     bytes = stream.readBytes(address, size//8)
-    return guessBytesCharset(bytes, default)
+    return guessBytesCharset(bytes, default, hint)
 
@@ -9,6 +9,7 @@ import re
 import stat
 from datetime import datetime, timedelta, MAXYEAR
 from warnings import warn
+from array import array
 
 def deprecated(comment=None):
     """
@@ -448,6 +449,27 @@ def createDict(data, index):
     """
     return dict( (key,values[index]) for key, values in data.iteritems() )
 
+# Array type code used to store file offsets: 'L' is 32-bit on Windows
+if array('L').itemsize >= 8:
+    OFFSET_TYPECODE = 'L'
+else:
+    OFFSET_TYPECODE = 'd'
+
+def createOffsetArray(values=()):
+    """
+    Create a compact array able to store file offsets (in bytes or in bits)
+    of files bigger than 4 GB. Use it to index large files without creating
+    one Python object per entry.
+
+    >>> offsets = createOffsetArray((0, 512, 1024))
+    >>> int(offsets[1])
+    512
+    >>> offsets.append(2**40)
+    >>> int(offsets[-1]) == 2**40
+    True
+    """
+    return array(OFFSET_TYPECODE, values)
+
 # Start of UNIX timestamp (Epoch): 1st January 1970 at 00:00
 UNIX_TIMESTAMP_T0 = datetime(1970, 1, 1)
 
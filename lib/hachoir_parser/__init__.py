@@ -2,6 +2,8 @@ from hachoir_parser.version import __version__
 from hachoir_parser.parser import ValidateError, HachoirParser, Parser
 from hachoir_parser.parser_list import ParserList, HachoirParserList
 from hachoir_parser.guess import (QueryParser, guessParser, createParser)
+from hachoir_parser.incremental import IncrementalParser
+from hachoir_parser.cache import ParserCache
 from hachoir_parser import (archive, audio, container,
     file_system, image, game, misc, network, program, video)
 
@@ -211,7 +211,7 @@ class Block(FieldSet):
                 else:
                     self.desc_func = desc
         else:
-            self.warning("Processing as unknown block block of type %u" % type)
+            self.warning("Processing as unknown block block of type %u", type)
         if not self.parseFlags:
             self.parseFlags = parseFlags
         if not self.parseHeader:
@@ -12,7 +12,9 @@ from hachoir_core.field import (Field, FieldSet, GenericVector,
     UInt32, Enum, CompressedField)
 from hachoir_core.endian import BIG_ENDIAN
 from hachoir_core.text_handler import textHandler, hexadecimal
-from hachoir_parser.archive.zlib import build_tree, HuffmanCode
+from hachoir_parser.archive.zlib import build_tree, HuffmanCode, HuffmanData
+from hachoir_core.huffman import BitCursor
+from hachoir_core import config
 
 try:
     from bz2 import BZ2Decompressor
@@ -130,6 +132,10 @@ class Bzip2Block(FieldSet):
             field = Bzip2Lengths(self, "huffman_lengths[]", len(symbols_used)+2)
             yield field
             trees.append(field.tree)
+        if not config.detailed_huffman:
+            size, count = self.decodeSymbols(trees, len(symbols_used)+1)
+            yield HuffmanData(self, "huffman_data", size, "Huffman coded symbols (%u symbols)" % count)
+            return
         counter = 0
         rle_run = 0
         selector_tree = None
@@ -158,6 +164,25 @@ class Bzip2Block(FieldSet):
                 break
             counter += 1
 
+    def decodeSymbols(self, trees, terminator):
+        """
+        Decode the Huffman coded symbols up to the block terminator without
+        creating fields. Returns (size in bits, number of symbols).
+        """
+        address = self.absolute_address + self.current_size
+        cursor = BitCursor(self.stream, address, self.endian)
+        tables = [tree.getTable(self.endian) for tree in trees]
+        count = 0
+        for selector in self["selectors_list"].array("selector_list"):
+            # Huffman table switched every 50 symbols
+            symbols = tables[selector.realvalue].decodeRun(cursor, 50, terminator)
+            count += len(symbols)
+            if symbols[-1] == terminator:
+                break
+        else:
+            raise ParserError("Missing block terminator")
+        return cursor.address - address, count
+
 class Bzip2Stream(FieldSet):
     START_BLOCK = 0x314159265359 # pi
     END_STREAM = 0x177245385090 # sqrt(pi)
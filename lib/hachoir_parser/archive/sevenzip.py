@@ -86,9 +86,9 @@ def waitForID(s, wait_id, wait_name="waited_id[]"):
         uid = s.stream.readBits(addr, 8, LITTLE_ENDIAN)
         if uid == wait_id:
             yield Enum(UInt8(s, wait_name), ID_INFO)
-            s.info("Found ID %s (%u)" % (ID_INFO[uid], uid))
+            s.info("Found ID %s (%u)", ID_INFO[uid], uid)
             return
-        s.info("Skipping ID %u!=%u" % (uid, wait_id))
+        s.info("Skipping ID %u!=%u", uid, wait_id)
         yield SkippedData(s, "skipped_id[]", "%u != %u" % (uid, wait_id))
 
 class HashDigest(FieldSet):
@@ -152,23 +152,23 @@ class CoderID(FieldSet):
         byte = UInt8(self, "id_size")
         yield byte
         byte = byte.value
-        self.info("ID=%u" % byte)
+        self.info("ID=%u", byte)
         size = byte & 0xF
         if size > 0:
             name = self.stream.readBytes(self.absolute_address+self.current_size, size)
             if name in self.CODECS:
                 name = self.CODECS[name]
-                self.info("Codec is %s" % name)
+                self.info("Codec is %s", name)
             else:
-                self.info("Undetermined codec %s" % name)
+                self.info("Undetermined codec %s", name)
                 name = "unknown"
             yield RawBytes(self, name, size)
             #yield textHandler(Bytes(self, "id", size), lambda: name)
         if byte & 0x10:
             yield SZUInt64(self, "num_stream_in")
             yield SZUInt64(self, "num_stream_out")
-            self.info("Streams: IN=%u    OUT=%u" % \
-                      (self["num_stream_in"].value, self["num_stream_out"].value))
+            self.info("Streams: IN=%u    OUT=%u",
+                      self["num_stream_in"].value, self["num_stream_out"].value)
         if byte & 0x20:
             size = SZUInt64(self, "properties_size[]")
             yield size
@@ -205,8 +205,8 @@ class BindPairInfo(FieldSet):
         # 64 bits values then cast to 32 in fact
         yield SZUInt64(self, "in_index")
         yield SZUInt64(self, "out_index")
-        self.info("Indexes: IN=%u   OUT=%u" % \
-                  (self["in_index"].value, self["out_index"].value))
+        self.info("Indexes: IN=%u   OUT=%u",
+                  self["in_index"].value, self["out_index"].value)
 
 class FolderItem(FieldSet):
     def __init__(self, parent, name, desc=None):
@@ -217,7 +217,7 @@ class FolderItem(FieldSet):
     def createFields(self):
         yield SZUInt64(self, "num_coders")
         num = self["num_coders"].value
-        self.info("Folder: %u codecs" % num)
+        self.info("Folder: %u codecs", num)
 
         # Coders info
         for index in xrange(num):
@@ -227,7 +227,7 @@ class FolderItem(FieldSet):
             self.out_streams += ci.out_streams
 
         # Bin pairs
-        self.info("out streams: %u" % self.out_streams)
+        self.info("out streams: %u", self.out_streams)
         for index in xrange(self.out_streams-1):
             yield BindPairInfo(self, "bind_pair[]")
 
@@ -251,7 +251,7 @@ class UnpackInfo(FieldSet):
 
         # Get generic info
         num = self["num_folders"].value
-        self.info("%u folders" % num)
+        self.info("%u folders", num)
         yield UInt8(self, "is_external")
 
         # Read folder items
@@ -300,7 +300,7 @@ class EncodedHeader(FieldSet):
             elif uid == ID_SUBSTREAMS_INFO:
                 yield SubStreamInfo(self, "substreams_info", ID_INFO[ID_SUBSTREAMS_INFO])
             else:
-                self.info("Unexpected ID (%i)" % uid)
+                self.info("Unexpected ID (%i)", uid)
                 break
 
 class IDHeader(FieldSet):
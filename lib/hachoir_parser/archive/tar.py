@@ -5,12 +5,71 @@ Author: Victor Stinner
 """
 
 from hachoir_parser import Parser
-from hachoir_core.field import (FieldSet,
+from hachoir_core.field import (FieldSet, ParserError,
     Enum, UInt8, SubFile, String, NullBytes)
-from hachoir_core.tools import humanFilesize, paddingSize, timestampUNIX
+from hachoir_core.tools import (humanFilesize, paddingSize, alignValue,
+    timestampUNIX, createOffsetArray)
 from hachoir_core.endian import BIG_ENDIAN
+from hachoir_core.stream import InputSubStream, StringInputStream
+from struct import Struct
+from array import array
 import re
 
+# ustar header: name, mode, uid, gid, size, mtime, check_sum, type, lname,
+# magic, version, uname, gname, devmajor, devminor, prefix
+TAR_HEADER = Struct("100s8s8s8s12s12s8sc100s6s2s32s32s8s8s155s12x")
+
+# Types of member which have no data, even if their size is not zero
+TAR_NO_DATA = "123456"
+
+# Types of regular file members: old format, normal and contiguous file
+TAR_FILE_TYPES = ("\0", "0", "7")
+
+def tarNumber(text):
+    """
+    Decode a number of a tar header: octal string or GNU base-256 number
+    (first byte has its highest bit set). Returns 0 for invalid number.
+
+    >>> tarNumber("0000644 \\0")
+    420
+    >>> tarNumber("\\x80\\0\\0\\0\\0\\0\\0\\x01\\0\\0\\0\\0") == 2**32
+    True
+    """
+    if text and ord(text[0]) & 0x80:
+        value = ord(text[0]) & 0x3F
+        for byte in text[1:]:
+            value = (value << 8) + ord(byte)
+        return value
+    text = text.strip(" \0")
+    try:
+        return int(text, 8)
+    except ValueError:
+        return 0
+
+def parsePaxHeader(data):
+    """
+    Parse pax extended header records: "length keyword=value\\n".
+    Returns a dictionary keyword => value (value is an UTF-8 string).
+    """
+    values = {}
+    pos = 0
+    while pos < len(data):
+        space = data.find(" ", pos)
+        if space < 0:
+            break
+        try:
+            length = int(data[pos:space])
+        except ValueError:
+            break
+        if length <= 0:
+            break
+        record = data[space+1:pos+length-1]
+        key, sep, value = record.partition("=")
+        if sep:
+            values[key] = value
+        pos += length
+    return values
+
 class FileEntry(FieldSet):
     type_name = {
         # 48 is "0", 49 is "1", ...
@@ -96,6 +155,11 @@ class TarFile(Parser):
     }
     _sign = re.compile("ustar *\0|[ \0]*$")
 
+    def __init__(self, stream, **args):
+        self._member_index = None
+        self._end_offset = None
+        Parser.__init__(self, stream, **args)
+
     def validate(self):
         if not self._sign.match(self.stream.readBytes(257*8, 8)):
             return "Invalid magic number"
@@ -119,6 +183,144 @@ class TarFile(Parser):
         if self.current_size < self._size:
             yield self.seekBit(self._size, "end")
 
+    def iterMembers(self):
+        """
+        Scan the archive without creating any field: decode each header
+        with a precompiled structure and jump over data blocks. Handle GNU
+        long names (type L) and pax extended headers (type x). GNU long
+        link names (type K) and global pax headers (type g) are skipped.
+
+        Generate tuples (name, header_offset, data_offset, size, type)
+        where offsets and size are in bytes and type is the type character.
+        """
+        size = self.stream.size
+        if size is not None:
+            size //= 8
+        read = self.stream.readBytes
+        offset = 0
+        long_name = None
+        pax = {}
+        while size is None or offset + 512 <= size:
+            header = read(offset*8, 512)
+            if header[0] == "\0":
+                # Terminator: empty header
+                self._end_offset = offset + 512
+                return
+            (name, mode, uid, gid, filesize, mtime, check_sum, type, lname,
+             magic, version, uname, gname, devmajor, devminor, prefix) = \
+                TAR_HEADER.unpack(header)
+            if not check_sum.strip(" \0"):
+                self.warning("Invalid tar header at offset %u", offset)
+                break
+            filesize = tarNumber(filesize)
+            data_offset = offset + 512
+            next_offset = data_offset + alignValue(filesize, 512)
+            if type == "L":
+                data = read(data_offset*8, filesize).rstrip("\0")
+                long_name = unicode(data, "ISO-8859-1")
+            elif type == "x":
+                pax = parsePaxHeader(read(data_offset*8, filesize))
+            elif type not in "Kg":
+                if long_name is not None:
+                    name = long_name
+                elif "path" in pax:
+                    name = unicode(pax["path"], "UTF-8", "replace")
+                else:
+                    name = name.rstrip("\0")
+                    if magic == "ustar\0":
+                        prefix = prefix.rstrip("\0")
+                        if prefix:
+                            name = prefix + "/" + name
+                    name = unicode(name, "ISO-8859-1")
+                if "size" in pax:
+                    try:
+                        filesize = int(pax["size"])
+                        next_offset = data_offset + alignValue(filesize, 512)
+                    except ValueError:
+                        self.warning("Invalid pax size of %s", name)
+                if type in TAR_NO_DATA:
+                    next_offset = data_offset
+                yield name, offset, data_offset, filesize, type
+                long_name = None
+                pax = {}
+            offset = next_offset
+        self._end_offset = offset
+
+    def getMemberIndex(self):
+        """
+        Get the member index (L{TarIndex}), built at the first call.
+        """
+        if self._member_index is None:
+            index = TarIndex()
+            for member in self.iterMembers():
+                index.append(*member)
+            self._member_index = index
+        return self._member_index
+
+    def openMember(self, name):
+        """
+        Create an input stream of the content of a member without parsing
+        other members. Raise KeyError if the member doesn't exist and
+        ParserError if the member is not a regular file.
+        """
+        index = self.getMemberIndex()
+        name, header_offset, data_offset, size, type = index[index.find(name)]
+        if type not in TAR_FILE_TYPES or name.endswith("/"):
+            raise ParserError("Unable to open %s: not a regular file (type %r)"
+                % (name, type))
+        source = "%s:%s" % (self.stream.source, name)
+        if not size:
+            return StringInputStream("", source=source,
+                tags=[("filename", name)], allow_empty=True)
+        return InputSubStream(self.stream, data_offset*8, size*8,
+            source=source, tags=[("filename", name)])
+
     def createContentSize(self):
-        return self["terminator"].address + self["terminator"].size
+        if self._end_offset is None:
+            for member in self.iterMembers():
+                pass
+        return self._end_offset * 8
+
+class TarIndex(object):
+    """
+    Compact index of tar members: names, header and data offsets, sizes
+    (in bytes) and types.
+    """
+    def __init__(self):
+        self.names = []
+        self.header_offset = createOffsetArray()
+        self.data_offset = createOffsetArray()
+        self.size = createOffsetArray()
+        self.type = array('c')
+        self._positions = None
+
+    def append(self, name, header_offset, data_offset, size, type):
+        self.names.append(name)
+        self.header_offset.append(header_offset)
+        self.data_offset.append(data_offset)
+        self.size.append(size)
+        self.type.append(type)
+        self._positions = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        return (self.names[index], int(self.header_offset[index]),
+            int(self.data_offset[index]), int(self.size[index]), self.type[index])
+
+    def __iter__(self):
+        for index in xrange(len(self.names)):
+            yield self[index]
+
+    def find(self, name):
+        """
+        Get the index of the last member called 'name' (a member can be
+        stored more than once, the last one wins). Raise KeyError if the
+        member doesn't exist.
+        """
+        if self._positions is None:
+            self._positions = dict((name, index)
+                for index, name in enumerate(self.names))
+        return self._positions[name]
 
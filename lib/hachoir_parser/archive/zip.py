@@ -16,10 +16,15 @@ from hachoir_core.text_handler import textHandler, filesizeHandler, hexadecimal
 from hachoir_core.error import HACHOIR_ERRORS
 from hachoir_core.tools import makeUnicode
 from hachoir_core.endian import LITTLE_ENDIAN
-from hachoir_parser.common.deflate import Deflate
+from hachoir_core.stream import InputSubStream, StringInputStream
+from hachoir_parser.common.deflate import Deflate, DeflateInputStream
+from struct import unpack
 
 MAX_FILESIZE = 1000 * 1024 * 1024
 
+# Maximum size of the end of central directory record (with its comment)
+MAX_END_CENTRAL_DIR_SIZE = 22 + 0xFFFF
+
 COMPRESSION_DEFLATE = 8
 COMPRESSION_METHOD = {
      0: u"no compression",
@@ -371,6 +376,12 @@ class ZipFile(Parser):
         "description": "ZIP archive"
     }
 
+    def __init__(self, stream, **args):
+        self._end_central_dir = False
+        self._member_index = None
+        self._member_names = None
+        Parser.__init__(self, stream, **args)
+
     def validate(self):
         if self["header[0]"].value != FileEntry.HEADER:
             return "Invalid magic"
@@ -423,7 +434,147 @@ class ZipFile(Parser):
                 return "." + self.MIME_TYPES[mime]
         return ".zip"
 
+    def findEndCentralDirectory(self):
+        """
+        Locate the end of central directory record (and the ZIP64 one if
+        any) by reading backward from the end of the stream.
+
+        Returns a tuple (end_offset, directory_offset, directory_size,
+        nb_entries, shift) where offsets are in bytes and shift is the
+        number of bytes prepended to the archive (eg. self-extracting
+        archive), or None if the record can't be found.
+        """
+        if self._end_central_dir is not False:
+            return self._end_central_dir
+        self._end_central_dir = None
+        size = self.stream.size
+        if size is None:
+            return None
+        size //= 8
+        start = max(size - MAX_END_CENTRAL_DIR_SIZE, 0)
+        data = self.stream.readBytes(start*8, size - start)
+        pos = data.rfind("PK\5\6")
+        while 0 <= pos:
+            if pos + 22 <= len(data):
+                comment_length = unpack("<H", data[pos+20:pos+22])[0]
+                if pos + 22 + comment_length <= len(data):
+                    break
+            pos = data.rfind("PK\5\6", 0, pos)
+        else:
+            return None
+        end_offset = start + pos
+        nb_entries, dir_size, dir_offset = unpack("<HII", data[pos+10:pos+20])
+
+        # ZIP64 end of central directory locator
+        if 20 <= end_offset and self.stream.readBytes((end_offset-20)*8, 4) == "PK\6\7":
+            locator = self.stream.readBytes((end_offset-20)*8, 20)
+            end64_offset = unpack("<Q", locator[8:16])[0]
+            if end64_offset + 56 <= size:
+                end64 = self.stream.readBytes(end64_offset*8, 56)
+                if end64[:4] == "PK\6\6":
+                    nb_entries, dir_size, dir_offset = unpack("<QQQ", end64[32:56])
+                    self._end_central_dir = (end_offset, dir_offset, dir_size, nb_entries, 0)
+                    return self._end_central_dir
+
+        shift = end_offset - dir_size - dir_offset
+        if shift < 0:
+            return None
+        self._end_central_dir = (end_offset, dir_offset + shift, dir_size, nb_entries, shift)
+        return self._end_central_dir
+
+    def getMemberIndex(self):
+        """
+        Build the member index from the central directory, without parsing
+        the local file headers: dictionary name => (header_offset,
+        compressed_size, uncompressed_size, compression, flags),
+        header_offset is the address in bytes of the local file header and
+        flags are the general purpose bit flags.
+
+        Returns None if the central directory can't be found.
+        """
+        if self._member_index is not None:
+            return self._member_index
+        location = self.findEndCentralDirectory()
+        if location is None:
+            return None
+        end_offset, dir_offset, dir_size, nb_entries, shift = location
+        data = self.stream.readBytes(dir_offset*8, dir_size)
+        index = {}
+        names = []
+        pos = 0
+        while pos + 46 <= len(data) and data[pos:pos+4] == "PK\1\2":
+            (flags, compression, crc32, compressed_size, uncompressed_size,
+             filename_length, extra_length, comment_length, header_offset) = \
+                unpack("<HHxxxxIIIHHHxxxxxxxxI", data[pos+8:pos+46])
+            pos += 46
+            name = data[pos:pos+filename_length]
+            if flags & 0x800:
+                charset = "UTF-8"
+            else:
+                charset = "ISO-8859-15"
+            name = unicode(name, charset, "replace")
+            pos += filename_length
+            extra = data[pos:pos+extra_length]
+            pos += extra_length + comment_length
+            if 0xFFFFFFFF in (compressed_size, uncompressed_size, header_offset):
+                uncompressed_size, compressed_size, header_offset = \
+                    zip64Sizes(extra, uncompressed_size, compressed_size, header_offset)
+            index[name] = (header_offset + shift,
+                compressed_size, uncompressed_size, compression, flags)
+            names.append(name)
+        if len(names) != nb_entries:
+            self.warning("Central directory contains %u entries instead of %u",
+                len(names), nb_entries)
+        self._member_index = index
+        self._member_names = names
+        return index
+
+    def listMembers(self):
+        """
+        List of member names in central directory order.
+        """
+        if self.getMemberIndex() is None:
+            return []
+        return self._member_names
+
+    def openMember(self, name):
+        """
+        Create an input stream of the uncompressed content of a member,
+        without parsing other members. Raise KeyError if the member
+        doesn't exist and ParserError if the member is encrypted or if the
+        compression is not supported.
+        """
+        index = self.getMemberIndex()
+        if index is None:
+            raise ParserError("Unable to find ZIP central directory")
+        header_offset, compressed_size, uncompressed_size, compression, flags = index[name]
+        if flags & 1:
+            raise ParserError("Unable to open %s: member is encrypted" % name)
+        header = self.stream.readBytes(header_offset*8, 30)
+        if header[:4] != "PK\3\4":
+            raise ParserError("Invalid local file header of %s" % name)
+        filename_length, extra_length = unpack("<HH", header[26:30])
+        data_offset = header_offset + 30 + filename_length + extra_length
+        source = "%s:%s" % (self.stream.source, name)
+        if compression in (0, COMPRESSION_DEFLATE) and not uncompressed_size:
+            return StringInputStream("", source=source,
+                tags=[("filename", name)], allow_empty=True)
+        if compression == 0:
+            return InputSubStream(self.stream, data_offset*8,
+                compressed_size*8, source=source, tags=[("filename", name)])
+        if compression != COMPRESSION_DEFLATE:
+            raise ParserError("Unable to open %s: unsupported compression (%s)"
+                % (name, COMPRESSION_METHOD.get(compression, compression)))
+        stream = InputSubStream(self.stream, data_offset*8, compressed_size*8)
+        return DeflateInputStream(stream, size=uncompressed_size*8,
+            source=source, tags=[("filename", name)])
+
     def createContentSize(self):
+        location = self.findEndCentralDirectory()
+        if location is not None and not location[4]:
+            end_offset = location[0]
+            comment_length = self.stream.readBits((end_offset+20)*8, 16, LITTLE_ENDIAN)
+            return (end_offset + 22 + comment_length) * 8
         start = 0
         end = MAX_FILESIZE * 8
         end = self.stream.searchBytes("PK\5\6", start, end)
@@ -431,3 +582,24 @@ class ZipFile(Parser):
             return end + 22*8
         return None
 
+def zip64Sizes(extra, uncompressed_size, compressed_size, header_offset):
+    """
+    Read 64-bit values from the ZIP64 extended information extra field
+    (id 0x0001): only values set to 0xFFFFFFFF are stored in this field.
+    """
+    pos = 0
+    while pos + 4 <= len(extra):
+        field_id, size = unpack("<HH", extra[pos:pos+4])
+        pos += 4
+        if field_id == 0x0001:
+            values = []
+            data = extra[pos:pos+size]
+            for value in (uncompressed_size, compressed_size, header_offset):
+                if value == 0xFFFFFFFF and 8 <= len(data):
+                    value = unpack("<Q", data[:8])[0]
+                    data = data[8:]
+                values.append(value)
+            return values
+        pos += size
+    return uncompressed_size, compressed_size, header_offset
+
@@ -8,10 +8,14 @@ Creation date: July 9 2007
 from hachoir_parser import Parser
 from hachoir_core.field import (Bit, Bits, Field, Int16, UInt32,
     Enum, FieldSet, GenericFieldSet,
-    PaddingBits, ParserError, RawBytes)
+    PaddingBits, ParserError, RawBits, RawBytes)
 from hachoir_core.endian import LITTLE_ENDIAN
 from hachoir_core.text_handler import textHandler, hexadecimal
 from hachoir_core.tools import paddingSize, alignValue
+from hachoir_core.huffman import (buildHuffmanTree, getHuffmanTable,
+    BitCursor)
+from hachoir_core.i18n import _
+from hachoir_core import config
 
 def extend_data(data, length, offset):
     """Extend data using a length and an offset."""
@@ -21,25 +25,8 @@ def extend_data(data, length, offset):
     else:
         return data + data[-offset:-offset+length]
 
-def build_tree(lengths):
-    """Build a Huffman tree from a list of lengths.
-       The ith entry of the input list is the length of the Huffman code corresponding to
-       integer i, or 0 if the integer i is unused."""
-    max_length = max(lengths) + 1
-    bit_counts = [0]*max_length
-    next_code = [0]*max_length
-    tree = {}
-    for i in lengths:
-        if i:
-            bit_counts[i] += 1
-    code = 0
-    for i in xrange(1, len(bit_counts)):
-        next_code[i] = code = (code + bit_counts[i-1]) << 1
-    for i, ln in enumerate(lengths):
-        if ln:
-            tree[(ln, next_code[ln])] = i
-            next_code[ln] += 1
-    return tree
+# Canonical Huffman tree builder, also used by other parsers
+build_tree = buildHuffmanTree
 
 class HuffmanCode(Field):
     """Huffman code. Uses tree parameter as the Huffman tree."""
@@ -47,23 +34,46 @@ class HuffmanCode(Field):
         Field.__init__(self, parent, name, 0, description)
 
         endian = self.parent.endian
-        stream = self.parent.stream
-        addr = self.absolute_address
-
-        value = 0
-        while (self.size, value) not in tree:
-            if self.size > 256:
-                raise ParserError("Huffman code too long!")
-            bit = stream.readBits(addr, 1, endian)
-            value <<= 1
-            value += bit
-            self._size += 1
-            addr += 1
-        self.huffvalue = value
-        self.realvalue = tree[(self.size, value)]
+        table = getHuffmanTable(tree, endian)
+        cursor = BitCursor(self.parent.stream, self.absolute_address, endian, block_size=4)
+        self.realvalue, self._size, self.huffvalue = \
+            table.lookup(cursor.peek(table.max_length))
+        cursor.skip(self._size)
     def createValue(self):
         return self.huffvalue
 
+class HuffmanData(RawBits):
+    """
+    Huffman coded data stored in a single field (see
+    config.detailed_huffman): it has no value, it is usually too large to
+    be read as an integer.
+
+    >>> def readAll(fieldset):
+    ...     for field in fieldset:
+    ...         if field.is_field_set:
+    ...             readAll(field)
+    ...         elif field.hasValue():
+    ...             field.value
+    >>> from hachoir_core.stream import StringInputStream
+    >>> from hachoir_parser.archive.bzip2_parser import Bzip2Parser
+    >>> text = "".join(str(index * index) for index in xrange(2000))
+    >>> readAll(ZlibData(StringInputStream(text.encode("zlib"))))
+    >>> readAll(Bzip2Parser(StringInputStream(text.encode("bz2"))))
+    """
+    def hasValue(self):
+        return False
+
+    def createDisplay(self):
+        return _("<%s size=%u>" % (self.__class__.__name__, self._size))
+    createRawDisplay = createDisplay
+
+# Trees of the fixed Huffman codes: literal/length and distance
+FIXED_LENGTH_TREE = buildHuffmanTree([8]*144 + [9]*112 + [7]*24 + [8]*8)
+FIXED_DISTANCE_TREE = buildHuffmanTree([5]*32)
+
+# Maximum distance of a back-reference
+WINDOW_SIZE = 32768
+
 class DeflateBlock(FieldSet):
     # code: (min, max, extrabits)
     LENGTH_SYMBOLS = {257:(3,3,0),
@@ -148,18 +158,8 @@ class DeflateBlock(FieldSet):
                 yield RawBytes(self, "data", self["len"].value, "Uncompressed data")
             return
         elif self["compression_type"].value == 1: # Fixed Huffman
-            length_tree = {} # (size, huffman code): value
-            distance_tree = {}
-            for i in xrange(144):
-                length_tree[(8, i+48)] = i
-            for i in xrange(144, 256):
-                length_tree[(9, i+256)] = i
-            for i in xrange(256, 280):
-                length_tree[(7, i-256)] = i
-            for i in xrange(280, 288):
-                length_tree[(8, i-88)] = i
-            for i in xrange(32):
-                distance_tree[(5, i)] = i
+            length_tree = FIXED_LENGTH_TREE
+            distance_tree = FIXED_DISTANCE_TREE
         elif self["compression_type"].value == 2: # Dynamic Huffman
             yield Bits(self, "huff_num_length_codes", 5, "Number of Literal/Length Codes, minus 257")
             yield Bits(self, "huff_num_distance_codes", 5, "Number of Distance Codes, minus 1")
@@ -202,6 +202,10 @@ class DeflateBlock(FieldSet):
             distance_tree = build_tree(distance_code_lengths)
         else:
             raise ParserError("Unsupported compression type 3!")
+        if not config.detailed_huffman:
+            size = self.decodeData(length_tree, distance_tree)
+            yield HuffmanData(self, "data", size, "Huffman coded data")
+            return
         while True:
             field = HuffmanCode(self, "length_code[]", length_tree)
             value = field.realvalue
@@ -242,6 +246,45 @@ class DeflateBlock(FieldSet):
                     yield extrafield
                 self.uncomp_data = extend_data(self.uncomp_data, length, distance)
 
+    def decodeData(self, length_tree, distance_tree):
+        """
+        Decode the Huffman coded data up to the block terminator code
+        without creating fields. Returns the size in bits of the data.
+        """
+        address = self.absolute_address + self.current_size
+        cursor = BitCursor(self.stream, address, self.endian)
+        length_table = length_tree.getTable(self.endian)
+        distance_table = None
+        window = self.uncomp_data[-WINDOW_SIZE:]
+        data = bytearray(window)
+        while True:
+            value = length_table.decode(cursor)
+            if value < 256:
+                data.append(value)
+                continue
+            if value == 256:
+                break
+            minimum, maximum, extra = self.LENGTH_SYMBOLS[value]
+            length = minimum
+            if extra:
+                length += cursor.read(extra)
+            if distance_table is None:
+                distance_table = distance_tree.getTable(self.endian)
+            minimum, maximum, extra = self.DISTANCE_SYMBOLS[distance_table.decode(cursor)]
+            distance = minimum
+            if extra:
+                distance += cursor.read(extra)
+            start = len(data) - distance
+            if start < 0:
+                raise ParserError("Invalid distance %u" % distance)
+            if length <= distance:
+                data += data[start:start+length]
+            else:
+                for index in xrange(start, start+length):
+                    data.append(data[index])
+        self.uncomp_data += str(data[len(window):])
+        return cursor.address - address
+
 class DeflateData(GenericFieldSet):
     endian = LITTLE_ENDIAN
     def createFields(self):
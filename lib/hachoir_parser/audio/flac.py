@@ -5,15 +5,221 @@ Documentation:
 
  * http://flac.sourceforge.net/format.html
 
+Frames are found by FlacParser.getFrameIndex() which scans the audio data
+once for sync codes, checks the frame headers (CRC-8 and frame/sample
+numbers) and stores the offsets in a compact FrameIndex. Frame fields
+are only created when they are read.
+
 Author: Esteban Loiseau <baal AT tuxfamily.org>
 Creation date: 2008-04-09
 """
 
 from hachoir_parser import Parser
-from hachoir_core.field import FieldSet, String, Bit, Bits, UInt16, UInt24, RawBytes, Enum, NullBytes
+from hachoir_core.field import (FieldSet, String, Bit, Bits,
+    UInt8, UInt16, UInt24, RawBytes, Enum, NullBytes, createOrphanField)
 from hachoir_core.stream import BIG_ENDIAN, LITTLE_ENDIAN
-from hachoir_core.tools import createDict
+from hachoir_core.tools import createDict, createOffsetArray
 from hachoir_parser.container.ogg import parseVorbisComment
+from datetime import timedelta
+from bisect import bisect_right
+from struct import unpack
+from array import array
+
+# Size in bytes of the blocks read by the frame scanner
+SCAN_BLOCK_SIZE = 256 * 1024
+
+# Maximum size in bytes of a frame header
+MAX_HEADER_SIZE = 16
+
+# Block size (in samples) of the block size codes 1..15 of a frame header,
+# None: read at the end of the header (8 or 16 bits)
+BLOCK_SIZES = (None, 192, 576, 1152, 2304, 4608, None, None,
+    256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# Sample rate (in Hz) of the sample rate codes of a frame header:
+# 0 (read from STREAMINFO) and 12..14 (end of the header) are None
+SAMPLE_RATE_HERTZ = (None, 88200, 176400, 192000, 8000, 16000, 22050, 24000,
+    32000, 44100, 48000, 96000, None, None, None, None)
+
+# Frame header CRC-8 (polynom x^8 + x^2 + x^1 + x^0)
+def _createCRC8Table():
+    table = []
+    for value in xrange(256):
+        for bit in xrange(8):
+            if value & 0x80:
+                value = ((value << 1) ^ 0x07) & 0xFF
+            else:
+                value = (value << 1) & 0xFF
+        table.append(value)
+    return table
+CRC8_TABLE = _createCRC8Table()
+
+def crc8(data):
+    """
+    Compute the CRC-8 of a FLAC frame header.
+
+    >>> crc8("\\xff\\xf8\\x69\\x18\\x00\\x00")
+    191
+    """
+    crc = 0
+    for byte in data:
+        crc = CRC8_TABLE[crc ^ ord(byte)]
+    return crc
+
+def decodeUTF8Number(data, pos):
+    """
+    Decode a frame or sample number coded like an UTF-8 character (up to
+    36 bits). Returns (number, size in bytes), or None if the coding is
+    invalid.
+
+    >>> decodeUTF8Number("\\x7f", 0), decodeUTF8Number("\\xc2\\x80", 0)
+    ((127, 1), (128, 2))
+    """
+    value = ord(data[pos])
+    if value < 0x80:
+        return value, 1
+    if value == 0xFE:
+        size = 7
+        value = 0
+    else:
+        size = 2
+        mask = 0x20
+        while value & mask:
+            size += 1
+            mask >>= 1
+        if 0xC0 > value or size > 6:
+            return None
+        value &= mask - 1
+    if len(data) < pos + size:
+        return None
+    for byte in data[pos+1:pos+size]:
+        byte = ord(byte)
+        if byte & 0xC0 != 0x80:
+            return None
+        value = (value << 6) | (byte & 0x3F)
+    return value, size
+
+def decodeFrameHeader(data, pos):
+    """
+    Decode and check the frame header at data[pos:]. Returns
+    (blocking_strategy, number, block_size, sample_rate, header_size), or
+    None if the header is invalid. number is a frame number (fixed block
+    size) or a sample number (variable block size), sample_rate is None
+    if it is read from STREAMINFO.
+    """
+    if len(data) < pos + 6:
+        return None
+    byte1, byte2, byte3 = unpack("BBB", data[pos+1:pos+4])
+    if (byte1 & 0xFE) != 0xF8 or byte3 & 1:
+        return None
+    block_code = byte2 >> 4
+    rate_code = byte2 & 15
+    if not block_code or rate_code == 15 \
+    or 11 <= (byte3 >> 4) or (byte3 & 14) == 6:
+        return None
+    number = decodeUTF8Number(data, pos + 4)
+    if number is None:
+        return None
+    number, size = number
+    end = pos + 4 + size
+    block_size = BLOCK_SIZES[block_code]
+    if block_code == 6:
+        end += 1
+        if len(data) < end:
+            return None
+        block_size = ord(data[end-1]) + 1
+    elif block_code == 7:
+        end += 2
+        if len(data) < end:
+            return None
+        block_size = unpack(">H", data[end-2:end])[0] + 1
+    sample_rate = SAMPLE_RATE_HERTZ[rate_code]
+    if rate_code == 12:
+        end += 1
+        if len(data) < end:
+            return None
+        sample_rate = ord(data[end-1]) * 1000
+    elif rate_code in (13, 14):
+        end += 2
+        if len(data) < end:
+            return None
+        sample_rate = unpack(">H", data[end-2:end])[0]
+        if rate_code == 14:
+            sample_rate *= 10
+    if len(data) <= end or crc8(data[pos:end]) != ord(data[end]):
+        return None
+    return (byte1 & 1, number, block_size, sample_rate, end + 1 - pos)
+
+class FrameIndex(object):
+    """
+    Compact index of the frames of a FLAC stream: one entry per frame with
+    its address (in bytes), its first sample number and its block size (in
+    samples). The size of a frame is the distance to the next frame, the
+    last frame ends at end_offset.
+    """
+    def __init__(self):
+        self.offset = createOffsetArray()
+        self.sample = createOffsetArray()
+        self.block_size = array('L')
+        self.end_offset = None
+
+    def append(self, offset, sample, block_size):
+        self.offset.append(offset)
+        self.sample.append(sample)
+        self.block_size.append(block_size)
+
+    def __len__(self):
+        return len(self.offset)
+
+    def __getitem__(self, index):
+        return (int(self.offset[index]), int(self.sample[index]),
+            self.block_size[index])
+
+    def __iter__(self):
+        for index in xrange(len(self.offset)):
+            yield self[index]
+
+    def getFrameSize(self, index):
+        """
+        Size in bytes of the frame index.
+        """
+        if index + 1 < len(self.offset):
+            return int(self.offset[index+1] - self.offset[index])
+        return self.end_offset - int(self.offset[index])
+
+    def getTotalSamples(self):
+        if not self.offset:
+            return 0
+        return int(self.sample[-1]) + self.block_size[-1]
+
+    def find(self, sample):
+        """
+        Find the frame containing the sample: returns its index, or None
+        if the sample is after the end of the stream.
+        """
+        if self.getTotalSamples() <= sample:
+            return None
+        return max(bisect_right(self.sample, sample) - 1, 0)
+
+    def createSeekPoints(self, interval):
+        """
+        Create seek points (like the SEEKTABLE metadata block): list of
+        (sample number, offset relative to the first frame, number of
+        samples) with one point every interval samples.
+        """
+        points = []
+        if not self.offset:
+            return points
+        first = int(self.offset[0])
+        next_sample = 0
+        for index in xrange(len(self.offset)):
+            sample = int(self.sample[index])
+            if sample < next_sample:
+                continue
+            points.append((sample, int(self.offset[index]) - first,
+                self.block_size[index]))
+            next_sample = sample + interval
+        return points
 
 class VorbisComment(FieldSet):
     endian = LITTLE_ENDIAN
@@ -122,14 +328,42 @@ class Frame(FieldSet):
         yield Bits(self, "channel_assign", 4)
         yield Bits(self, "sample_size", 3)
         yield Bit(self, "reserved[]")
-        # FIXME: Finish frame header parser
+        number = decodeUTF8Number(self.stream.readBytes(self.absolute_address + 32, 7), 0)
+        if number is None:
+            return
+        if self["blocking_strategy"].value:
+            desc = "Sample number %s (UTF-8 coded)" % number[0]
+        else:
+            desc = "Frame number %s (UTF-8 coded)" % number[0]
+        yield RawBytes(self, "number", number[1], desc)
+        block_size = self["block_size"].value
+        if block_size == 6:
+            yield UInt8(self, "block_size_value", "Block size (in samples) minus one")
+        elif block_size == 7:
+            yield UInt16(self, "block_size_value", "Block size (in samples) minus one")
+        sample_rate = self["sample_rate"].value
+        if sample_rate == 12:
+            yield UInt8(self, "sample_rate_value", "Sample rate (in kHz)")
+        elif sample_rate == 13:
+            yield UInt16(self, "sample_rate_value", "Sample rate (in Hz)")
+        elif sample_rate == 14:
+            yield UInt16(self, "sample_rate_value", "Sample rate (in tens of Hz)")
+        yield UInt8(self, "crc8", "CRC-8 of the frame header")
+        if self._size is None:
+            return
+        size = (self._size - self.current_size) // 8 - 2
+        if 0 < size:
+            yield RawBytes(self, "subframes", size)
+        yield UInt16(self, "crc16", "CRC-16 of the frame")
 
 class Frames(FieldSet):
     def createFields(self):
-        while not self.eof:
-            yield Frame(self, "frame[]")
-            # FIXME: Parse all frames
-            return
+        index = self.root.getFrameIndex()
+        for number, (offset, sample, block_size) in enumerate(index):
+            offset = offset * 8 - self.absolute_address
+            if self.current_size < offset:
+                yield RawBytes(self, "unknown[]", (offset - self.current_size) // 8)
+            yield Frame(self, "frame[]", size=index.getFrameSize(number) * 8)
 
 class FlacParser(Parser):
     "Parse FLAC audio files: FLAC is a lossless audio codec"
@@ -145,6 +379,11 @@ class FlacParser(Parser):
     }
     endian = BIG_ENDIAN
 
+    def __init__(self, stream, **args):
+        Parser.__init__(self, stream, **args)
+        self._stream_info = None
+        self._frame_index = None
+
     def validate(self):
         if self.stream.readBytes(0, len(self.MAGIC)) != self.MAGIC:
             return u"Invalid magic string"
@@ -155,3 +394,161 @@ class FlacParser(Parser):
         yield Metadata(self,"metadata")
         yield Frames(self,"frames")
 
+    def getStreamInfo(self):
+        """
+        Read the STREAMINFO metadata block and the offset of the first
+        frame without creating fields. Returns a dictionary using the names
+        of the StreamInfo fields, plus "frames_offset" (in bytes).
+        """
+        if self._stream_info is not None:
+            return self._stream_info
+        stream = self.stream
+        info = dict.fromkeys(("min_block_size", "max_block_size",
+            "min_frame_size", "max_frame_size", "sample_hertz",
+            "nb_channel", "bits_per_sample", "total_samples"), 0)
+        offset = 4
+        while True:
+            header = stream.readBytes(offset * 8, 4)
+            block_type = ord(header[0]) & 0x7F
+            length = unpack(">I", "\0" + header[1:])[0]
+            if block_type == 0 and offset == 4 and 34 <= length:
+                data = stream.readBytes((offset + 4) * 8, 18)
+                info["min_block_size"], info["max_block_size"] = unpack(">HH", data[:4])
+                info["min_frame_size"] = unpack(">I", "\0" + data[4:7])[0]
+                info["max_frame_size"] = unpack(">I", "\0" + data[7:10])[0]
+                value = unpack(">Q", data[10:18])[0]
+                info["sample_hertz"] = value >> 44
+                info["nb_channel"] = (value >> 41) & 7
+                info["bits_per_sample"] = (value >> 36) & 31
+                info["total_samples"] = value & (2**36 - 1)
+            offset += 4 + length
+            if ord(header[0]) & 0x80:
+                break
+        info["frames_offset"] = offset
+        self._stream_info = info
+        return info
+
+    def scanFrames(self, block_size=SCAN_BLOCK_SIZE):
+        """
+        Scan the audio data for frames: search the sync codes, and check
+        each frame header (CRC-8) and its frame/sample number which has to
+        follow the previous frame. Returns a FrameIndex.
+        """
+        info = self.getStreamInfo()
+        stream = self.stream
+        end = stream.size // 8
+        if info["min_block_size"] == info["max_block_size"]:
+            fixed_size = info["max_block_size"]
+        else:
+            fixed_size = None
+        skip = max(info["min_frame_size"], 1)
+        index = FrameIndex()
+        index.end_offset = end
+        sync = "\xff"
+        expected = None
+        data = ""
+        data_offset = pos = info["frames_offset"]
+        while pos < end:
+            found = pos - data_offset
+            if len(data) < found + MAX_HEADER_SIZE and data_offset + len(data) < end:
+                # Read the next block, keep the end of the current block
+                data = data[found:]
+                data_offset = pos
+                size = min(block_size, end - data_offset - len(data))
+                data += stream.readBytes((data_offset + len(data)) * 8, size)
+                continue
+            found = data.find(sync, found)
+            if found < 0:
+                if end <= data_offset + len(data):
+                    break
+                pos = data_offset + len(data) - len(sync) + 1
+                continue
+            pos = data_offset + found
+            if len(data) < found + MAX_HEADER_SIZE and data_offset + len(data) < end:
+                continue
+            header = decodeFrameHeader(data, found)
+            if header is None:
+                pos += 1
+                continue
+            blocking, number, frame_size, rate, header_size = header
+            if blocking:
+                sample = number
+            else:
+                if fixed_size is None:
+                    fixed_size = frame_size
+                sample = number * fixed_size
+            if expected is not None and sample != expected:
+                # False sync code in audio data, or damaged frames: only
+                # resynchronize if the next frame follows this one
+                if sample < expected or not self._isFollowed(pos + header_size,
+                blocking, sample + frame_size, fixed_size):
+                    pos += 1
+                    continue
+            if expected is None:
+                # The blocking strategy can not change in a stream
+                sync = data[found:found+2]
+            index.append(pos, sample, frame_size)
+            expected = sample + frame_size
+            pos += max(header_size, skip)
+        return index
+
+    def _isFollowed(self, offset, blocking, expected, fixed_size):
+        # Check if a frame starting with the sample expected is found
+        # in the max_frame_size bytes following offset
+        size = self.getStreamInfo()["max_frame_size"] or SCAN_BLOCK_SIZE
+        size = min(size + MAX_HEADER_SIZE, self.stream.size // 8 - offset)
+        data = self.stream.readBytes(offset * 8, size)
+        pos = 0
+        while True:
+            pos = data.find("\xff", pos)
+            if pos < 0:
+                return False
+            header = decodeFrameHeader(data, pos)
+            if header is not None and header[0] == blocking:
+                if blocking:
+                    sample = header[1]
+                else:
+                    sample = header[1] * fixed_size
+                if sample == expected:
+                    return True
+            pos += 1
+
+    def getFrameIndex(self):
+        """
+        Get the FrameIndex of the stream (the frames are only scanned once).
+        """
+        if self._frame_index is None:
+            self._frame_index = self.scanFrames()
+        return self._frame_index
+
+    def getFrame(self, index):
+        """
+        Create the Frame field of the frame index of the FrameIndex.
+        """
+        frames = self.getFrameIndex()
+        return createOrphanField(self, frames[index][0] * 8, Frame,
+            "frame[%u]" % index, size=frames.getFrameSize(index) * 8)
+
+    def getDuration(self):
+        """
+        Compute the duration of the stream from its frames: the number of
+        samples of STREAMINFO is not used, it may be unknown (zero).
+        Returns a timedelta, or None if the sample rate is unknown.
+        """
+        rate = self.getStreamInfo()["sample_hertz"]
+        if not rate:
+            return None
+        samples = self.getFrameIndex().getTotalSamples()
+        return timedelta(seconds=float(samples) / rate)
+
+    def findSample(self, sample):
+        """
+        Find the frame containing a sample: returns (frame offset in bytes,
+        first sample of the frame), or None if the sample is after the end
+        of the stream.
+        """
+        frames = self.getFrameIndex()
+        index = frames.find(sample)
+        if index is None:
+            return None
+        return frames[index][:2]
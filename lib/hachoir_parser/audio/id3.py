@@ -3,6 +3,10 @@ ID3 metadata parser, supported versions: 1.O, 2.2, 2.3 and 2.4
 
 Informations: http://www.id3.org/
 
+ID3Directory (see ID3v2.getDirectory()) only reads the frame headers:
+text frames are decoded on demand and picture or object data are exposed
+as substreams, so embedded cover art is never read.
+
 Author: Victor Stinner
 """
 
@@ -13,6 +17,8 @@ from hachoir_core.field import (FieldSet, MatchError, ParserError,
 from hachoir_core.text_handler import textHandler
 from hachoir_core.tools import humanDuration
 from hachoir_core.endian import NETWORK_ENDIAN
+from hachoir_core.stream import InputStream, InputSubStream
+from struct import unpack
 
 class ID3v1(FieldSet):
     static_size = 128 * 8
@@ -469,6 +475,12 @@ class ID3v2(FieldSet):
         return "ID3 v2.%s.%s" % \
             (self["ver_major"].value, self["ver_minor"].value)
 
+    def getDirectory(self):
+        """
+        Create the ID3Directory of the tag (frame headers only).
+        """
+        return ID3Directory(self.stream, self.absolute_address // 8)
+
     def createFields(self):
         # Signature + version
         yield String(self, "header", 3, "Header (ID3)", charset="ASCII")
@@ -505,3 +517,347 @@ class ID3v2(FieldSet):
         if padding:
             yield padding
 
+# Size in bytes of the blocks decoded by UnsyncInputStream
+UNSYNC_BLOCK_SIZE = 64 * 1024
+
+# Maximum size in bytes of the header of a picture or object frame
+# (MIME type, file name and description) read by ID3Directory
+MAX_FRAME_HEADER_SIZE = 64 * 1024
+
+class UnsyncInputStream(InputStream):
+    """
+    Transform stream reversing the ID3v2 unsynchronisation of size bytes
+    of stream at offset (in bytes): a null byte following a 0xFF byte is
+    removed. Data are decoded by blocks when they are read. If the size
+    of the decoded data (decoded_size, in bytes) is unknown, it is only
+    known once all data are decoded.
+    """
+    def __init__(self, stream, offset, size, decoded_size=None, source=None):
+        if source is None:
+            source = "<unsync input=%s offset=%s size=%s>" % (stream.source, offset, size)
+        if decoded_size is not None:
+            decoded_size *= 8
+        InputStream.__init__(self, source=source, size=decoded_size)
+        self.stream = stream
+        self._data = bytearray()
+        self._position = offset
+        self._end = offset + size
+        self._pending = False
+
+    _current_size = property(lambda self: len(self._data) * 8)
+
+    def _decode(self, end):
+        while len(self._data) < end and self._position < self._end:
+            size = min(UNSYNC_BLOCK_SIZE, self._end - self._position)
+            data = self.stream.readBytes(self._position * 8, size)
+            self._position += size
+            if self._pending and data.startswith("\0"):
+                data = data[1:]
+            self._pending = data.endswith("\xff")
+            self._data.extend(data.replace("\xff\0", "\xff"))
+        if self._end <= self._position and self._size is None:
+            self._setSize()
+
+    def read(self, address, size):
+        byte_address, shift = divmod(address, 8)
+        nbytes = (size + shift + 7) >> 3
+        end = byte_address + nbytes
+        self._decode(end)
+        data = str(self._data[byte_address:end])
+        return shift, data, len(data) != nbytes
+
+def decodeSyncSafe(data):
+    """
+    Decode a "sync safe" integer (7 bits per byte).
+
+    >>> decodeSyncSafe("\\x00\\x00\\x02\\x01")
+    257
+    """
+    value = 0
+    for byte in data:
+        value = (value << 7) | (ord(byte) & 127)
+    return value
+
+def _readString(data, pos, charset):
+    # Read a null terminated string: returns (text, position after the
+    # terminator), or None if there is no terminator
+    if charset in (1, 2):
+        end = pos
+        while True:
+            end = data.find("\0\0", end)
+            if end < 0:
+                return None
+            if not (end - pos) % 2:
+                break
+            end += 1
+        terminator = 2
+    else:
+        end = data.find("\0", pos)
+        if end < 0:
+            return None
+        terminator = 1
+    return decodeText(data[pos:end], charset), end + terminator
+
+def decodeText(data, charset):
+    """
+    Decode the text of a frame: charset is the charset byte (0..3).
+    """
+    try:
+        charset = ID3_StringCharset.charset_name[charset]
+    except KeyError:
+        raise ParserError("ID3v2: Invalid charset (%s)." % charset)
+    if charset == "UTF-16" and data[:2] not in ("\xff\xfe", "\xfe\xff"):
+        charset = "UTF-16-LE"
+    return unicode(data, charset, "replace")
+
+class ID3Frame(object):
+    """
+    Entry of ID3Directory: frame identifier (eg. "TIT2"), address of the
+    frame data (in bytes, in the stream of the directory), size (in
+    bytes) and flags (16 bits, 0 for ID3 v2.2).
+    """
+    def __init__(self, tag, offset, size, flags):
+        self.tag = tag
+        self.offset = offset
+        self.size = size
+        self.flags = flags
+
+    def __repr__(self):
+        return "<ID3Frame %s offset=%s size=%s>" % (self.tag, self.offset, self.size)
+
+class ID3Directory(object):
+    """
+    Directory of the frames of an ID3v2 tag, created by scanning the frame
+    headers only: frame contents are read on demand (getText(),
+    getPicture(), ...). If the whole tag uses the unsynchronisation (ID3
+    v2.2 and v2.3), the frames are read from an UnsyncInputStream.
+    """
+    # Flags of ID3 v2.4 frames
+    V24_GROUP = 0x40
+    V24_COMPRESSED = 0x08
+    V24_ENCRYPTED = 0x04
+    V24_UNSYNC = 0x02
+    V24_DATA_LENGTH = 0x01
+
+    # Flags of ID3 v2.3 frames
+    V23_COMPRESSED = 0x80
+    V23_ENCRYPTED = 0x40
+    V23_GROUP = 0x20
+
+    def __init__(self, stream, address=0):
+        header = stream.readBytes(address * 8, 10)
+        if header[:3] != "ID3" or ord(header[3]) not in ID3v2.VALID_MAJOR_VERSIONS:
+            raise ParserError("ID3v2: invalid tag header")
+        self.version = ord(header[3])
+        flags = ord(header[5])
+        self.unsync = bool(flags & 0x80)
+        size = decodeSyncSafe(header[6:10])
+        self.tag_size = 10 + size
+        if self.unsync and self.version < 4:
+            self.stream = UnsyncInputStream(stream, address + 10, size)
+            start = 0
+            end = None
+        else:
+            self.stream = stream
+            start = address + 10
+            end = start + size
+        if flags & 0x40 and 3 <= self.version:
+            # Skip the extended header
+            data = self.stream.readBytes(start * 8, 4)
+            if self.version == 3:
+                start += 4 + unpack(">I", data)[0]
+            else:
+                start += decodeSyncSafe(data)
+        self.frames = list(self._scan(start, end))
+
+    def _scan(self, pos, end):
+        stream = self.stream
+        if self.version == 2:
+            header_size = 6
+        else:
+            header_size = 10
+        while True:
+            if end is not None:
+                if end < pos + header_size:
+                    break
+            elif not stream.sizeGe((pos + header_size) * 8):
+                break
+            header = stream.readBytes(pos * 8, header_size)
+            if self.version == 2:
+                tag = header[:3]
+                size = unpack(">I", "\0" + header[3:6])[0]
+                flags = 0
+            else:
+                tag = header[:4]
+                if self.version == 4:
+                    size = decodeSyncSafe(header[4:8])
+                else:
+                    size = unpack(">I", header[4:8])[0]
+                flags = unpack(">H", header[8:10])[0]
+            if not tag.isalnum() or tag.upper() != tag:
+                # Padding or invalid frame
+                break
+            pos += header_size
+            if end is not None and end < pos + size:
+                break
+            yield ID3Frame(tag, pos, size, flags)
+            pos += size
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def find(self, tag):
+        """
+        Returns the list of the frames with the identifier tag.
+        """
+        return [frame for frame in self.frames if frame.tag == tag]
+
+    def getFrameStream(self, frame):
+        """
+        Create a stream of the content of a frame: the group identifier
+        and the data length indicator are skipped, and the ID3 v2.4 frame
+        unsynchronisation is reversed. Raise a ParserError for compressed
+        or encrypted frames.
+        """
+        offset, size = frame.offset, frame.size
+        flags = frame.flags & 0xFF
+        unsync = False
+        decoded_size = None
+        if self.version == 4:
+            if flags & (self.V24_COMPRESSED | self.V24_ENCRYPTED):
+                raise ParserError("ID3v2: compressed or encrypted frame")
+            prefix = 0
+            if flags & self.V24_GROUP:
+                prefix += 1
+            if flags & self.V24_DATA_LENGTH:
+                decoded_size = decodeSyncSafe(
+                    self.stream.readBytes((offset + prefix) * 8, 4))
+                prefix += 4
+            unsync = self.unsync or bool(flags & self.V24_UNSYNC)
+        elif self.version == 3:
+            if flags & (self.V23_COMPRESSED | self.V23_ENCRYPTED):
+                raise ParserError("ID3v2: compressed or encrypted frame")
+            prefix = 0
+            if flags & self.V23_GROUP:
+                prefix += 1
+        else:
+            prefix = 0
+        offset += prefix
+        size -= prefix
+        if size <= 0:
+            raise ParserError("ID3v2: empty frame %s" % frame.tag)
+        if unsync:
+            return UnsyncInputStream(self.stream, offset, size, decoded_size)
+        return InputSubStream(self.stream, offset * 8, size * 8)
+
+    def getFrameData(self, frame, size=None, stream=None):
+        """
+        Read the content of a frame, or only its size first bytes.
+        """
+        if stream is None:
+            stream = self.getFrameStream(frame)
+        if size is None:
+            # Read all data (needed for unsynchronised data)
+            stream.sizeGe(frame.size * 8)
+            size = stream.size // 8
+        elif not stream.sizeGe(size * 8):
+            size = stream.size // 8
+        return stream.readBytes(0, size)
+
+    def getText(self, tag):
+        """
+        Decode the first text frame tag: returns an unicode string (the
+        values of an ID3 v2.4 multiple values frame are separated by
+        "/"), or None if the frame doesn't exist.
+        """
+        for frame in self.find(tag):
+            data = self.getFrameData(frame)
+            if not data:
+                return u""
+            text = decodeText(data[1:], ord(data[0]))
+            return u"/".join(value for value in text.split(u"\0") if value)
+        return None
+
+    def _readHeader(self, frame, parse):
+        # Read the header of a picture or object frame: parse(data) returns
+        # (values, header size) or None if data is incomplete
+        stream = self.getFrameStream(frame)
+        size = 256
+        while True:
+            data = self.getFrameData(frame, size, stream)
+            result = parse(data)
+            if result is not None:
+                break
+            if len(data) < size or MAX_FRAME_HEADER_SIZE <= size:
+                raise ParserError("ID3v2: invalid frame %s" % frame.tag)
+            size *= 4
+        values, header_size = result
+        if stream.size is None:
+            # Unsynchronised data without data length indicator: the size
+            # is only known once all data are decoded
+            stream.sizeGe(frame.size * 8 + 8)
+        if stream.size <= header_size * 8:
+            return values + (None,)
+        return values + (InputSubStream(stream, header_size * 8),)
+
+    def getPictures(self):
+        """
+        Read the headers of the attached pictures (APIC and PIC frames):
+        returns a list of (MIME type or image format, picture type,
+        description, stream of the image data). Image data are not read.
+        """
+        pictures = []
+        for frame in self.frames:
+            if frame.tag == "APIC":
+                pictures.append(self._readHeader(frame, self._parseAPIC))
+            elif frame.tag == "PIC":
+                pictures.append(self._readHeader(frame, self._parsePIC))
+        return pictures
+
+    def getObjects(self):
+        """
+        Read the headers of the encapsulated objects (GEOB frames): returns
+        a list of (MIME type, file name, description, stream of the object
+        data). Object data are not read.
+        """
+        return [self._readHeader(frame, self._parseGEOB)
+            for frame in self.find("GEOB")]
+
+    def _parseAPIC(self, data):
+        if len(data) < 2:
+            return None
+        charset = ord(data[0])
+        mime = _readString(data, 1, 0)
+        if mime is None or len(data) <= mime[1]:
+            return None
+        picture_type = ord(data[mime[1]])
+        description = _readString(data, mime[1] + 1, charset)
+        if description is None:
+            return None
+        return (mime[0], picture_type, description[0]), description[1]
+
+    def _parsePIC(self, data):
+        if len(data) < 5:
+            return None
+        description = _readString(data, 5, ord(data[0]))
+        if description is None:
+            return None
+        return (unicode(data[1:4], "ISO-8859-1"), ord(data[4]), description[0]), description[1]
+
+    def _parseGEOB(self, data):
+        if len(data) < 1:
+            return None
+        charset = ord(data[0])
+        mime = _readString(data, 1, 0)
+        if mime is None:
+            return None
+        filename = _readString(data, mime[1], charset)
+        if filename is None:
+            return None
+        description = _readString(data, filename[1], charset)
+        if description is None:
+            return None
+        return (mime[0], filename[0], description[0]), description[1]
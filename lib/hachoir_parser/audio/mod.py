@@ -143,7 +143,7 @@ class AmigaModule(Parser):
         for index in xrange(31):
             count = header["samples/info[%u]/sample_count" % index].value
             if count:
-                self.info("Yielding sample %u: %u samples" % (index, count))
+                self.info("Yielding sample %u: %u samples", index, count)
                 yield RawBytes(self, "sample_data[]", 2*count, \
                                "Sample %u" % index)
 
@@ -34,7 +34,7 @@ class Command(FieldSet):
         start = self.absolute_address
         size = self.stream.searchBytesLength("\0", False, start)
         if size > 0:
-            self.info("Command: %s" % self.stream.readBytes(start, size))
+            self.info("Command: %s", self.stream.readBytes(start, size))
             yield String(self, "command", size, strip='\0')
         yield RawBytes(self, "parameter", (self._size//8)-size)
 
@@ -236,8 +236,8 @@ def parseFields(parser):
         addr += field._size
 
     # Abort on unknown codes
-    parser.info("End of extension '%s' when finding '%s'" %
-           (parser["block_type"].value, parser.stream.readBytes(addr, 4)))
+    parser.info("End of extension '%s' when finding '%s'",
+           parser["block_type"].value, parser.stream.readBytes(addr, 4))
 
 class ModplugBlock(FieldSet):
     BLOCK_INFO = {
@@ -66,8 +66,8 @@ class ChunkIndexer:
             # Check if padding needed
             size = chunk.offset - current_pos
             if size > 0:
-                obj.info("Padding of %u bytes needed: curr=%u offset=%u" % \
-                         (size, current_pos, chunk.offset))
+                obj.info("Padding of %u bytes needed: curr=%u offset=%u",
+                         size, current_pos, chunk.offset)
                 yield PaddingBytes(obj, "padding[]", size)
                 current_pos = obj.current_size//8
 
@@ -79,20 +79,20 @@ class ChunkIndexer:
                 chunk = self.chunks.pop()
                 # Unfortunaly, we also pass the underlying chunks
                 if chunk == None:
-                    obj.info("Couldn't resynch: %u object skipped to reach %u" % \
-                             (count, current_pos))
+                    obj.info("Couldn't resynch: %u object skipped to reach %u",
+                             count, current_pos)
                     return
 
             # Resynch
             size = chunk.offset-current_pos
             if size > 0:
-                obj.info("Skipped %u objects to resynch to %u; chunk offset: %u->%u" % \
-                         (count, current_pos, old_off, chunk.offset))
+                obj.info("Skipped %u objects to resynch to %u; chunk offset: %u->%u",
+                         count, current_pos, old_off, chunk.offset)
                 yield RawBytes(obj, "resynch[]", size)
 
             # Yield
-            obj.info("Yielding element of size %u at offset %u" % \
-                     (chunk.size, chunk.offset))
+            obj.info("Yielding element of size %u at offset %u",
+                     chunk.size, chunk.offset)
             field = chunk.cls(obj, chunk.name, chunk.size, *chunk.args)
             # Not tested, probably wrong:
             #if chunk.size: field.static_size = 8*chunk.size
@@ -100,8 +100,8 @@ class ChunkIndexer:
 
             if hasattr(field, "getSubChunks"):
                 for sub_chunk in field.getSubChunks():
-                    obj.info("Adding sub chunk: position=%u size=%u name='%s'" % \
-                             (sub_chunk.offset, sub_chunk.size, sub_chunk.name))
+                    obj.info("Adding sub chunk: position=%u size=%u name='%s'",
+                             sub_chunk.offset, sub_chunk.size, sub_chunk.name)
                     self.addChunk(sub_chunk)
 
             # Let missing padding be done by next chunk
@@ -236,7 +236,7 @@ class Note(FieldSet):
 
     def createFields(self):
         # This stupid shit gets the LSB, not the MSB...
-        self.info("Note info: 0x%02X" %
+        self.info("Note info: 0x%02X",
                   self.stream.readBits(self.absolute_address, 8, LITTLE_ENDIAN))
         yield RealBit(self, "is_extended")
         if self["is_extended"].value:
@@ -302,7 +302,7 @@ class Pattern(FieldSet):
         yield UInt16(self, "rows", r"Number of rows in pattern (1..256)")
         yield UInt16(self, "data_size", r"Packed patterndata size")
         rows = self["rows"].value
-        self.info("Pattern: %i rows" % rows)
+        self.info("Pattern: %i rows", rows)
         for index in xrange(rows):
             yield Row(self, "row[]")
 
@@ -0,0 +1,305 @@
+"""
+Persistent cache of parser results.
+
+Scanning a media library again and again re-parses files which did not
+change. ParserCache stores in a SQLite database, for each file identified
+by (device, inode, size, modification time): the identifier of the parser,
+the MIME type, the description, the content size and the value of some
+fields. A file which did not change is not parsed again.
+
+Example:
+
+    cache = ParserCache(u"~/.hachoir_cache.db", fields=("/header/width",))
+    entry = cache.get(filename)
+    if entry is None:
+        parser = cache.createParser(filename)
+        entry = cache.get(filename)
+    if entry.parser_id:
+        print entry.mime_type, entry.fields.get("/header/width")
+    cache.close()
+
+The least recently used files are evicted when the cache contains more
+than max_entries files.
+"""
+
+import os
+import marshal
+from datetime import datetime, date, timedelta
+from hachoir_core.error import HachoirError, HACHOIR_ERRORS
+from hachoir_core.stream import FileInputStream
+from hachoir_core.field import MissingField
+from hachoir_parser.guess import guessParser
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+try:
+    import hashlib
+    def contentHash(filename, size):
+        """
+        Hash of the first and the last HASH_SIZE bytes of a file
+        """
+        hash = hashlib.md5()
+        input = open(filename, "rb")
+        try:
+            hash.update(input.read(HASH_SIZE))
+            if HASH_SIZE < size:
+                input.seek(max(size - HASH_SIZE, HASH_SIZE))
+                hash.update(input.read(HASH_SIZE))
+        finally:
+            input.close()
+        return hash.hexdigest()
+except ImportError:
+    def contentHash(filename, size):
+        raise ImportError("hashlib module is missing")
+
+# Default maximum number of files stored in the cache
+MAX_ENTRIES = 500000
+
+# Number of bytes hashed at the start and at the end of a file
+HASH_SIZE = 64 * 1024
+
+# Number of changes (new files, accesses) written in a transaction
+COMMIT_INTERVAL = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entry (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    hash TEXT,
+    parser_id TEXT,
+    mime_type TEXT,
+    description TEXT,
+    content_size INTEGER,
+    fields BLOB,
+    used INTEGER NOT NULL,
+    PRIMARY KEY (device, inode));
+CREATE INDEX IF NOT EXISTS entry_used ON entry (used);
+"""
+
+class CacheError(HachoirError):
+    pass
+
+# Types of field values stored as is by marshal
+MARSHAL_TYPES = (bool, int, long, float, str, unicode, type(None))
+
+def encodeValue(value):
+    """
+    Convert a field value to data which can be stored with marshal:
+    date and time values are stored as tuples. Returns None if the type
+    of the value is not supported.
+
+    >>> encodeValue(datetime(2006, 5, 4, 12, 30))
+    ('datetime', 2006, 5, 4, 12, 30, 0, 0)
+    >>> decodeValue(encodeValue(timedelta(seconds=90)))
+    datetime.timedelta(0, 90)
+    """
+    if isinstance(value, MARSHAL_TYPES):
+        return value
+    if isinstance(value, datetime):
+        return ("datetime", value.year, value.month, value.day,
+            value.hour, value.minute, value.second, value.microsecond)
+    if isinstance(value, date):
+        return ("date", value.year, value.month, value.day)
+    if isinstance(value, timedelta):
+        return ("timedelta", value.days, value.seconds, value.microseconds)
+    return None
+
+def decodeValue(data):
+    """
+    Inverse of encodeValue()
+    """
+    if not isinstance(data, tuple):
+        return data
+    if data[0] == "datetime":
+        return datetime(*data[1:])
+    if data[0] == "date":
+        return date(*data[1:])
+    if data[0] == "timedelta":
+        return timedelta(*data[1:])
+    raise ValueError("Unknown cached value type: %r" % (data[0],))
+
+class CacheEntry(object):
+    """
+    Cached result of a file: parser_id is None if no parser was found,
+    fields is a dictionary field path => value.
+    """
+    def __init__(self, parser_id, mime_type, description, content_size, fields):
+        self.parser_id = parser_id
+        self.mime_type = mime_type
+        self.description = description
+        self.content_size = content_size
+        self.fields = fields
+
+    def __repr__(self):
+        return "<CacheEntry parser=%s mime=%s>" % (self.parser_id, self.mime_type)
+
+class ParserCache(object):
+    def __init__(self, filename, fields=(), max_entries=MAX_ENTRIES, verify_hash=False):
+        """
+        @param filename: Database filename, ":memory:" for a cache which is
+            not stored on disk
+        @param fields: Paths of the fields (eg. "/header/width") whose
+            value is stored
+        @param max_entries: Maximum number of files in the cache
+        @param verify_hash: Also compare the hash of the start and the end
+            of the files (see contentHash())
+        """
+        if sqlite3 is None:
+            raise CacheError("sqlite3 module is missing")
+        if filename != ":memory:":
+            filename = os.path.expanduser(filename)
+        self.fields = tuple(fields)
+        self.max_entries = max_entries
+        self.verify_hash = verify_hash
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        self._changes = 0
+        self._count, used = self.db.execute(
+            "SELECT COUNT(*), MAX(used) FROM entry").fetchone()
+        self._used = used or 0
+
+    def close(self):
+        if self.db is None:
+            return
+        self.db.commit()
+        self.db.close()
+        self.db = None
+
+    def flush(self):
+        self.db.commit()
+        self._changes = 0
+
+    def _changed(self):
+        self._changes += 1
+        if COMMIT_INTERVAL <= self._changes:
+            self.flush()
+
+    def _stat(self, filename):
+        """
+        Get the key (device, inode) and the identity (size, mtime) of a file
+        """
+        try:
+            stat = os.stat(filename)
+        except OSError, err:
+            raise CacheError("Unable to get status of %s: %s" % (filename, err))
+        return (stat.st_dev, stat.st_ino), (stat.st_size, stat.st_mtime)
+
+    def get(self, filename):
+        """
+        Get the cached result of a file (CacheEntry), or None if the file
+        is not cached, changed, or if some fields are not cached.
+        """
+        (device, inode), (size, mtime) = self._stat(filename)
+        row = self.db.execute(
+            "SELECT size, mtime, hash, parser_id, mime_type, description,"
+            " content_size, fields FROM entry WHERE device=? AND inode=?",
+            (device, inode)).fetchone()
+        if row is None or row[0] != size or row[1] != mtime:
+            self.misses += 1
+            return None
+        if self.verify_hash and row[2] != contentHash(filename, size):
+            self.misses += 1
+            return None
+        try:
+            paths, values = marshal.loads(str(row[7]))
+            values = dict((path, decodeValue(value))
+                for path, value in values.iteritems())
+        except (ValueError, TypeError, EOFError, AttributeError):
+            # Invalid data (eg. written by an older version): parse again
+            paths = None
+        if paths is None \
+        or row[3] and not set(self.fields).issubset(paths):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._used += 1
+        self.db.execute("UPDATE entry SET used=? WHERE device=? AND inode=?",
+            (self._used, device, inode))
+        self._changed()
+        return CacheEntry(row[3], row[4], row[5], row[6], values)
+
+    def _readFields(self, parser):
+        values = {}
+        for path in self.fields:
+            try:
+                field = parser[path]
+                if not field.is_field_set and field.hasValue():
+                    value = field.value
+                    if encodeValue(value) is not None:
+                        values[path] = value
+            except (MissingField, HACHOIR_ERRORS):
+                pass
+        return values
+
+    def store(self, filename, parser):
+        """
+        Store the result of the parser of a file (parser may be None if
+        no parser was found), returns its CacheEntry.
+        """
+        (device, inode), (size, mtime) = self._stat(filename)
+        if parser is not None:
+            entry = CacheEntry(parser.PARSER_TAGS["id"], parser.mime_type,
+                parser.description, parser.content_size, self._readFields(parser))
+        else:
+            entry = CacheEntry(None, None, None, None, {})
+        if self.verify_hash:
+            hash = contentHash(filename, size)
+        else:
+            hash = None
+        values = dict((path, encodeValue(value))
+            for path, value in entry.fields.iteritems())
+        fields = sqlite3.Binary(marshal.dumps((self.fields, values)))
+        self._used += 1
+        replaced = self.db.execute(
+            "DELETE FROM entry WHERE device=? AND inode=?", (device, inode)).rowcount
+        self.db.execute("INSERT INTO entry VALUES (?,?,?,?,?,?,?,?,?,?,?)",
+            (device, inode, size, mtime, hash, entry.parser_id, entry.mime_type,
+             entry.description, entry.content_size, fields, self._used))
+        if not replaced:
+            self._count += 1
+        if self.max_entries < self._count:
+            self._evict()
+        self._changed()
+        return entry
+
+    def _evict(self):
+        """
+        Delete the least recently used files: keep 90% of max_entries
+        to not evict on each new file.
+        """
+        count = self._count - max(self.max_entries * 9 // 10, 1)
+        self.db.execute("DELETE FROM entry WHERE used IN"
+            " (SELECT used FROM entry ORDER BY used LIMIT ?)", (count,))
+        self._count -= count
+
+    def createParser(self, filename, real_filename=None, tags=None):
+        """
+        Create a parser as hachoir_parser.createParser() does. If the file
+        is cached, the parser is not guessed again and its MIME type,
+        description and content size are not computed again.
+        """
+        if not real_filename:
+            real_filename = filename
+        entry = self.get(real_filename)
+        tags = list(tags or [])
+        if entry is not None:
+            if entry.parser_id is None:
+                return None
+            tags.insert(0, ("id", entry.parser_id))
+        stream = FileInputStream(filename, real_filename, tags=tags)
+        parser = guessParser(stream)
+        if entry is None:
+            self.store(real_filename, parser)
+        elif parser is not None \
+        and parser.PARSER_TAGS["id"] == entry.parser_id:
+            parser._mime_type = entry.mime_type
+            parser._description = entry.description
+            parser._content_size = entry.content_size
+        return parser
@@ -1,4 +1,6 @@
 from hachoir_core.field import CompressedField
+from hachoir_core.field.sub_file import CompressedStream
+from hachoir_core.stream import InputIOStream, InputStreamError
 
 try:
     from zlib import decompressobj, MAX_WBITS
@@ -25,9 +27,24 @@ try:
         else:
             CompressedField(field, DeflateStream)
         return field
+
+    def DeflateInputStream(stream, wbits=True, **args):
+        """
+        Create an input stream of the decompressed content of 'stream'
+        (eg. an InputSubStream of a compressed member). Use the 'size'
+        argument (in bits) if the decompressed size is known.
+        """
+        if wbits:
+            decompressor = DeflateStreamWbits
+        else:
+            decompressor = DeflateStream
+        args.setdefault("source", "Compressed source: '%s'" % stream.source)
+        return InputIOStream(CompressedStream(stream, decompressor), **args)
     has_deflate = True
 except ImportError:
     def Deflate(field, wbits=True):
         return field
-    has_deflate = False
 
+    def DeflateInputStream(stream, wbits=True, **args):
+        raise InputStreamError("Unable to decompress %s: zlib is missing" % stream.source)
+    has_deflate = False
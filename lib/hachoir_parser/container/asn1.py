@@ -35,6 +35,15 @@ Encodings:
 * Generic String Encoding Rules (GSER)
 => Are encodings compatibles? Which encodings are supported??
 
+Big files (eg. CRL with many revoked certificates) can be read with a
+TLVWalker: it iterates on the objects without recursion and without
+creating fields, values are decoded on demand:
+
+    walker = TLVWalker(stream)
+    for depth, tag, offset, length in walker:
+        if tag == TAG_INTEGER:
+            serial = walker.decodeValue(tag, offset, length)
+
 Author: Victor Stinner
 Creation date: 24 september 2006
 """
@@ -49,6 +58,294 @@ from hachoir_core.tools import createDict, humanDatetime
 from hachoir_core.stream import InputStreamError
 from hachoir_core.text_handler import textHandler
 
+# Identifier octets of some universal types (tags of TLVWalker events)
+TAG_BOOLEAN = 0x01
+TAG_INTEGER = 0x02
+TAG_BIT_STRING = 0x03
+TAG_OCTET_STRING = 0x04
+TAG_NULL = 0x05
+TAG_OBJECT_ID = 0x06
+TAG_ENUMERATED = 0x0A
+TAG_UTF8_STRING = 0x0C
+TAG_SEQUENCE = 0x30
+TAG_SET = 0x31
+
+# Size in bytes of the blocks read by TLVWalker
+BLOCK_SIZE = 65536
+
+# Maximum depth of nested constructed objects
+MAX_DEPTH = 256
+
+# Charset of the universal string types decoded by TLVWalker.decodeValue()
+STRING_CHARSET = {
+    12: "UTF-8",
+    18: "ASCII", 19: "ASCII", 22: "ASCII", 23: "ASCII", 24: "ASCII",
+    25: "ASCII", 26: "ASCII", 27: "ASCII",
+    20: "ISO-8859-1", 21: "ISO-8859-1",
+    28: "UTF-32-BE",
+    30: "UTF-16-BE",
+}
+
+# --- TLV walker ---
+
+def decodeHeader(data, pos=0):
+    """
+    Decode the identifier and length octets of an object at data[pos:].
+    Returns (tag, constructed, content_pos, length): tag is the value of the
+    identifier octets (big endian), length is None for the indefinite
+    length form. Raise IndexError if data are truncated.
+
+    >>> decodeHeader("\\x30\\x82\\x01\\x00")
+    (48, True, 4, 256)
+    >>> decodeHeader("\\x9f\\x81\\x00\\x80")
+    (10453248, False, 4, None)
+    """
+    first = ord(data[pos])
+    pos += 1
+    tag = first
+    if first & 31 == 31:
+        # High tag number: 7 bits per byte
+        while True:
+            byte = ord(data[pos])
+            pos += 1
+            tag = (tag << 8) | byte
+            if not (byte & 128):
+                break
+            if tag >> 48:
+                raise ParserError("ASN.1: tag number is too big")
+    length = ord(data[pos])
+    pos += 1
+    if length & 128:
+        count = length & 127
+        if not count:
+            length = None
+        elif 8 < count:
+            raise ParserError("ASN.1: length is too big (%s bytes)" % count)
+        else:
+            end = pos + count
+            if len(data) < end:
+                raise IndexError("truncated length")
+            length = 0
+            for char in data[pos:end]:
+                length = (length << 8) | ord(char)
+            pos = end
+    return (tag, bool(first & 32), pos, length)
+
+def splitTag(tag):
+    """
+    Split a tag (value of the identifier octets) into (class, constructed,
+    number): class is 0 (universal), 1 (application), 2 (context) or 3
+    (private).
+
+    >>> splitTag(0x30)
+    (0, True, 16)
+    >>> splitTag(0xA3)
+    (2, True, 3)
+    >>> splitTag(0x9f8100)
+    (2, False, 128)
+    """
+    if tag <= 0xFF:
+        return (tag >> 6, bool(tag & 32), tag & 31)
+    number = 0
+    shift = 0
+    while 0xFF < tag:
+        number |= (tag & 127) << shift
+        shift += 7
+        tag >>= 8
+    return (tag >> 6, bool(tag & 32), number)
+
+def decodeInteger(data):
+    """
+    Decode a signed big endian integer.
+
+    >>> decodeInteger("\\x01\\x00"), decodeInteger("\\xff"), decodeInteger("")
+    (256, -1, 0)
+    """
+    if not data:
+        return 0
+    value = int(data.encode("hex"), 16)
+    if ord(data[0]) & 128:
+        value -= 1 << (len(data) * 8)
+    return value
+
+def decodeObjectID(data):
+    """
+    Decode an object identifier to a dotted string.
+
+    >>> decodeObjectID("\\x2a\\x86\\x48\\x86\\xf7\\x0d\\x01\\x01\\x05")
+    '1.2.840.113549.1.1.5'
+    """
+    items = []
+    value = 0
+    for char in data:
+        byte = ord(char)
+        value = (value << 7) | (byte & 127)
+        if not (byte & 128):
+            items.append(value)
+            value = 0
+    if not items:
+        return ""
+    first = items[0]
+    if first < 80:
+        items[0:1] = divmod(first, 40)
+    else:
+        items[0:1] = (2, first - 80)
+    return ".".join(str(item) for item in items)
+
+class TLVWalker(object):
+    """
+    Iterate on the objects (TLV: tag, length, value) of DER/BER data using
+    an explicit stack: the iterator yields (depth, tag, offset, length)
+    events in document order, where offset is the address in bytes of the
+    content (relative to the start address of the walker) and length is the
+    content length in bytes (None for the BER indefinite length form).
+    Constructed objects deeper than max_depth are not entered.
+
+    The data are read by blocks of block_size bytes.
+    """
+    def __init__(self, stream, address=0, size=None, max_depth=MAX_DEPTH,
+    block_size=BLOCK_SIZE):
+        """
+        @param address: Start address in bits (multiple of 8)
+        @param size: Size in bytes of the data, None for the end of stream
+        """
+        assert address % 8 == 0
+        self.stream = stream
+        self.address = address
+        self.size = size
+        self.max_depth = max_depth
+        self.block_size = block_size
+        self._data = ""
+        self._data_offset = 0
+
+    def _getEnd(self):
+        if self.size is None:
+            if self.stream.size is None:
+                # Force the stream to read all data
+                self.stream.sizeGe(1 << 62)
+            self.size = self.stream.size // 8 - self.address // 8
+        return self.size
+
+    def read(self, offset, size):
+        """
+        Read size bytes at offset (in bytes), using the block buffer for
+        small reads.
+        """
+        start = offset - self._data_offset
+        if 0 <= start and start + size <= len(self._data):
+            return self._data[start:start+size]
+        end = self._getEnd()
+        if end < offset + size:
+            raise ParserError("ASN.1: object at offset %s is truncated" % offset)
+        if self.block_size <= size:
+            return self.stream.readBytes(self.address + offset * 8, size)
+        block_size = min(self.block_size, end - offset)
+        self._data = self.stream.readBytes(self.address + offset * 8, block_size)
+        self._data_offset = offset
+        return self._data[:size]
+
+    def readHeader(self, offset):
+        """
+        Decode the object header at offset (in bytes).
+        Returns (tag, constructed, content_offset, length).
+        """
+        start = offset - self._data_offset
+        if 0 <= start and start + 20 <= len(self._data):
+            # Fast path: a header is at most 17 bytes long
+            tag, constructed, pos, length = decodeHeader(self._data, start)
+            return tag, constructed, self._data_offset + pos, length
+        data = self.read(offset, min(20, self._getEnd() - offset))
+        try:
+            tag, constructed, pos, length = decodeHeader(data)
+        except IndexError:
+            raise ParserError("ASN.1: object header at offset %s is truncated" % offset)
+        return tag, constructed, offset + pos, length
+
+    def __iter__(self):
+        end = self._getEnd()
+        max_depth = self.max_depth
+        read_header = self.readHeader
+        # Stack of the content end of the open constructed objects
+        # (None for indefinite length)
+        stack = []
+        offset = 0
+        while True:
+            while stack and stack[-1] is not None and stack[-1] <= offset:
+                if stack[-1] < offset:
+                    raise ParserError("ASN.1: object at offset %s overflows its parent" % offset)
+                stack.pop()
+            if end <= offset:
+                if stack:
+                    raise ParserError("ASN.1: truncated data")
+                break
+            tag, constructed, content, length = read_header(offset)
+            if not tag and stack and stack[-1] is None:
+                # End-of-contents of an indefinite length object
+                if length != 0:
+                    raise ParserError("ASN.1: invalid end-of-contents at offset %s" % offset)
+                stack.pop()
+                offset = content
+                continue
+            yield (len(stack), tag, content, length)
+            if constructed and len(stack) < max_depth:
+                if length is None:
+                    stack.append(None)
+                else:
+                    stack.append(content + length)
+                offset = content
+            elif length is None:
+                if not constructed:
+                    raise ParserError("ASN.1: primitive object with indefinite length at offset %s" % offset)
+                offset = self.skip(content)
+            else:
+                offset = content + length
+
+    def skip(self, offset):
+        """
+        Skip the content of an indefinite length object starting at offset
+        (in bytes). Returns the offset after its end-of-contents.
+        """
+        depth = 1
+        while depth:
+            tag, constructed, content, length = self.readHeader(offset)
+            if length is None:
+                depth += 1
+                offset = content
+            elif not tag and not length:
+                depth -= 1
+                offset = content
+            else:
+                offset = content + length
+        return offset
+
+    def decodeValue(self, tag, offset, length):
+        """
+        Decode the content of an object: Python object for the universal
+        primitive types (bool, integer, object identifier as a dotted
+        string, unicode for strings and times, None for NULL, tuple
+        (unused bits, bytes) for bit strings), raw bytes otherwise.
+        """
+        if length is None:
+            raise ParserError("ASN.1: unable to decode an indefinite length value")
+        data = self.read(offset, length)
+        if 31 <= tag:
+            return data
+        if tag == TAG_INTEGER or tag == TAG_ENUMERATED:
+            return decodeInteger(data)
+        if tag == TAG_OBJECT_ID:
+            return decodeObjectID(data)
+        if tag == TAG_BOOLEAN:
+            return data != "\0"
+        if tag == TAG_NULL:
+            return None
+        if tag == TAG_BIT_STRING:
+            if not data:
+                raise ParserError("ASN.1: empty bit string")
+            return (ord(data[0]), data[1:])
+        if tag in STRING_CHARSET:
+            return unicode(data, STRING_CHARSET[tag], "replace")
+        return data
+
 # --- Field parser ---
 
 class ASNInteger(Field):
@@ -136,7 +433,7 @@ def readBoolean(self, content_size):
 
 def readInteger(self, content_size):
     # Always signed?
-    yield GenericInteger(self, "value", True, content_size*8)
+    yield GenericInteger(self, "value", True, BIG_ENDIAN, content_size*8)
 
 # --- Format ---
 
@@ -217,19 +514,35 @@ class Object(FieldSet):
 
     def __init__(self, *args, **kw):
         FieldSet.__init__(self, *args, **kw)
-        key = self["type"].value & 31
-        if self['class'].value == 0:
+        # Decode the header from the raw data: the fields are only created
+        # by createFields()
+        addr = self.absolute_address
+        size = 10
+        if self.stream.size is not None:
+            size = min(size, (self.stream.size - addr) // 8)
+        if size < 2:
+            raise ParserError("ASN.1: truncated object header")
+        data = self.stream.readBytes(addr, size)
+        try:
+            tag, constructed, pos, length = decodeHeader(data)
+        except IndexError:
+            raise ParserError("ASN.1: truncated object header")
+        if length is None:
+            raise ParserError("ASN.1: indefinite length is not supported")
+        klass = ord(data[0]) >> 6
+        key = ord(data[0]) & 31
+        if key == 31:
+            raise ParserError("ASN.1 Object: tag bigger than 30 are not supported")
+        if klass == 0:
             # universal object
             if key in self.TYPE_INFO:
                 self._name, self._handler, self._description, create_desc = self.TYPE_INFO[key]
                 if create_desc:
                     self.createDescription = lambda: "%s: %s" % (self.TYPE_INFO[key][2], create_desc(self))
                     self._description = None
-            elif key == 31:
-                raise ParserError("ASN.1 Object: tag bigger than 30 are not supported")
             else:
                 self._handler = None
-        elif self['form'].value:
+        elif constructed:
             # constructed: treat as sequence
             self._name = 'seq[]'
             self._handler = readSequence
@@ -238,9 +551,8 @@ class Object(FieldSet):
             # primitive, context/private
             self._name = 'raw[]'
             self._handler = readASCIIString
-            self._description = '%s object type %i' % (self['class'].display, key)
-        field = self["size"]
-        self._size = field.address + field.size + field.value*8
+            self._description = '%s object type %i' % (self.CLASS_DESC[klass], key)
+        self._size = (pos + length) * 8
 
     def createFields(self):
         yield Enum(Bits(self, "class", 2), self.CLASS_DESC)
@@ -280,3 +592,9 @@ class ASN1File(Parser):
     def createFields(self):
         yield Object(self, "root")
 
+    def createWalker(self, max_depth=MAX_DEPTH):
+        """
+        Create a TLVWalker iterating on all objects of the file.
+        """
+        return TLVWalker(self.stream, max_depth=max_depth)
+
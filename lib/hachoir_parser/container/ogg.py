@@ -3,6 +3,11 @@
 # Author Julien Muchembled <jm AT jm10.no-ip.com>
 # Created: 10 june 2006
 #
+# OggFile.findLastPage() reads the end of the file backwards to find the
+# last valid page, and OggFile.seekTime() finds a page of a logical stream
+# by bisection on the granule positions: the duration and the content
+# size only read a few pages.
+#
 
 from hachoir_parser import Parser
 from hachoir_core.field import (Field, FieldSet, createOrphanField,
@@ -13,9 +18,108 @@ from hachoir_core.stream import FragmentedStream, InputStreamError
 from hachoir_core.endian import LITTLE_ENDIAN, BIG_ENDIAN
 from hachoir_core.tools import humanDurationNanosec
 from hachoir_core.text_handler import textHandler, hexadecimal
+from datetime import timedelta
+from struct import unpack, error as struct_error
 
 MAX_FILESIZE = 1000 * 1024 * 1024
 
+# Size in bytes of the first window read by findLastPage() (it is doubled
+# up to MAX_BACKWARD_SIZE), and of the blocks read to find the next page
+PAGE_WINDOW_SIZE = 8 * 1024
+MAX_BACKWARD_SIZE = 1024 * 1024
+
+# Maximum number of pages walked by findEndPage()
+MAX_WALK_PAGES = 100000
+
+# Maximum size in bytes of a page: header, lacing and 255 segments
+MAX_PAGE_SIZE = 27 + 255 + 255 * 255
+
+# Granule position of pages where no packet ends
+NO_GRANULE = 2**64 - 1
+
+# Page checksum: CRC-32 (polynom 0x04C11DB7, not reflected)
+def _createCRC32Table():
+    table = []
+    for value in xrange(256):
+        value <<= 24
+        for bit in xrange(8):
+            if value & 0x80000000:
+                value = ((value << 1) ^ 0x04C11DB7) & 0xFFFFFFFF
+            else:
+                value = (value << 1) & 0xFFFFFFFF
+        table.append(value)
+    return table
+CRC32_TABLE = _createCRC32Table()
+
+def pageChecksum(data):
+    """
+    Compute the checksum of a page (with its checksum field set to zero).
+
+    >>> pageChecksum("OggS")
+    1605413199
+    """
+    table = CRC32_TABLE
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ table[(crc >> 24) ^ ord(byte)]
+    return crc
+
+def decodePageHeader(data, pos):
+    """
+    Decode the page header at data[pos:]: returns (flags, granule position,
+    serial, page number, page size in bytes), or None if the header is
+    invalid or incomplete.
+    """
+    if len(data) < pos + 27 or data[pos:pos+5] != "OggS\0":
+        return None
+    flags, granule, serial, page = unpack("<BQII", data[pos+5:pos+22])
+    lacing_size = ord(data[pos+26])
+    end = pos + 27 + lacing_size
+    if len(data) < end:
+        return None
+    size = 27 + lacing_size + sum(bytearray(data[pos+27:end]))
+    return flags, granule, serial, page, size
+
+def checkPage(data, pos):
+    """
+    Check the checksum of the complete page at data[pos:].
+    """
+    header = decodePageHeader(data, pos)
+    if header is None or len(data) < pos + header[4]:
+        return False
+    page = data[pos:pos+header[4]]
+    checksum = unpack("<I", page[22:26])[0]
+    return pageChecksum(page[:22] + "\0\0\0\0" + page[26:]) == checksum
+
+def decodeGranuleRate(packet):
+    """
+    Read the first packet of a logical stream to get the meaning of its
+    granule positions: returns (codec, rate, granule shift, pre-skip),
+    the time of a granule position being (granule - pre-skip) / rate,
+    or None if the codec is unknown. For Theora, the granule position is
+    split at granule shift bits into keyframe number and frame offset.
+    """
+    try:
+        if packet.startswith("\x01vorbis"):
+            return "vorbis", unpack("<I", packet[12:16])[0], 0, 0
+        if packet.startswith("OpusHead"):
+            # Granule positions always use 48 kHz
+            return "opus", 48000, 0, unpack("<H", packet[10:12])[0]
+        if packet.startswith("\x80theora"):
+            num, den = unpack(">II", packet[22:30])
+            if not den:
+                return None
+            shift = (unpack(">H", packet[40:42])[0] >> 5) & 31
+            return "theora", float(num) / den, shift, 0
+        if packet.startswith("\x7fFLAC"):
+            # STREAMINFO metadata block of the native FLAC header
+            return "flac", unpack(">I", packet[27:31])[0] >> 12, 0, 0
+        if packet.startswith("Speex   "):
+            return "speex", unpack("<I", packet[36:40])[0], 0, 0
+    except struct_error:
+        pass
+    return None
+
 class XiphInt(Field):
     """
     Positive integer with variable size. Values bigger than 254 are stored as
@@ -221,7 +325,7 @@ class OggPage(FieldSet):
     def createFields(self):
         yield String(self, 'capture_pattern', 4, charset="ASCII")
         if self['capture_pattern'].value != self.MAGIC:
-            self.warning('Invalid signature. An Ogg page must start with "%s".' % self.MAGIC)
+            self.warning('Invalid signature. An Ogg page must start with "%s".', self.MAGIC)
         yield UInt8(self, 'stream_structure_version')
         yield Bit(self, 'continued_packet')
         yield Bit(self, 'first_page')
@@ -261,6 +365,10 @@ class OggFile(Parser):
     }
     endian = LITTLE_ENDIAN
 
+    def __init__(self, stream, **args):
+        Parser.__init__(self, stream, **args)
+        self._logical_streams = None
+
     def validate(self):
         magic = OggPage.MAGIC
         if self.stream.readBytes(0, len(magic)) != magic:
@@ -301,34 +409,215 @@ class OggFile(Parser):
         while not self.eof:
             yield OggPage(self, "page[]")
 
-    def createLastPage(self):
-        start = self[0].size
-        end = MAX_FILESIZE * 8
-        if True:
-            # FIXME: This doesn't work on all files (eg. some Ogg/Theora)
-            offset = self.stream.searchBytes("OggS\0\5", start, end)
-            if offset is None:
-                offset = self.stream.searchBytes("OggS\0\4", start, end)
-            if offset is None:
-                return None
-            return createOrphanField(self, offset, OggPage, "page")
-        else:
-            # Very slow version
-            page = None
+    def findLastPage(self, serial=None):
+        """
+        Find the last valid page (checksum checked) of the file, or of the
+        logical stream serial, by reading the end of the file backwards.
+        Returns (offset in bytes, flags, granule position, serial, page
+        number, size in bytes), or None if no page is found in the last
+        MAX_BACKWARD_SIZE bytes.
+        """
+        if self.stream.size is None:
+            return None
+        end = self.stream.size // 8
+        data = ""
+        data_offset = end
+        window = PAGE_WINDOW_SIZE
+        while 0 < data_offset:
+            # Scan the new window and the start of the previous one (the
+            # beginning of a page may be in the previous window)
+            start = max(data_offset - window, end - MAX_BACKWARD_SIZE, 0)
+            scan_end = min(len(data), 4) + (data_offset - start)
+            data = self.stream.readBytes(start * 8, data_offset - start) + data
+            data_offset = start
+            pos = scan_end
             while True:
-                offset = self.stream.searchBytes("OggS\0", start, end)
-                if offset is None:
+                pos = data.rfind("OggS", 0, pos)
+                if pos < 0:
                     break
-                page = createOrphanField(self, offset, OggPage, "page")
-                start += page.size
-            return page
+                header = decodePageHeader(data, pos)
+                if header is not None \
+                and (serial is None or header[2] == serial) \
+                and checkPage(data, pos):
+                    return (data_offset + pos,) + header
+                pos += 3
+            if MAX_BACKWARD_SIZE <= end - data_offset:
+                break
+            window *= 2
+        return None
+
+    def findNextPage(self, start, end=None, serial=None, granule=False):
+        """
+        Find the first valid page starting in [start, end) (in bytes), of
+        the logical stream serial if it is not None. If granule is True,
+        skip the pages without granule position. Returns the same tuple
+        than findLastPage(), or None.
+        """
+        stream = self.stream
+        stream_end = stream.size // 8
+        if end is None or stream_end < end:
+            end = stream_end
+        while start < end:
+            size = min(PAGE_WINDOW_SIZE, end - start)
+            # end only bounds the start of the page: read the 3 next bytes
+            # to find a sync code starting at the end of the window
+            data = stream.readBytes(start * 8, min(size + 3, stream_end - start))
+            pos = 0
+            while True:
+                pos = data.find("OggS", pos, size + 3)
+                if pos < 0:
+                    break
+                offset = start + pos
+                header = decodePageHeader(stream.readBytes(offset * 8,
+                    min(27 + 255, stream_end - offset)), 0)
+                if header is not None \
+                and (serial is None or header[2] == serial) \
+                and not (granule and header[1] == NO_GRANULE):
+                    page = stream.readBytes(offset * 8, min(header[4], stream_end - offset))
+                    if checkPage(page, 0):
+                        return (offset,) + header
+                pos += 1
+            start += size
+        return None
+
+    def getLogicalStreams(self):
+        """
+        Read the beginning of stream pages: returns a dictionary serial =>
+        (codec, rate, granule shift, pre-skip), see decodeGranuleRate().
+        """
+        if self._logical_streams is not None:
+            return self._logical_streams
+        streams = {}
+        offset = 0
+        while True:
+            page = self.findNextPage(offset, offset + MAX_PAGE_SIZE)
+            if page is None or not (page[1] & 2) or page[3] in streams:
+                break
+            data = self.stream.readBytes(page[0] * 8, page[5])
+            lacing_size = ord(data[26])
+            # The first packet of a stream is alone in its page
+            streams[page[3]] = decodeGranuleRate(data[27 + lacing_size:])
+            offset = page[0] + page[5]
+        self._logical_streams = streams
+        return streams
+
+    def getGranuleTime(self, serial, granule):
+        """
+        Convert a granule position of the logical stream serial to seconds
+        (float), or None if the codec is unknown.
+        """
+        info = self.getLogicalStreams().get(serial)
+        if info is None or granule == NO_GRANULE:
+            return None
+        codec, rate, shift, pre_skip = info
+        if not rate:
+            return None
+        if shift:
+            granule = (granule >> shift) + (granule & ((1 << shift) - 1))
+        return max(granule - pre_skip, 0) / float(rate)
+
+    def getDuration(self):
+        """
+        Duration of the longest logical stream, computed from the granule
+        position of its last page: returns a timedelta or None.
+        """
+        duration = None
+        for serial in self.getLogicalStreams():
+            page = self.findLastPage(serial)
+            if page is None:
+                continue
+            seconds = self.getGranuleTime(serial, page[2])
+            if seconds is not None and (duration is None or duration < seconds):
+                duration = seconds
+        if duration is None:
+            return None
+        return timedelta(seconds=duration)
+
+    def seekTime(self, serial, seconds):
+        """
+        Find the first page of the logical stream serial which ends after
+        the time seconds (its packets contain this time), by bisection on
+        the granule positions. Returns the offset of the page (in bytes),
+        or None if the time is after the end of the stream.
+        """
+        if serial not in self.getLogicalStreams():
+            raise ParserError("Ogg: unknown logical stream %s" % serial)
+        low = 0
+        high = self.stream.size // 8
+        found = None
+        while low < high:
+            middle = (low + high) // 2
+            page = self.findNextPage(middle, high, serial, True)
+            if page is None:
+                high = middle
+                continue
+            time = self.getGranuleTime(serial, page[2])
+            if time is None:
+                raise ParserError("Ogg: unknown granule position format")
+            if seconds < time:
+                found = page[0]
+                high = middle
+            else:
+                low = page[0] + page[5]
+        return found
+
+    def findEndPage(self):
+        """
+        Hop over the pages from the start of the file, reading only their
+        header, up to the end of stream page of the last logical stream
+        which begins at the start of the file, or up to the last complete
+        page (truncated file or followed by other data). Only the checksum
+        of this last page is checked. Returns the end offset (in bytes) of
+        the page, or None.
+        """
+        streams = set(self.getLogicalStreams())
+        if not streams:
+            return None
+        stream = self.stream
+        end = min(stream.size // 8, MAX_FILESIZE)
+        offset = 0
+        last = None
+        for index in xrange(MAX_WALK_PAGES):
+            if end < offset + 27:
+                break
+            header = decodePageHeader(stream.readBytes(offset * 8,
+                min(27 + 255, end - offset)), 0)
+            if header is None or end < offset + header[4]:
+                break
+            last = offset
+            offset += header[4]
+            if header[0] & 4:
+                streams.discard(header[2])
+                if not streams:
+                    break
+        else:
+            return None
+        if last is None \
+        or not checkPage(stream.readBytes(last * 8, offset - last), 0):
+            return None
+        return offset
+
+    def createLastPage(self):
+        page = self.findLastPage()
+        if page is None:
+            return None
+        return createOrphanField(self, page[0] * 8, OggPage, "page")
 
     def createContentSize(self):
-        page = self.createLastPage()
-        if page:
-            return page.absolute_address + page.size
-        else:
+        if self.stream.size is None:
+            return None
+        # Fast path: the last page of the stream belongs to a logical stream
+        # of this file. Otherwise, the stream may contain another Ogg file
+        # after this one (eg. subfile search): walk the pages.
+        page = self.findLastPage()
+        if page is not None \
+        and page[3] in self.getLogicalStreams() \
+        and page[0] + page[5] <= MAX_FILESIZE:
+            return (page[0] + page[5]) * 8
+        end = self.findEndPage()
+        if end is None:
             return None
+        return end * 8
 
 
 class OggStream(Parser):
@@ -27,6 +27,10 @@ Changelog:
 Thanks to:
    * Wojtek Kaniewski (wojtekka AT logonet.com.pl) for its CDA file
      format information
+
+AVI index: RiffFile.getAVIIndex() jumps from chunk to chunk using their
+sizes (the movie data are never read) and decodes the OpenDML indexes
+("indx" super indexes) or the "idx1" index in bulk into per-stream arrays.
 """
 
 from hachoir_parser import Parser
@@ -40,7 +44,28 @@ from hachoir_core.endian import LITTLE_ENDIAN
 from hachoir_core.text_handler import filesizeHandler, textHandler
 from hachoir_parser.video.fourcc import audio_codec_name, video_fourcc_name
 from hachoir_parser.image.ico import IcoFile
+from hachoir_core.tools import createOffsetArray
 from datetime import timedelta
+from bisect import bisect_right
+from struct import unpack
+from array import array
+import sys
+
+# idx1 flag of keyframes
+AVIIF_KEYFRAME = 0x10
+
+# OpenDML index types (bIndexType)
+AVI_INDEX_OF_INDEXES = 0
+AVI_INDEX_OF_CHUNKS = 1
+
+# Maximum size in bytes of an index chunk read by getAVIIndex()
+MAX_INDEX_SIZE = 256 * 1024 * 1024
+
+# Array type code of unsigned 32-bit integers
+for _typecode in "IL":
+    if array(_typecode).itemsize == 4:
+        UINT32_TYPECODE = _typecode
+        break
 
 def parseText(self):
     yield String(self, "text", self["size"].value,
@@ -155,7 +180,7 @@ def parseCDDA(self):
 def parseWAVFormat(self):
     size = self["size"].value
     if size not in (16, 18):
-        self.warning("Format with size of %s bytes is not supported!" % size)
+        self.warning("Format with size of %s bytes is not supported!", size)
     yield Enum(UInt16(self, "codec", "Audio codec"), audio_codec_name)
     yield UInt16(self, "nb_channel", "Number of audio channel")
     yield UInt32(self, "sample_per_sec", "Sample per second")
@@ -318,7 +343,7 @@ class ChunkWAVE(Chunk):
 def parseAnimationHeader(self):
     yield UInt32(self, "hdr_size", "Size of header (36 bytes)")
     if self["hdr_size"].value != 36:
-        self.warning("Animation header with unknown size (%s)" % self["size"].value)
+        self.warning("Animation header with unknown size (%s)", self["size"].value)
     yield UInt32(self, "nb_frame", "Number of unique Icons in this cursor")
     yield UInt32(self, "nb_step", "Number of Blits before the animation cycles")
     yield UInt32(self, "cx")
@@ -353,6 +378,57 @@ class ChunkACON(Chunk):
         'icon': ("icon[]", parseIcon, "Icon"),
     })
 
+class AVIStreamIndex(object):
+    """
+    Index of the chunks of an AVI stream: one entry per chunk (frame) with
+    the address of its data (in bytes), its size (in bytes) and a keyframe
+    flag. keyframes is the sorted array of the keyframe numbers.
+    """
+    def __init__(self):
+        self.offset = createOffsetArray()
+        self.size = array('L')
+        self.keyframe = array('B')
+        self.keyframes = array('L')
+
+    def append(self, offset, size, keyframe):
+        if keyframe:
+            self.keyframes.append(len(self.offset))
+        self.offset.append(offset)
+        self.size.append(size)
+        self.keyframe.append(keyframe)
+
+    def __len__(self):
+        return len(self.offset)
+
+    def __getitem__(self, index):
+        return (int(self.offset[index]), self.size[index], bool(self.keyframe[index]))
+
+    def __iter__(self):
+        for index in xrange(len(self.offset)):
+            yield self[index]
+
+    def findKeyframe(self, frame):
+        """
+        Find the last keyframe before or at frame: returns its number, or
+        None if there is no such keyframe.
+        """
+        index = bisect_right(self.keyframes, frame)
+        if not index:
+            return None
+        return self.keyframes[index-1]
+
+def readUInt32Array(data):
+    """
+    Decode an array of unsigned little endian 32-bit integers.
+
+    >>> [int(value) for value in readUInt32Array("\\x01\\0\\0\\0\\0\\1\\0\\0")]
+    [1, 256]
+    """
+    values = array(UINT32_TYPECODE, data[:len(data) // 4 * 4])
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
 class RiffFile(Parser):
     PARSER_TAGS = {
         "id": "riff",
@@ -377,6 +453,10 @@ class RiffFile(Parser):
     }
     endian = LITTLE_ENDIAN
 
+    def __init__(self, stream, **args):
+        Parser.__init__(self, stream, **args)
+        self._avi_index = None
+
     def validate(self):
         if self.stream.readBytes(0, 4) != "RIFF":
             return "Wrong signature"
@@ -437,3 +517,135 @@ class RiffFile(Parser):
         except KeyError:
             return ".riff"
 
+    def iterChunks(self, start, end):
+        """
+        Walk the chunks from start to end (in bytes) using their sizes:
+        yield (address, tag, size, subtag) where subtag is None if the
+        chunk is not a LIST (or RIFF) chunk. Sub-chunks are not read.
+        """
+        stream = self.stream
+        while start + 8 <= end and stream.sizeGe((start + 8) * 8):
+            header = stream.readBytes(start * 8, 12)
+            tag = header[:4]
+            size = unpack("<I", header[4:8])[0]
+            if tag in ("LIST", "RIFF") and 12 <= len(header):
+                subtag = header[8:12]
+            else:
+                subtag = None
+            yield start, tag, size, subtag
+            start += 8 + alignValue(size, 2)
+
+    def _readAVIHeaders(self):
+        # Returns (streams, movies, idx1) where streams is the list of
+        # (stream type, indx address and size or None), movies the list of
+        # the address of the "movi" sub-tags and idx1 the address and size
+        # of the idx1 chunk data (or None)
+        streams = []
+        movies = []
+        idx1 = None
+        # The OpenDML extension adds "RIFF AVIX" chunks after the first one
+        for riff, tag, riff_size, riff_type in self.iterChunks(0, self.stream.size // 8):
+            if tag != "RIFF":
+                break
+            end = riff + 8 + riff_size
+            for chunk, tag, size, subtag in self.iterChunks(riff + 12, end):
+                if subtag == "movi":
+                    movies.append(chunk + 8)
+                elif tag == "idx1" and idx1 is None:
+                    idx1 = (chunk + 8, size)
+                elif subtag == "hdrl" and not streams:
+                    for strl, tag, strl_size, subtag in self.iterChunks(chunk + 12, chunk + 8 + size):
+                        if subtag != "strl":
+                            continue
+                        stream_type = None
+                        indx = None
+                        for item, tag, item_size, subtag in self.iterChunks(strl + 12, strl + 8 + strl_size):
+                            if tag == "strh":
+                                stream_type = self.stream.readBytes((item + 8) * 8, 4)
+                            elif tag == "indx":
+                                indx = (item + 8, item_size)
+                        streams.append((stream_type, indx))
+        return streams, movies, idx1
+
+    def _readIndexChunk(self, address, size):
+        if MAX_INDEX_SIZE < size:
+            raise ParserError("RIFF: index chunk is too big")
+        return self.stream.readBytes(address * 8, size)
+
+    def _readODMLIndex(self, index, address, size):
+        # Read an OpenDML super index and its standard indexes
+        data = self._readIndexChunk(address, size)
+        if len(data) < 24:
+            raise ParserError("RIFF: invalid OpenDML index")
+        longs, subtype, index_type, count = unpack("<HBBI", data[:8])
+        if index_type == AVI_INDEX_OF_CHUNKS:
+            standard = [address - 8]
+        elif index_type == AVI_INDEX_OF_INDEXES and longs == 4:
+            values = readUInt32Array(data[24:24 + count * 16])
+            standard = [values[pos] | (values[pos+1] << 32)
+                for pos in xrange(0, len(values) - 3, 4)]
+        else:
+            raise ParserError("RIFF: unknown OpenDML index type")
+        for address in standard:
+            # address of the "ix##" chunk header
+            size = unpack("<I", self.stream.readBytes((address + 4) * 8, 4))[0]
+            data = self._readIndexChunk(address + 8, size)
+            if len(data) < 24:
+                raise ParserError("RIFF: invalid OpenDML standard index")
+            longs, subtype, index_type, count = unpack("<HBBI", data[:8])
+            base = unpack("<Q", data[12:20])[0]
+            if index_type != AVI_INDEX_OF_CHUNKS or longs != 2:
+                raise ParserError("RIFF: unsupported OpenDML standard index")
+            values = readUInt32Array(data[24:24 + count * 8])
+            for offset, size in zip(values[0::2], values[1::2]):
+                # Bit 31 of the size is set for non keyframes
+                index.append(base + offset, size & 0x7FFFFFFF, not (size & 0x80000000))
+
+    def _readIdx1(self, indexes, movie, address, size):
+        values = readUInt32Array(self._readIndexChunk(address, size))
+        if not values:
+            return
+        # Offsets are relative to the "movi" sub-tag, or absolute
+        first_tag = self.stream.readBytes((movie + values[2]) * 8, 4)
+        if first_tag in (self.stream.readBytes(address * 8, 4), "LIST"):
+            base = movie + 8
+        else:
+            base = 8
+        for tag, flags, offset, size in zip(values[0::4], values[1::4], values[2::4], values[3::4]):
+            # Stream number: two ASCII digits
+            stream = (tag & 0xFF) - 48, ((tag >> 8) & 0xFF) - 48
+            if not(0 <= stream[0] <= 9 and 0 <= stream[1] <= 9):
+                continue
+            stream = stream[0] * 10 + stream[1]
+            if stream < len(indexes) and indexes[stream] is not None:
+                indexes[stream].append(base + offset, size, flags & AVIIF_KEYFRAME)
+
+    def getAVIIndex(self):
+        """
+        Read the index of an AVI file: returns a list of (stream type,
+        AVIStreamIndex) with one entry per stream. The OpenDML indexes are
+        used if present, otherwise the idx1 chunk. Raise a ParserError if
+        the file has no index.
+        """
+        if self._avi_index is not None:
+            return self._avi_index
+        if self["type"].value != "AVI ":
+            raise ParserError("RIFF: file is not an AVI video")
+        streams, movies, idx1 = self._readAVIHeaders()
+        result = [(stream_type, AVIStreamIndex()) for stream_type, indx in streams]
+        if streams and all(indx is not None for stream_type, indx in streams):
+            for (stream_type, indx), (stream_type, index) in zip(streams, result):
+                self._readODMLIndex(index, *indx)
+        elif idx1 is not None and movies:
+            self._readIdx1([index for stream_type, index in result], movies[0], *idx1)
+        else:
+            raise ParserError("RIFF: AVI file has no index")
+        self._avi_index = result
+        return result
+
+    def getAVIFrame(self, stream, frame):
+        """
+        Get the frame of a stream: returns (address of the data in bytes,
+        size in bytes, keyframe flag).
+        """
+        return self.getAVIIndex()[stream][1][frame]
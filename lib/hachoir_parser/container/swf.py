@@ -9,6 +9,10 @@ Documentation:
  - http://www.anotherbigidea.com/javaswf/
  - http://www.gnu.org/software/gnash/
 
+The header of a compressed file (CWS) is read by SwfFile.getHeader()
+which only inflates the first bytes, and SwfFile.iterTags() walks the tags
+on the inflated data without keeping their content.
+
 Author: Victor Stinner
 Creation date: 29 october 2006
 """
@@ -25,11 +29,26 @@ from hachoir_parser.image.jpeg import JpegChunk, JpegFile
 from hachoir_core.stream import StringInputStream, ConcatStream
 from hachoir_parser.common.deflate import Deflate, has_deflate
 from hachoir_parser.container.action_script import parseActionScript, parseABC
+from struct import unpack
 import math
+try:
+    from zlib import decompressobj
+except ImportError:
+    pass
 
 # Maximum file size (50 MB)
 MAX_FILE_SIZE = 50 * 1024 * 1024
 
+# Size in bytes of the compressed data read to decode the header
+PROBE_SIZE = 256
+
+# Size in bytes of the blocks read (and inflated) by iterTags()
+READ_BLOCK_SIZE = 64 * 1024
+
+# Maximum size in bytes of the header: RECT (5+4*31 bits), frame rate and
+# frame count
+MAX_HEADER_SIZE = 17 + 4
+
 TWIPS = 20
 
 class RECT(FieldSet):
@@ -364,6 +383,114 @@ class Tag(FieldSet):
     def createDescription(self):
         return "Tag: %s (%s)" % (self["code"].display, self["length"].display)
 
+class SwfReader(object):
+    """
+    Sequential reader of the uncompressed data of a SWF file: position is
+    the address (in bytes) in the uncompressed file, starting after the
+    8 bytes of the file header. Compressed data (CWS) are inflated by
+    blocks and skip() drops the inflated data.
+    """
+    def __init__(self, stream, compressed, block_size=READ_BLOCK_SIZE):
+        self.stream = stream
+        self.compressed = compressed
+        self.block_size = block_size
+        self.position = 8
+        self.offset = 8
+        self.end = stream.size // 8
+        self._buffer = ""
+        if compressed:
+            if not has_deflate:
+                raise ParserError("SWF: unable to inflate data, zlib is missing")
+            self._decompressor = decompressobj()
+
+    def _fill(self):
+        # Read the next block: returns False at the end of the data
+        if not self.compressed:
+            if self.end <= self.offset:
+                return False
+            size = min(self.block_size, self.end - self.offset)
+            data = self.stream.readBytes(self.offset * 8, size)
+        else:
+            decompressor = self._decompressor
+            if decompressor.unconsumed_tail:
+                data = decompressor.unconsumed_tail
+                size = 0
+            elif self.offset < self.end and not decompressor.unused_data:
+                size = min(self.block_size, self.end - self.offset)
+                data = self.stream.readBytes(self.offset * 8, size)
+            else:
+                return False
+            data = decompressor.decompress(data, self.block_size)
+        self.offset += size
+        self._buffer += data
+        return True
+
+    def read(self, size):
+        """
+        Read size bytes (less at the end of the data).
+        """
+        while len(self._buffer) < size and self._fill():
+            pass
+        data = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        self.position += len(data)
+        return data
+
+    def skip(self, size):
+        """
+        Skip size bytes: returns False if the end of the data is reached.
+        """
+        if not self.compressed:
+            self._buffer = ""
+            self.position += size
+            self.offset = self.position
+            return self.position <= self.end
+        while size:
+            if not self._buffer and not self._fill():
+                return False
+            count = min(size, len(self._buffer))
+            self._buffer = self._buffer[count:]
+            self.position += count
+            size -= count
+        return True
+
+    def getCompressedEnd(self):
+        """
+        Inflate all remaining data and returns the address (in bytes) of
+        the end of the compressed data (end of the deflate stream).
+        """
+        while self._fill():
+            self._buffer = ""
+        return self.offset - len(self._decompressor.unused_data)
+
+def decodeHeader(data):
+    """
+    Decode the header following the file header (RECT, frame rate and
+    frame count). Returns a dictionary, or None if data is too short.
+    """
+    if not data:
+        return None
+    nbits = ord(data[0]) >> 3
+    size = (5 + nbits * 4 + 7) // 8
+    if len(data) < size + 4:
+        return None
+    value = 0
+    for byte in data[:size]:
+        value = (value << 8) | ord(byte)
+    value >>= size * 8 - 5 - nbits * 4
+    mask = (1 << nbits) - 1
+    ymax, ymin, xmax, xmin = [(value >> (nbits * index)) & mask
+        for index in xrange(4)]
+    rate_fraction, rate, frame_count = unpack("<BBH", data[size:size+4])
+    return {
+        "xmin": xmin, "xmax": xmax, "ymin": ymin, "ymax": ymax,
+        "width": math.ceil(float(xmax) / TWIPS),
+        "height": math.ceil(float(ymax) / TWIPS),
+        "frame_rate": rate + rate_fraction / 256.0,
+        "frame_count": frame_count,
+        "header_size": 8 + size + 4,
+    }
+
 class SwfFile(Parser):
     VALID_VERSIONS = set(xrange(1, 10+1))
     PARSER_TAGS = {
@@ -381,6 +508,11 @@ class SwfFile(Parser):
     endian = LITTLE_ENDIAN
     SWF_SCALE_FACTOR = 1.0 / 20
 
+    def __init__(self, stream, **args):
+        Parser.__init__(self, stream, **args)
+        self._header = None
+        self._compressed_size = None
+
     def validate(self):
         if self.stream.readBytes(0, 3) not in ("FWS", "CWS"):
             return "Wrong file signature"
@@ -424,10 +556,70 @@ class SwfFile(Parser):
             desc.append("compressed")
         return u"Macromedia Flash data: %s" % (", ".join(desc))
 
+    def createReader(self, block_size=READ_BLOCK_SIZE):
+        """
+        Create a SwfReader positioned after the file header.
+        """
+        compressed = (self.stream.readBytes(0, 3) == "CWS")
+        return SwfReader(self.stream, compressed, block_size)
+
+    def getHeader(self):
+        """
+        Decode the header (see decodeHeader()) plus "version" and
+        "filesize" (uncompressed size). For compressed files, only the
+        first PROBE_SIZE bytes are inflated.
+        """
+        if self._header is None:
+            data = self.createReader(PROBE_SIZE).read(MAX_HEADER_SIZE)
+            header = decodeHeader(data)
+            if header is None:
+                raise ParserError("SWF: truncated header")
+            version, filesize = unpack("<BI", self.stream.readBytes(3 * 8, 5))
+            header["version"] = version
+            header["filesize"] = filesize
+            self._header = header
+        return self._header
+
+    def iterTags(self, reader=None):
+        """
+        Walk the tags on the (inflated) data: yield (code, address of the
+        tag content in the uncompressed file in bytes, length in bytes).
+        Tag contents are skipped without being kept in memory. Stop after
+        the end tag, or at the end of the data.
+        """
+        if reader is None:
+            reader = self.createReader()
+        if not reader.skip(self.getHeader()["header_size"] - 8):
+            return
+        while True:
+            data = reader.read(2)
+            if len(data) < 2:
+                break
+            value = unpack("<H", data)[0]
+            code, length = value >> 6, value & 63
+            if length == 63:
+                data = reader.read(4)
+                if len(data) < 4:
+                    break
+                length = unpack("<I", data)[0]
+            yield code, reader.position, length
+            if not code or not reader.skip(length):
+                break
+
+    def getCompressedSize(self):
+        """
+        Size in bytes of a compressed file, up to the end of the deflate
+        stream: all data are inflated (but not kept in memory).
+        """
+        if self._compressed_size is None:
+            self._compressed_size = self.createReader().getCompressedEnd()
+        return self._compressed_size
+
     def createContentSize(self):
         if self["signature"].value == "FWS":
             return self["filesize"].value * 8
+        elif has_deflate:
+            return self.getCompressedSize() * 8
         else:
-            # TODO: Size of compressed Flash?
             return None
 
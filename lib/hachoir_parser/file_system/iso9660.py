@@ -19,6 +19,11 @@ Known Issues:
 - ISO9660/MODE2/FORM2/2352  XA Extension is never detected and will be handled as FORM1
 - In the whole parse the 'Extended Attribute' isn't dealt with, but i never came across one
 
+Files can be accessed without parsing the whole image: lookupPath() and
+listDirectory() read the directory extents on demand (the path table is used
+as directory index), and getFileStream() returns a substream of a file.
+Joliet names and Rock Ridge names (NM entries) are supported.
+
 """
 
 from hachoir_parser import Parser
@@ -26,6 +31,149 @@ from hachoir_core.field import (FieldSet, ParserError,
     UInt8, UInt16, UInt16BE, UInt32, UInt32BE, Enum,
     NullBytes, RawBytes, String)
 from hachoir_core.endian import LITTLE_ENDIAN, BIG_ENDIAN
+from hachoir_core.stream import InputStream, InputSubStream, StringInputStream
+from collections import OrderedDict
+from struct import unpack
+
+# Size in bytes of a logical block
+BLOCK_SIZE = 2048
+
+# Maximum number of directory listings kept in the cache of the parser
+DIRECTORY_CACHE_SIZE = 256
+
+# Maximum size in bytes of a directory extent or of a path table
+MAX_DIRECTORY_SIZE = 16 * 1024 * 1024
+
+# Escape sequences of the Joliet supplementary volume descriptors
+JOLIET_ESCAPES = ("%/@", "%/C", "%/E")
+
+# File flags of the directory records
+FLAG_DIRECTORY = 2
+FLAG_MULTI_EXTENT = 128
+
+class SectorInputStream(InputStream):
+    """
+    Stream of the data of consecutive logical blocks of an image of raw
+    sectors (2352 bytes): only the 2048 bytes of user data of each sector
+    are read.
+    """
+    def __init__(self, stream, block, size, sector_size, header_size, source=None):
+        if source is None:
+            source = "<sectors input=%s block=%s size=%s>" % (stream.source, block, size)
+        InputStream.__init__(self, source=source, size=size * 8)
+        self.stream = stream
+        self.block = block
+        self.sector_size = sector_size
+        self.header_size = header_size
+        self._current_size = size * 8
+
+    def read(self, address, size):
+        end = min(address + size, self._size)
+        missing = (end < address + size)
+        pos = address // 8
+        end = (end + 7) // 8
+        data = []
+        while pos < end:
+            block, offset = divmod(pos, BLOCK_SIZE)
+            length = min(BLOCK_SIZE - offset, end - pos)
+            physical = (self.block + block) * self.sector_size + self.header_size + offset
+            data.append(self.stream.readBytes(physical * 8, length))
+            pos += length
+        return address % 8, "".join(data), missing
+
+class DirectoryEntry(object):
+    """
+    File or directory read from a directory record: name (unicode),
+    location (first logical block), size (in bytes), flags, and extents:
+    list of (location, size) of the multi-extent files.
+    """
+    def __init__(self, name, location, size, flags):
+        self.name = name
+        self.location = location
+        self.size = size
+        self.flags = flags
+        self.extents = [(location, size)]
+
+    is_directory = property(lambda self: bool(self.flags & FLAG_DIRECTORY))
+
+    def __repr__(self):
+        if self.is_directory:
+            kind = "directory"
+        else:
+            kind = "file"
+        return "<DirectoryEntry %s %r location=%s size=%s>" \
+            % (kind, self.name, self.location, self.size)
+
+def normalizeName(name):
+    """
+    Remove the version number and the trailing dot of an ISO 9660 file
+    identifier.
+
+    >>> normalizeName(u"README.TXT;1"), normalizeName(u"MAKEFILE.;1")
+    (u'README.TXT', u'MAKEFILE')
+    """
+    pos = name.rfind(u";")
+    if 0 < pos:
+        name = name[:pos]
+    if name.endswith(u".") and name not in (u".", u".."):
+        name = name[:-1]
+    return name
+
+def iterSystemUse(data):
+    """
+    Iterate on the System Use Sharing Protocol entries of a system use
+    area: yield (signature, version, entry data).
+    """
+    pos = 0
+    while pos + 4 <= len(data):
+        length = ord(data[pos+2])
+        if length < 4 or len(data) < pos + length:
+            break
+        yield data[pos:pos+2], ord(data[pos+3]), data[pos+4:pos+length]
+        pos += length
+
+class DirectoryIndex(object):
+    """
+    Directory index read from the type L path table: directory numbers start
+    at 1 (root directory). For each directory, names[number] is the name,
+    locations[number] the location of its extent and parents[number] the
+    number of its parent. paths is a dictionary: path (unicode, lower case)
+    => directory number.
+    """
+    def __init__(self, data, joliet):
+        names = [None]
+        locations = [None]
+        parents = [None]
+        paths = {}
+        full_paths = [None]
+        pos = 0
+        while pos + 8 <= len(data):
+            length, attr_length, location, parent = unpack("<BBIH", data[pos:pos+8])
+            if not length:
+                break
+            name = data[pos+8:pos+8+length]
+            pos += 8 + length + (length & 1)
+            if joliet:
+                name = unicode(name, "UTF-16-BE", "replace")
+            else:
+                name = unicode(name, "ISO-8859-1")
+            number = len(names)
+            if number == 1:
+                path = u""
+                name = u""
+            elif 1 <= parent < number:
+                path = full_paths[parent] + u"/" + normalizeName(name).lower()
+            else:
+                raise ParserError("ISO9660: invalid path table entry %s" % number)
+            names.append(name)
+            locations.append(location)
+            parents.append(parent)
+            full_paths.append(path)
+            paths[path] = number
+        self.names = names
+        self.locations = locations
+        self.parents = parents
+        self.paths = paths
 
 class PrimaryVolumeDescriptor(FieldSet):
     endian = LITTLE_ENDIAN
@@ -280,9 +428,21 @@ class ISO9660(Parser):
 
         return "Invalid signature"
 
-    def createFields(self):
-
-        #Step 1: Determin the CD ROM specifications
+    def __init__(self, stream, **args):
+        Parser.__init__(self, stream, **args)
+        self._sector_format = None
+        self._volume = None
+        self._rock_ridge = False
+        self._directory_index = None
+        self._directories = OrderedDict()
+
+    def getSectorFormat(self):
+        """
+        Determine the CD ROM specifications: set sector_mode and sector_form,
+        and returns (sector_size, sector_header_size).
+        """
+        if self._sector_format is not None:
+            return self._sector_format
         #The first 16 sectors are system area, but we don't know what sector size is being used
         # let's check sector size 2046 (16 sectors x 2046 bytes per sector = 0x8000)
         if self.stream.readBytes(16 * 2048 * 8, len(self.MAGIC)) == self.MAGIC:
@@ -313,6 +473,296 @@ class ISO9660(Parser):
             sector_size = 2352
             sector_header_size = 24
 
+        else:
+            raise ParserError("ISO9660: unable to find the volume descriptors")
+        self._sector_format = (sector_size, sector_header_size)
+        return self._sector_format
+
+    def readBlocks(self, block, count=1):
+        """
+        Read the user data of count logical blocks starting at block.
+        """
+        sector_size, header_size = self.getSectorFormat()
+        if sector_size == BLOCK_SIZE:
+            return self.stream.readBytes(block * BLOCK_SIZE * 8, count * BLOCK_SIZE)
+        return "".join(
+            self.stream.readBytes(((block + index) * sector_size + header_size) * 8, BLOCK_SIZE)
+            for index in xrange(count))
+
+    def getVolume(self):
+        """
+        Read the volume descriptors. Returns (joliet, path_table_block,
+        path_table_size, root_record) of the descriptor used to access the
+        files: the Joliet supplementary volume descriptor if the primary
+        volume has no Rock Ridge extension, or the primary volume descriptor.
+        """
+        if self._volume is not None:
+            return self._volume
+        primary = joliet = None
+        block = 16
+        while True:
+            data = self.readBlocks(block)
+            if data[1:6] != "CD001":
+                raise ParserError("ISO9660: invalid volume descriptor at block %s" % block)
+            kind = ord(data[0])
+            volume = (unpack("<I", data[140:144])[0], unpack("<I", data[132:136])[0], data[156:190])
+            if kind == 1 and primary is None:
+                primary = (False,) + volume
+            elif kind == 2 and joliet is None and data[88:91] in JOLIET_ESCAPES:
+                joliet = (True,) + volume
+            elif kind == 255:
+                break
+            block += 1
+            if 16 + 256 <= block:
+                raise ParserError("ISO9660: too many volume descriptors")
+        if primary is None:
+            raise ParserError("ISO9660: missing primary volume descriptor")
+        self._volume = primary
+        if joliet is not None and self.getRockRidgeSkip() is None:
+            self._volume = joliet
+        return self._volume
+
+    def getRockRidgeSkip(self):
+        """
+        Check if the primary volume uses the Rock Ridge extension: returns
+        the number of bytes to skip in the system use area of the
+        directory records (SUSP "SP" entry), or None.
+        """
+        if self._rock_ridge is not False:
+            return self._rock_ridge
+        self._rock_ridge = None
+        block = 16
+        while True:
+            data = self.readBlocks(block)
+            if ord(data[0]) == 1:
+                break
+            if ord(data[0]) == 255 or 16 + 256 <= block:
+                return None
+            block += 1
+        location = unpack("<I", data[158:162])[0]
+        data = self.readBlocks(location)
+        # System use area of the "." record of the root directory
+        length = ord(data[0])
+        system_use = data[34:length]
+        if system_use[:2] == "SP" and system_use[4:6] == "\xBE\xEF":
+            self._rock_ridge = ord(system_use[6])
+        return self._rock_ridge
+
+    def getDirectoryIndex(self):
+        """
+        Returns the DirectoryIndex read from the path table.
+        """
+        if self._directory_index is None:
+            joliet, block, size = self.getVolume()[:3]
+            if MAX_DIRECTORY_SIZE < size:
+                raise ParserError("ISO9660: path table is too big")
+            count = (size + BLOCK_SIZE - 1) // BLOCK_SIZE
+            data = self.readBlocks(block, count)[:size]
+            self._directory_index = DirectoryIndex(data, joliet)
+        return self._directory_index
+
+    def _readSystemUse(self, data, skip):
+        # Returns (Rock Ridge name, child link location, relocated)
+        name = []
+        child_link = None
+        relocated = False
+        entries = list(iterSystemUse(data[skip:]))
+        continuations = 0
+        index = 0
+        while index < len(entries):
+            signature, version, content = entries[index]
+            index += 1
+            if signature == "NM" and content:
+                flags = ord(content[0])
+                if flags & 2:
+                    name = ["."]
+                elif flags & 4:
+                    name = [".."]
+                else:
+                    name.append(content[1:])
+            elif signature == "CL" and 8 <= len(content):
+                child_link = unpack("<I", content[:4])[0]
+            elif signature == "RE":
+                relocated = True
+            elif signature == "CE" and 24 <= len(content):
+                # Continuation area
+                block, offset, length = unpack("<I4xI4xI", content[:20])
+                continuations += 1
+                if BLOCK_SIZE < offset + length or 16 < continuations:
+                    raise ParserError("ISO9660: invalid continuation area")
+                area = self.readBlocks(block)[offset:offset+length]
+                entries.extend(iterSystemUse(area))
+            elif signature == "ST":
+                break
+        if name:
+            name = unicode("".join(name), "UTF-8", "replace")
+        else:
+            name = None
+        return name, child_link, relocated
+
+    def _readDirectory(self, location, size):
+        joliet = self.getVolume()[0]
+        skip = self.getRockRidgeSkip()
+        if joliet:
+            skip = None
+        if MAX_DIRECTORY_SIZE < size:
+            raise ParserError("ISO9660: directory is too big")
+        count = (size + BLOCK_SIZE - 1) // BLOCK_SIZE
+        data = self.readBlocks(location, count)[:size]
+        entries = []
+        pos = 0
+        while pos < len(data):
+            length = ord(data[pos])
+            if not length:
+                # Records don't cross block boundaries
+                pos = (pos // BLOCK_SIZE + 1) * BLOCK_SIZE
+                continue
+            if length < 34 or len(data) < pos + length:
+                raise ParserError("ISO9660: invalid directory record at block %s"
+                    % (location + pos // BLOCK_SIZE))
+            record = data[pos:pos+length]
+            pos += length
+            extent, extent_size = unpack("<I4xI", record[2:14])
+            flags = ord(record[25])
+            name_length = ord(record[32])
+            name = record[33:33+name_length]
+            if name in ("\0", "\1"):
+                # "." and ".." entries
+                continue
+            if joliet:
+                name = unicode(name, "UTF-16-BE", "replace")
+            else:
+                name = unicode(name, "ISO-8859-1")
+            if skip is not None:
+                system_use = record[33 + name_length + (1 - name_length % 2):]
+                rr_name, child_link, relocated = self._readSystemUse(system_use, skip)
+                if relocated:
+                    continue
+                if rr_name is not None:
+                    name = rr_name
+                if child_link is not None:
+                    # Relocated directory (deep directory tree)
+                    extent = child_link
+                    extent_size = unpack("<I", self.readBlocks(extent)[10:14])[0]
+                    flags |= FLAG_DIRECTORY
+            name = normalizeName(name)
+            if entries and entries[-1].flags & FLAG_MULTI_EXTENT \
+            and entries[-1].name == name:
+                # Next extent of a multi-extent file
+                entry = entries[-1]
+                entry.extents.append((extent, extent_size))
+                entry.size += extent_size
+                entry.flags = flags
+                continue
+            entries.append(DirectoryEntry(name, extent, extent_size, flags))
+        return entries
+
+    def readDirectory(self, location, size=None):
+        """
+        Read the directory extent at location (logical block): returns the
+        list of DirectoryEntry (without "." and ".."). The size is read from
+        the "." record if it is not specified. The last directories read
+        are cached.
+        """
+        cache = self._directories
+        try:
+            entries = cache.pop(location)
+        except KeyError:
+            if size is None:
+                size = unpack("<I", self.readBlocks(location)[10:14])[0]
+            entries = self._readDirectory(location, size)
+            if DIRECTORY_CACHE_SIZE <= len(cache):
+                cache.popitem(last=False)
+        cache[location] = entries
+        return entries
+
+    def _splitPath(self, path):
+        return [part for part in path.split(u"/") if part and part != u"."]
+
+    def lookupPath(self, path):
+        """
+        Find a file or a directory from its path (eg. u"/VIDEO_TS/VTS_01_1.VOB").
+        Names are first compared exactly, and then ignoring the case.
+        Returns a DirectoryEntry, or None if the path doesn't exist.
+        """
+        if not isinstance(path, unicode):
+            path = unicode(path, "UTF-8")
+        parts = self._splitPath(path)
+        root = self.getVolume()[3]
+        entry = DirectoryEntry(u"", unpack("<I", root[2:6])[0],
+            unpack("<I", root[10:14])[0], ord(root[25]) | FLAG_DIRECTORY)
+        if not parts:
+            return entry
+        start = 0
+        if self.getRockRidgeSkip() is None or self.getVolume()[0]:
+            # Use the path table to find the deepest known directory
+            index = self.getDirectoryIndex()
+            for count in xrange(len(parts) - 1, 0, -1):
+                number = index.paths.get(u"/" + u"/".join(parts[:count]).lower())
+                if number is not None:
+                    entry = DirectoryEntry(index.names[number],
+                        index.locations[number], None, FLAG_DIRECTORY)
+                    start = count
+                    break
+        for part in parts[start:]:
+            if not entry.is_directory:
+                return None
+            entries = self.readDirectory(entry.location, entry.size)
+            found = None
+            for item in entries:
+                if item.name == part:
+                    found = item
+                    break
+            if found is None:
+                lower = part.lower()
+                for item in entries:
+                    if item.name.lower() == lower:
+                        found = item
+                        break
+            if found is None:
+                return None
+            entry = found
+        return entry
+
+    def listDirectory(self, path=u"/"):
+        """
+        Returns the list of the DirectoryEntry of a directory, or None if
+        the path is not a directory.
+        """
+        entry = self.lookupPath(path)
+        if entry is None or not entry.is_directory:
+            return None
+        return self.readDirectory(entry.location, entry.size)
+
+    def getFileStream(self, entry):
+        """
+        Create a stream of the content of a file: entry is a path or a
+        DirectoryEntry. Raise a ParserError if the file doesn't exist.
+        """
+        if not isinstance(entry, DirectoryEntry):
+            path = entry
+            entry = self.lookupPath(path)
+            if entry is None or entry.is_directory:
+                raise ParserError("ISO9660: file %s doesn't exist" % path)
+        source = u"%s/%s" % (self.stream.source, entry.name)
+        if not entry.size:
+            return StringInputStream("", source=source, allow_empty=True)
+        location = entry.location
+        for index, (block, size) in enumerate(entry.extents[:-1]):
+            if size % BLOCK_SIZE or entry.extents[index+1][0] != block + size // BLOCK_SIZE:
+                raise ParserError("ISO9660: non contiguous multi-extent file")
+        sector_size, header_size = self.getSectorFormat()
+        if sector_size == BLOCK_SIZE:
+            return InputSubStream(self.stream, location * BLOCK_SIZE * 8,
+                entry.size * 8, source=source)
+        return SectorInputStream(self.stream, location, entry.size,
+            sector_size, header_size, source=source)
+
+    def createFields(self):
+
+        #Step 1: Determin the CD ROM specifications
+        sector_size, sector_header_size = self.getSectorFormat()
+
         #Step 2: Skip this system area, not part of the ISO9660 specifications
         yield self.seekByte( (16 * sector_size), null=True)
 
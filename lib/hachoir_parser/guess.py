@@ -5,9 +5,11 @@ Parser list managment:
 
 import os
 from hachoir_core.error import warning, info, HACHOIR_ERRORS
+from hachoir_core.log import log
 from hachoir_parser import ValidateError, HachoirParserList
 from hachoir_core.stream import FileInputStream
 from hachoir_core.i18n import _
+from hachoir_core.instrument import instrument
 import weakref
 
 
@@ -99,6 +101,8 @@ class QueryParser(object):
         fb = None
         warn = warning
         for parser in self.parsers:
+            if instrument.enabled:
+                instrument.count("validate", parser.__name__)
             try:
                 parser_obj = parser(stream, validate=self.validate)
                 if self.parser_args:
@@ -106,6 +110,8 @@ class QueryParser(object):
                         setattr(parser_obj, key, value)
                 return parser_obj
             except ValidateError, err:
+                if instrument.enabled:
+                    instrument.count("validate_failed", parser.__name__)
                 res = unicode(err)
                 if fallback and self.fallback:
                     fb = parser
@@ -122,17 +128,22 @@ class QueryParser(object):
 
 
 def guessParser(stream):
+    # Rate limit messages without context per file
+    log.resetLimits()
     return QueryParser(stream.tags).parse(stream)
 
 
-def createParser(filename, real_filename=None, tags=None):
+def createParser(filename, real_filename=None, tags=None, cache=None):
     """
     Create a parser from a file or returns None on error.
 
     Options:
     - filename (unicode): Input file name ;
-    - real_filename (str|unicode): Real file name.
+    - real_filename (str|unicode): Real file name ;
+    - cache (ParserCache): Cache of the parser results.
     """
+    if cache is not None:
+        return cache.createParser(filename, real_filename, tags)
     if not tags:
         tags = []
     stream = FileInputStream(filename, real_filename, tags=tags)
@@ -26,7 +26,10 @@ from hachoir_core.text_handler import textHandler, hexadecimal
 from hachoir_parser.image.exif import Exif
 from hachoir_parser.image.photoshop_metadata import PhotoshopMetadata
 from hachoir_parser.archive.zlib import build_tree
+from hachoir_core.huffman import BitCursor, getHuffmanTable
 from hachoir_core.tools import paddingSize, alignValue
+from hachoir_core import config
+import re
 
 MAX_FILESIZE = 100 * 1024 * 1024
 
@@ -251,9 +254,7 @@ class HuffmanTable(FieldSet):
                 yield field
                 remap[len(lengths)] = field.value
                 lengths.append(i)
-        self.tree = {}
-        for i,j in build_tree(lengths).iteritems():
-            self.tree[i] = remap[j]
+        self.tree = build_tree(lengths).remap(remap)
 
 class DefineHuffmanTable(FieldSet):
     def createFields(self):
@@ -265,31 +266,94 @@ class HuffmanCode(Field):
     def __init__(self, parent, name, tree, description=""):
         Field.__init__(self, parent, name, 0, description)
 
-        endian = self.parent.endian
-        stream = self.parent.stream
         addr = self.absolute_address
-
-        value = 0
-        met_ff = False
-        while (self.size, value) not in tree:
-            if addr % 8 == 0:
-                last_byte = stream.readBytes(addr - 8, 1)
-                if last_byte == '\xFF':
-                    next_byte = stream.readBytes(addr, 1)
-                    if next_byte != '\x00':
-                        raise FieldError("Unexpected byte sequence %r!"%(last_byte + next_byte))
-                    addr += 8 # hack hack hack
-                    met_ff = True
-                    self._description = "[skipped 8 bits after 0xFF] "
-            bit = stream.readBits(addr, 1, endian)
-            value <<= 1
-            value += bit
-            self._size += 1
-            addr += 1
+        table = getHuffmanTable(tree, BIG_ENDIAN)
+        cursor = BitCursor(self.parent.stream, addr, BIG_ENDIAN, unstuff=True, block_size=4)
+        self.realvalue, length, value = table.lookup(cursor.peek(table.max_length))
+        cursor.skip(length)
+        self._size = cursor.address - addr
         self.createValue = lambda: value
-        self.realvalue = tree[(self.size, value)]
-        if met_ff:
-            self._size += 8
+        if self._size != length:
+            self._description = "[skipped 8 bits after 0xFF] "
+
+# Marker in entropy-coded data: 0xFF byte(s) not followed by a stuffed 0x00
+MARKER_REGEX = re.compile("\xff+[^\x00\xff]")
+# Same without restart markers (RST0..RST7)
+MARKER_NO_RESTART_REGEX = re.compile("\xff+[^\x00\xff\xd0-\xd7]")
+
+# Size in bytes of the blocks read to search markers
+MARKER_BLOCK_SIZE = 256 * 1024
+
+def searchJpegMarker(stream, start, end=None, skip_restart=False):
+    """
+    Search the first marker in entropy-coded data in [start; end[: read
+    large blocks and use a regular expression to skip stuffed 0xFF00 bytes.
+    If skip_restart is True, ignore restart markers. Addresses are in bits.
+
+    Returns the address of the first 0xFF byte of the marker, or None if
+    there is no marker.
+    """
+    if end is None:
+        end = MAX_FILESIZE * 8
+    if stream.size is not None:
+        end = min(end, stream.size)
+    if skip_restart:
+        regex = MARKER_NO_RESTART_REGEX
+    else:
+        regex = MARKER_REGEX
+    offset = start // 8
+    end //= 8
+    while offset < end:
+        size = min(MARKER_BLOCK_SIZE, end - offset)
+        if not stream.sizeGe((offset + size) * 8):
+            size = stream.size // 8 - offset
+            end = offset + size
+            if size <= 0:
+                break
+        data = stream.readBytes(offset * 8, size)
+        match = regex.search(data)
+        if match:
+            return (offset + match.start()) * 8
+        if offset + size == end:
+            break
+        # Don't cut a marker between two blocks
+        keep = len(data.rstrip("\xff"))
+        offset += keep or size
+    return None
+
+def iterJpegMarkers(stream, start=0):
+    """
+    Iterate on JPEG markers in one linear pass, without creating any field:
+    skip segments using their length and search markers in entropy-coded
+    data with searchJpegMarker(). Stop after the end of image (EOI) marker.
+
+    Generate (address, code) where address is the address in bytes of
+    the marker and code is the marker code (eg. 0xD8 for SOI).
+    """
+    in_scan = False
+    offset = start
+    while stream.sizeGe((offset + 2) * 8):
+        if in_scan:
+            address = searchJpegMarker(stream, offset * 8)
+            if address is None:
+                return
+            offset = address // 8
+        marker = stream.readBytes(offset * 8, 2)
+        if marker[0] != "\xff":
+            raise ParserError("JPEG: Invalid marker at offset %u" % offset)
+        code = ord(marker[1])
+        if code == 0xFF:
+            # Fill byte
+            offset += 1
+            continue
+        yield offset, code
+        offset += 2
+        if code == JpegChunk.TAG_EOI:
+            return
+        if code in (JpegChunk.TAG_SOI, 0x01) or 0xD0 <= code <= 0xD7:
+            continue
+        offset += stream.readBits(offset * 8, 16, BIG_ENDIAN)
+        in_scan = (code == JpegChunk.TAG_SOS)
 
 class JpegHuffmanImageUnit(FieldSet):
     """8x8 block of sample/coefficient values"""
@@ -343,20 +407,11 @@ class JpegImageData(FieldSet):
         self.restart_interval = restart_interval
         self.restart_offset = restart_offset
         # try to figure out where this field ends
-        start = self.absolute_address
-        while True:
-            end = self.stream.searchBytes("\xff", start, MAX_FILESIZE*8)
-            if end is None:
-                # this is a bad sign, since it means there is no terminator
-                # we ignore this; it likely means a truncated image
-                break
-            if self.stream.readBytes(end, 2) == '\xff\x00':
-                # padding: false alarm
-                start=end+16
-                continue
-            else:
-                self._size = end-self.absolute_address
-                break
+        end = searchJpegMarker(self.stream, self.absolute_address)
+        if end is not None:
+            self._size = end-self.absolute_address
+        # else: this is a bad sign, since it means there is no terminator
+        # we ignore this; it likely means a truncated image
 
     def createFields(self):
         if self.frame["../type"].value in [0xC0, 0xC1]:
@@ -386,6 +441,15 @@ class JpegImageData(FieldSet):
                 mcu_number = self.restart_interval * self.restart_offset
             else:
                 mcu_number = 0
+            if not config.detailed_huffman:
+                units = []
+                for sos_comp, num_units in components:
+                    dc_table = self.huffman_tables[0, sos_comp["dc_coding_table"].value].getTable(BIG_ENDIAN)
+                    ac_table = self.huffman_tables[1, sos_comp["ac_coding_table"].value].getTable(BIG_ENDIAN)
+                    units += [(dc_table, ac_table)] * num_units
+                size, count = self.decodeData(units, mcu_number, mcu_height * mcu_width)
+                yield RawBytes(self, "data", size, "Entropy-coded data (%u MCU)" % count)
+                return
             initial_mcu = mcu_number
             while True:
                 if (self.restart_interval and mcu_number != initial_mcu and mcu_number % self.restart_interval == 0) or\
@@ -410,6 +474,38 @@ class JpegImageData(FieldSet):
             self.warning("Sorry, only supporting Baseline & Extended Sequential JPEG images so far!")
             return
 
+    def decodeData(self, units, mcu_number, mcu_total):
+        """
+        Decode the entropy-coded data up to the end of the restart interval
+        without creating fields. units is the list of the Huffman tables
+        (dc_table, ac_table) of each data unit of a MCU.
+
+        Returns (size in bytes, number of decoded MCU).
+        """
+        address = self.absolute_address
+        cursor = BitCursor(self.stream, address, BIG_ENDIAN, unstuff=True)
+        initial_mcu = mcu_number
+        while mcu_number < mcu_total:
+            if self.restart_interval and mcu_number != initial_mcu \
+            and mcu_number % self.restart_interval == 0:
+                break
+            for dc_table, ac_table in units:
+                size = dc_table.decode(cursor)
+                if size:
+                    cursor.skip(size)
+                index = 1
+                while index < 64:
+                    value = ac_table.decode(cursor)
+                    if not value:
+                        # End of block
+                        break
+                    index += (value >> 4) + 1
+                    if value & 0x0F:
+                        cursor.skip(value & 0x0F)
+            mcu_number += 1
+        cursor.skip(paddingSize(cursor.address, 8))
+        return (cursor.address - address) // 8, mcu_number - initial_mcu
+
 class JpegChunk(FieldSet):
     TAG_SOI = 0xD8
     TAG_EOI = 0xD9
@@ -511,6 +607,10 @@ class JpegFile(Parser):
         "subfile": "skip",
     }
 
+    # Metadata-only mode: don't decode entropy-coded data, store them in
+    # raw fields. Set it using the parser tag ("args", {"metadata_only": True})
+    metadata_only = False
+
     def validate(self):
         if self.stream.readBytes(0, 2) != "\xFF\xD8":
             return "Invalid file signature"
@@ -543,6 +643,11 @@ class JpegFile(Parser):
                     self.warning("Missing or invalid SOF marker before SOS!")
                     continue
                 scan = chunk["content"]
+                if self.metadata_only:
+                    field = self.createRawImageData()
+                    if field:
+                        yield field
+                    continue
                 # hack: scan only the fields seen so far (in _fields): don't use the generator
                 if "restart_interval" in self._fields:
                     restart_interval = self["restart_interval/content/interval"].value
@@ -568,6 +673,28 @@ class JpegFile(Parser):
         if has_end:
             yield JpegChunk(self, "chunk[]")
 
+    def createRawImageData(self):
+        """
+        Create a raw field for the entropy-coded data of a scan (including
+        restart markers), or None if the scan is empty.
+        """
+        start = self.absolute_address + self.current_size
+        end = searchJpegMarker(self.stream, start, skip_restart=True)
+        if end is None:
+            end = self.stream.size
+            if end is None:
+                raise ParserError("JPEG: Unable to find the end of the scan")
+        if end <= start:
+            return None
+        return RawBytes(self, "image_data[]", (end - start) // 8, "Entropy-coded data")
+
+    def getMarkers(self):
+        """
+        List of the markers of the picture: (address in bytes, code).
+        See iterJpegMarkers().
+        """
+        return list(iterJpegMarkers(self.stream))
+
     def createDescription(self):
         desc = "JPEG picture"
         if "start_frame/content" in self:
@@ -579,6 +706,9 @@ class JpegFile(Parser):
         if "end" in self:
             return self["end"].absolute_address + self["end"].size
         if "data" not in self:
+            for address, code in iterJpegMarkers(self.stream):
+                if code == JpegChunk.TAG_EOI:
+                    return (address + 2) * 8
             return None
         start = self["data"].absolute_address
         end = self.stream.searchBytes("\xff\xd9", start, MAX_FILESIZE*8)
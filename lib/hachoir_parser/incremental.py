@@ -0,0 +1,152 @@
+"""
+Incremental (push-style) parsing: the caller feeds data as it arrives
+(eg. an upload) and gets the root fields as soon as they are complete.
+
+Example:
+
+    parser = IncrementalParser(tags=[("filename", filename)])
+    for data in upload:
+        parser.feed(data)
+        for field in parser.fields_ready():
+            ...
+    parser.close()
+    for field in parser.fields_ready():
+        ...
+
+Python generators can not be suspended in a nested call, so when a field
+set needs data which are not fed yet, the parser is dropped and created
+again once enough data are available: fields already returned by
+fields_ready() are not returned twice. To keep the total parsing time
+linear, the parser is only created again when the data grew by
+RETRY_GROWTH since the last attempt. A parser which parsed all its fields
+is kept, and only created again once when the stream is closed (its size
+is known).
+
+Without parser_class, the first parser which validates the available data
+is used: parsers which need more data to validate are skipped.
+"""
+
+from hachoir_core.stream import InputFeedStream, MissingDataError
+from hachoir_core.error import HACHOIR_ERRORS
+from hachoir_parser.parser import ValidateError
+from hachoir_parser.guess import QueryParser
+
+# Minimum growth of the data before parsing again after missing data
+RETRY_GROWTH = 1.5
+
+class IncrementalParser(object):
+    """
+    Feed a binary property list, whose trailer is at the end:
+
+    >>> data = ("bplist00\\x08\\x08" + "\\0" * 6 + "\\x01\\x01"
+    ...     + "\\0" * 7 + "\\x01" + "\\0" * 15 + "\\x09")
+    >>> parser = IncrementalParser()
+    >>> parser.feed(data[:20])
+    >>> [field.name for field in parser.fields_ready()]
+    ['magic']
+    >>> parser.feed(data[20:])
+    >>> parser.fields_ready()
+    []
+    >>> parser.close()
+    >>> [field.name for field in parser.fields_ready()]
+    ['trailer', 'offset_table', 'object[0]']
+    """
+    def __init__(self, tags=None, parser_class=None, source="<feed>"):
+        """
+        @param tags: Tags used to guess the parser (see L{QueryParser})
+        @param parser_class: Parser class, if it is already known
+        """
+        tags = list(tags or [])
+        self.stream = InputFeedStream(source=source, tags=tags)
+        self.parser_class = parser_class
+        self.parser = None
+        self.done = False
+        self._ready = 0
+        self._needed = 0
+        self._parser_closed = False
+
+    def feed(self, data):
+        """
+        Append data to the stream. Call fields_ready() to parse them.
+        """
+        self.stream.feed(data)
+
+    def close(self):
+        """
+        All data are fed: the next call to fields_ready() finishes parsing.
+        """
+        self.stream.close()
+
+    def _createParser(self):
+        if self.parser_class is not None:
+            return self.parser_class(self.stream)
+        query = QueryParser(self.stream.tags)
+        if self.stream.closed:
+            parser = query.parse(self.stream)
+        else:
+            parser = None
+            undecided = False
+            for parser_class in query:
+                try:
+                    parser = parser_class(self.stream, validate=query.validate)
+                except MissingDataError:
+                    undecided = True
+                    continue
+                except (ValidateError, HACHOIR_ERRORS):
+                    continue
+                if query.parser_args:
+                    for key, value in query.parser_args.iteritems():
+                        setattr(parser, key, value)
+                break
+            if parser is None and undecided:
+                raise MissingDataError(self.stream._current_size + 8)
+        if parser is not None:
+            self.parser_class = parser.__class__
+        return parser
+
+    def fields_ready(self):
+        """
+        Parse available data and returns the list of the new root fields
+        which are complete (all their data are available).
+        """
+        if self.done:
+            return []
+        closed = self.stream.closed
+        if not closed and (self.parser is not None
+        or self.stream._current_size < self._needed):
+            return []
+        if self.parser is not None and not self._parser_closed:
+            # The parser may create more fields once the stream
+            # size is known (eg. padding up to the end)
+            self.parser = None
+        ready = []
+        try:
+            if self.parser is None:
+                self._parser_closed = closed
+                self.parser = self._createParser()
+                if self.parser is None:
+                    if closed:
+                        self.done = True
+                    else:
+                        self._needed = int(
+                            self.stream._current_size * RETRY_GROWTH) + 1
+                    return ready
+            index = 0
+            for field in self.parser:
+                if index < self._ready:
+                    index += 1
+                    continue
+                end = field.absolute_address + field.size
+                if self.stream._current_size < end:
+                    raise MissingDataError(end)
+                ready.append(field)
+                index += 1
+                self._ready = index
+            if closed:
+                self.done = True
+        except MissingDataError, err:
+            # The parser generator is dead: create a new one next time
+            self._needed = max(err.address,
+                int(self.stream._current_size * RETRY_GROWTH))
+            self.parser = None
+        return ready
@@ -4,6 +4,11 @@ Apple/NeXT Binary Property List (BPLIST) parser.
 Also includes a .createXML() function which produces an XML representation of the object.
 Note that it will discard unknown objects, nulls and fill values, but should work for most files.
 
+Objects can also be read on demand, without creating fields, using
+BPList.get() and BPList.getObject(): dictionaries and arrays are returned
+as BPListDictView and BPListArrayView which decode their items when they
+are accessed. Example: bplist.get("CFBundleIdentifier").
+
 Documents:
 - CFBinaryPList.c
   http://src.gnu-darwin.org/DarwinSourceArchive/expanded/CF/CF-299/Parsing.subproj/CFBinaryPList.c
@@ -16,12 +21,69 @@ Created: 2008-09-21
 """
 
 from hachoir_parser import HachoirParser
-from hachoir_core.field import (RootSeekableFieldSet, FieldSet, Enum,
+from hachoir_core.field import (RootSeekableFieldSet, FieldSet, Enum, ParserError,
 Bits, GenericInteger, Float32, Float64, UInt8, UInt64, Bytes, NullBytes, RawBytes, String)
 from hachoir_core.endian import BIG_ENDIAN
 from hachoir_core.text_handler import displayHandler
 from hachoir_core.tools import humanDatetime
 from datetime import datetime, timedelta
+from array import array
+from struct import unpack
+import sys
+
+# Maximum number of decoded objects kept in the cache of BPList.getObject():
+# the cache is cleared when it is full
+OBJECT_CACHE_SIZE = 4096
+
+# Array type codes of unsigned integers of 1, 2, 4 and 8 bytes (there is no
+# type code of 8 bytes on platforms with 32-bit long, eg. Windows)
+ARRAY_TYPECODE = {1: "B", 2: "H"}
+for _typecode in "IL":
+    ARRAY_TYPECODE.setdefault(array(_typecode).itemsize, _typecode)
+
+def readIntegerArray(data, size):
+    """
+    Decode an array of unsigned big endian integers of size bytes. The
+    values are integers (not floats), they can be used as indexes.
+
+    >>> list(readIntegerArray("\\0\\1\\1\\0", 2))
+    [1, 256]
+    >>> values = readIntegerArray("\\0\\0\\1\\1\\0\\0", 3)
+    >>> [(value, isinstance(value, (int, long))) for value in values]
+    [(1L, True), (65536L, True)]
+    >>> [int(value) for value in readIntegerArray("\\0\\0\\0\\0\\0\\0\\0\\2", 8)]
+    [2]
+    """
+    count = len(data) // size
+    if size in ARRAY_TYPECODE:
+        values = array(ARRAY_TYPECODE[size], data[:count * size])
+        if size != 1 and sys.byteorder == "little":
+            values.byteswap()
+        return values
+    if size == 8:
+        return list(unpack(">%uQ" % count, data[:count * 8]))
+    if size < 4:
+        values = array(ARRAY_TYPECODE[4])
+    else:
+        values = []
+    for pos in xrange(0, count * size, size):
+        value = 0
+        for char in data[pos:pos+size]:
+            value = (value << 8) | ord(char)
+        values.append(value)
+    return values
+
+def convertTime(value):
+    """
+    Convert a date (number of seconds) to datetime: use a heuristic to
+    determine which epoch (2001 or 1970) is used.
+    """
+    value = timedelta(seconds=value)
+    epoch2001 = datetime(2001,1,1)
+    epoch1970 = datetime(1970,1,1)
+    if (epoch2001 + value - datetime.today()).days > 5*365:
+        return epoch1970 + value
+    return epoch2001 + value
 
 class BPListTrailer(FieldSet):
     def createFields(self):
@@ -56,7 +118,7 @@ class BPListSize(FieldSet):
 class BPListObjectRef(GenericInteger):
     def __init__(self, parent, name, description=None):
         size = parent['/trailer/objectRefSize'].value*8
-        GenericInteger.__init__(self, parent, name, False, size, description)
+        GenericInteger.__init__(self, parent, name, False, BIG_ENDIAN, size, description)
 
     def getRef(self):
         return self.parent['/object[' + str(self.value) + ']']
@@ -139,7 +201,7 @@ class BPListObject(FieldSet):
             size=self['size'].value
             # 8-bit (size=0), 16-bit (size=1) and 32-bit (size=2) numbers are unsigned
             # 64-bit (size=3) numbers are signed
-            yield GenericInteger(self, "value", (size>=3), (2**size)*8)
+            yield GenericInteger(self, "value", (size>=3), BIG_ENDIAN, (2**size)*8)
             self.xml=lambda prefix:prefix + "<integer>%s</integer>"%self['value'].value
 
         elif markertype == 2:
@@ -157,16 +219,8 @@ class BPListObject(FieldSet):
         elif markertype == 3:
             # Date
             yield Bits(self, "extra", 4, "Extra value, should be 3")
-            # Use a heuristic to determine which epoch to use
-            def cvt_time(v):
-                v=timedelta(seconds=v)
-                epoch2001 = datetime(2001,1,1)
-                epoch1970 = datetime(1970,1,1)
-                if (epoch2001 + v - datetime.today()).days > 5*365:
-                    return epoch1970 + v
-                return epoch2001 + v
-            yield displayHandler(Float64(self, "value"),lambda x:humanDatetime(cvt_time(x)))
-            self.xml=lambda prefix:prefix + "<date>%sZ</date>"%(cvt_time(self['value'].value).isoformat())
+            yield displayHandler(Float64(self, "value"),lambda x:humanDatetime(convertTime(x)))
+            self.xml=lambda prefix:prefix + "<date>%sZ</date>"%(convertTime(self['value'].value).isoformat())
 
         elif markertype == 4:
             # Data
@@ -198,7 +252,7 @@ class BPListObject(FieldSet):
         elif markertype == 8:
             # UID
             yield Bits(self, "size", 4, "Number of bytes minus 1")
-            yield GenericInteger(self, "value", False, (self['size'].value + 1)*8)
+            yield GenericInteger(self, "value", False, BIG_ENDIAN, (self['size'].value + 1)*8)
             self.xml=lambda prefix:prefix + "" # no equivalent?
 
         elif markertype == 10:
@@ -246,6 +300,73 @@ class BPListObject(FieldSet):
     def getFieldType(self):
         return '%s<%s>'%(FieldSet.getFieldType(self), self['marker_type'].display)
 
+class BPListArrayView(object):
+    """
+    Array (or set) object read on demand: items are decoded when they are
+    accessed.
+    """
+    def __init__(self, bplist, refs):
+        self.bplist = bplist
+        self.refs = refs
+
+    def __len__(self):
+        return len(self.refs)
+
+    def __getitem__(self, index):
+        return self.bplist.getObject(self.refs[index])
+
+    def __iter__(self):
+        for ref in self.refs:
+            yield self.bplist.getObject(ref)
+
+    def __repr__(self):
+        return "<BPListArrayView: %s items>" % len(self.refs)
+
+class BPListDictView(object):
+    """
+    Dictionary object read on demand: the keys are decoded at the first
+    lookup, values are decoded when they are accessed.
+    """
+    def __init__(self, bplist, key_refs, value_refs):
+        self.bplist = bplist
+        self.key_refs = key_refs
+        self.value_refs = value_refs
+        self._keys = None
+
+    def _getKeys(self):
+        if self._keys is None:
+            get = self.bplist.getObject
+            self._keys = dict((get(ref), index)
+                for index, ref in enumerate(self.key_refs))
+        return self._keys
+
+    def __len__(self):
+        return len(self.key_refs)
+
+    def __contains__(self, key):
+        return key in self._getKeys()
+
+    def __getitem__(self, key):
+        return self.bplist.getObject(self.value_refs[self._getKeys()[key]])
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        get = self.bplist.getObject
+        return [get(ref) for ref in self.key_refs]
+
+    def iteritems(self):
+        get = self.bplist.getObject
+        for key_ref, value_ref in zip(self.key_refs, self.value_refs):
+            yield (get(key_ref), get(value_ref))
+
+    def __repr__(self):
+        return "<BPListDictView: %s items>" % len(self.key_refs)
+
 class BPList(HachoirParser, RootSeekableFieldSet):
     endian = BIG_ENDIAN
     MAGIC = "bplist00"
@@ -261,6 +382,9 @@ class BPList(HachoirParser, RootSeekableFieldSet):
     def __init__(self, stream, **args):
         RootSeekableFieldSet.__init__(self, None, "root", stream, None, stream.askSize(self))
         HachoirParser.__init__(self, stream, **args)
+        self._trailer = None
+        self._offsets = None
+        self._object_cache = {}
 
     def validate(self):
         if self.stream.readBytes(0, len(self.MAGIC)) != self.MAGIC:
@@ -269,16 +393,10 @@ class BPList(HachoirParser, RootSeekableFieldSet):
 
     def createFields(self):
         yield Bytes(self, "magic", 8, "File magic (bplist00)")
-        if self.size:
-            self.seekByte(self.size//8-32, True)
-        else:
-            # FIXME: UNTESTED
-            while True:
-                try:
-                    self.seekByte(1024)
-                except:
-                    break
-            self.seekByte(self.size//8-32)
+        if not self.stream.size:
+            # Unknown size (pipe or feed stream): read up to the end
+            self.stream.sizeGe(1 << 62)
+        self.seekByte(self.stream.size//8-32, True)
         yield BPListTrailer(self, "trailer")
         self.seekByte(self['trailer/offsetTableOffset'].value)
         yield BPListOffsetTable(self, "offset_table")
@@ -297,3 +415,120 @@ class BPList(HachoirParser, RootSeekableFieldSet):
 ''' + self['/object[' + str(self['/trailer/topObject'].value) + ']'].createXML(prefix) + '''
 </plist>'''
 
+    def getTrailer(self):
+        """
+        Read the trailer from the raw data. Returns (offset_size, ref_size,
+        object_count, top_object, offset_table_offset).
+        """
+        if self._trailer is None:
+            if self.stream.size is None or self.stream.size < (8 + 32) * 8:
+                raise ParserError("BPList: unable to read the trailer")
+            data = self.stream.readBytes(self.stream.size - 32 * 8, 32)
+            self._trailer = unpack(">6xBBQQQ", data)
+        return self._trailer
+
+    def getOffsets(self):
+        """
+        Returns the offset table: compact array of object offsets (in bytes).
+        """
+        if self._offsets is None:
+            offset_size, ref_size, count, top, table_offset = self.getTrailer()
+            if not (1 <= offset_size <= 8) or self.stream.size // 8 < table_offset + count * offset_size:
+                raise ParserError("BPList: invalid offset table")
+            data = self.stream.readBytes(table_offset * 8, count * offset_size)
+            self._offsets = readIntegerArray(data, offset_size)
+        return self._offsets
+
+    def _readSize(self, address, marker):
+        # Returns (size, address of the content)
+        size = marker & 0xF
+        if size != 0xF:
+            return size, address
+        marker = ord(self.stream.readBytes(address, 1))
+        if marker & 0xF0 != 0x10:
+            raise ParserError("BPList: invalid object size")
+        nbytes = 1 << (marker & 0xF)
+        size = int(self.stream.readBytes(address + 8, nbytes).encode("hex"), 16)
+        return size, address + (1 + nbytes) * 8
+
+    def _decodeObject(self, index):
+        offsets = self.getOffsets()
+        if not (0 <= index < len(offsets)):
+            raise ParserError("BPList: invalid object reference (%s)" % index)
+        address = int(offsets[index]) * 8
+        stream = self.stream
+        marker = ord(stream.readBytes(address, 1))
+        address += 8
+        kind = marker >> 4
+        if kind == 0:
+            if marker == 0x08:
+                return False
+            if marker == 0x09:
+                return True
+            return None
+        if kind == 1:
+            nbytes = 1 << (marker & 0xF)
+            value = int(stream.readBytes(address, nbytes).encode("hex"), 16)
+            if 8 <= nbytes and value >> (nbytes * 8 - 1):
+                value -= 1 << (nbytes * 8)
+            return value
+        if kind == 2:
+            nbytes = 1 << (marker & 0xF)
+            data = stream.readBytes(address, nbytes)
+            if nbytes == 4:
+                return unpack(">f", data)[0]
+            if nbytes == 8:
+                return unpack(">d", data)[0]
+            raise ParserError("BPList: invalid real size (%s bytes)" % nbytes)
+        if kind == 3:
+            return convertTime(unpack(">d", stream.readBytes(address, 8))[0])
+        if kind == 8:
+            return int(stream.readBytes(address, (marker & 0xF) + 1).encode("hex"), 16)
+        size, address = self._readSize(address, marker)
+        if kind == 4:
+            return stream.readBytes(address, size) if size else ""
+        if kind == 5:
+            return unicode(stream.readBytes(address, size), "ASCII", "replace") if size else u""
+        if kind == 6:
+            return unicode(stream.readBytes(address, size * 2), "UTF-16-BE", "replace") if size else u""
+        ref_size = self.getTrailer()[1]
+        if kind in (10, 12):
+            # Array or set
+            refs = readIntegerArray(stream.readBytes(address, size * ref_size), ref_size) if size else ()
+            return BPListArrayView(self, refs)
+        if kind == 13:
+            if not size:
+                return BPListDictView(self, (), ())
+            refs = readIntegerArray(stream.readBytes(address, size * 2 * ref_size), ref_size)
+            return BPListDictView(self, refs[:size], refs[size:])
+        raise ParserError("BPList: unknown object type (0x%02X)" % marker)
+
+    def getObject(self, index):
+        """
+        Decode the object index of the offset table, without creating
+        fields. Returns a Python object: None, bool, int, float, datetime,
+        str (data), unicode (string), BPListArrayView or BPListDictView.
+        Decoded objects are cached.
+        """
+        cache = self._object_cache
+        try:
+            return cache[index]
+        except KeyError:
+            pass
+        value = self._decodeObject(index)
+        if OBJECT_CACHE_SIZE <= len(cache):
+            cache.clear()
+        cache[index] = value
+        return value
+
+    def getTopObject(self):
+        return self.getObject(self.getTrailer()[3])
+
+    def get(self, key, default=None):
+        """
+        Get the value of a key of the top-level dictionary.
+        """
+        top = self.getTopObject()
+        if not isinstance(top, BPListDictView):
+            raise ParserError("BPList: the top-level object is not a dictionary")
+        return top.get(key, default)
@@ -268,8 +268,8 @@ class PropertyContent(FieldSet):
         except LookupError:
             handler = None
         if not handler:
-            log.warning("OLE2: Unable to parse property of type %s" \
-                % self["type"].display)
+            log.warning("OLE2: Unable to parse property of type %s",
+                self["type"].display)
             # raise ParserError(
         elif self["is_vector"].value:
             yield UInt32(self, "count")
@@ -302,7 +302,7 @@ class SummarySection(SeekableFieldSet):
                 if codepage in CODEPAGE_CHARSET:
                     self.osconfig.charset = CODEPAGE_CHARSET[codepage]
                 else:
-                    self.warning("Unknown codepage: %r" % codepage)
+                    self.warning("Unknown codepage: %r", codepage)
 
 class SummaryIndex(FieldSet):
     static_size = 20*8
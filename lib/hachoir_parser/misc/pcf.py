@@ -157,7 +157,7 @@ class PcfFile(Parser):
                 yield padding
             maxsize = (self.size-self.current_size)//8
             if maxsize < size:
-                self.warning("Truncate content of %s to %s bytes (was %s)" % (entry.path, maxsize, size))
+                self.warning("Truncate content of %s to %s bytes (was %s)", entry.path, maxsize, size)
                 size = maxsize
             if not size:
                 continue
@@ -1,6 +1,13 @@
 """
 Adobe Portable Document Format (PDF) parser.
 
+The default mode parses the whole document sequentially. Objects can also
+be read on demand using the cross-reference table: see
+PDFDocument.getObject() and PDFDocument.getInfo(). The "startxref" offset
+is read at the end of the file, and the cross-reference tables and streams
+of the incremental updates are followed using the "Prev" trailer entries,
+so only a few kilobytes are read from big documents.
+
 Author: Christophe Gisquet <christophe.gisquet@free.fr>
 """
 
@@ -14,10 +21,33 @@ from hachoir_core.field import (
     RawBytes)
 from hachoir_core.endian import LITTLE_ENDIAN
 from hachoir_core.text_handler import textHandler, hexadecimal
+import re
+import zlib
 
 MAGIC = "%PDF-"
 ENDMAGIC = "%%EOF"
 
+# Number of bytes read at the end of the file to find "startxref"
+TAIL_SIZE = 1024
+
+# First size (in bytes) of the buffer used to read an object, the buffer is
+# enlarged if the object is bigger
+READ_SIZE = 4096
+
+# Maximum size (in bytes) of an object (excluding stream data) or of a
+# cross-reference section, and of decoded stream data
+MAX_OBJECT_SIZE = 16 * 1024 * 1024
+MAX_STREAM_SIZE = 64 * 1024 * 1024
+
+# Maximum number of cross-reference sections (incremental updates)
+MAX_XREF_SECTION = 1000
+
+space_regex = re.compile(r"(?:[\0\t\n\x0c\r ]+|%[^\r\n]*)*")
+token_regex = re.compile(r"[^\0\t\n\x0c\r ()<>\[\]{}/%]*")
+hex_regex = re.compile(r"[0-9A-Fa-f\0\t\n\x0c\r ]*")
+xref_entry_regex = re.compile(r"[\0\t\n\x0c\r ]*(\d+)[ ]+(\d+)[ ]+([nf])")
+name_escape_regex = re.compile(r"#([0-9A-Fa-f]{2})")
+
 def getLineEnd(s, pos=None):
     if pos == None:
         pos = (s.absolute_address+s.current_size)//8
@@ -59,7 +89,7 @@ class PDFNumber(Field):
 
         # Get value
         val = parent.stream.readBytes(self.absolute_address, size)
-        self.info("Number: size=%u value='%s'" % (size, val))
+        self.info("Number: size=%u value='%s'", size, val)
         if val.find('.') != -1:
             self.createValue = lambda: float(val)
         else:
@@ -164,8 +194,8 @@ class LineEnd(FieldSet):
             elif char == '\x0D':
                 yield UInt8(self, "cr", "Line feed")
             else:
-                self.info("Line ends at %u/%u, len %u" %
-                          (addr, self.stream._size, self.current_size))
+                self.info("Line ends at %u/%u, len %u",
+                          addr, self.stream._size, self.current_size)
                 break
 
 class PDFDictionaryPair(FieldSet):
@@ -230,11 +260,11 @@ def parsePDFType(s):
             yield Catalog(s, "catalog[]")
         elif name[0] in ('.','-','+', '0', '1', '2', '3', \
                          '4', '5', '6', '7', '8', '9'):
-            s.info("Not a catalog: %u spaces and end='%s'" % (name.count(' '), char))
+            s.info("Not a catalog: %u spaces and end='%s'", name.count(' '), char)
             yield PDFNumber(s, "integer[]")
         else:
-            s.info("Trying to parse '%s': %u bytes" % \
-                   (s.stream.readBytes(s.absolute_address+s.current_size, 4), size))
+            s.info("Trying to parse '%s': %u bytes",
+                   s.stream.readBytes(s.absolute_address+s.current_size, 4), size)
             yield String(s, "unknown[]", size)
 
 class Header(FieldSet):
@@ -312,17 +342,17 @@ class Entry(FieldSet):
 class SubSection(FieldSet):
     def __init__(self, parent, name, desc=None):
         FieldSet.__init__(self, parent, name, desc)
-        self.info("Got entry count: '%s'" % self["entry_count"].value)
+        self.info("Got entry count: '%s'", self["entry_count"].value)
         self._size = self.current_size + 8*20*int(self["entry_count"].value) \
                      + self["line_end"].size
 
     def createFields(self):
         yield PDFNumber(self, "start_number",
                         "Object number of first entry in subsection")
-        self.info("start_number = %i" % self["start_number"].value)
+        self.info("start_number = %i", self["start_number"].value)
 
         yield PDFNumber(self, "entry_count", "Number of entries in subsection")
-        self.info("entry_count = %i" % self["entry_count"].value)
+        self.info("entry_count = %i", self["entry_count"].value)
         yield LineEnd(self, "line_end")
         yield GenericVector(self, "entries", int(self["entry_count"].value),
                             Entry)
@@ -387,7 +417,7 @@ class Trailer(FieldSet):
             t = PDFName(self, "type[]")
             yield t
             name = t.value
-            self.info("Parsing PDFName '%s'" % name)
+            self.info("Parsing PDFName '%s'", name)
             if name == "Size":
                 yield PDFNumber(self, "size", "Entries in the file cross-reference section")
             elif name == "Prev":
@@ -412,6 +442,371 @@ class Trailer(FieldSet):
         yield String(self, "end_marker", len(ENDMAGIC))
         yield LineEnd(self, "line_end[]")
 
+class Name(str):
+    """
+    Name object (without the initial slash), eg. Name("Type").
+    """
+    def __repr__(self):
+        return "/%s" % str.__str__(self)
+
+class Reference(object):
+    """
+    Indirect reference to an object: "number generation R".
+    """
+    def __init__(self, number, generation):
+        self.number = number
+        self.generation = generation
+
+    def __eq__(self, other):
+        return isinstance(other, Reference) \
+            and (self.number, self.generation) == (other.number, other.generation)
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __hash__(self):
+        return hash((self.number, self.generation))
+
+    def __repr__(self):
+        return "<Reference %u %u R>" % (self.number, self.generation)
+
+class StreamObject(object):
+    """
+    Stream object: dictionary, and location of the (encoded) data in the
+    file (offset in bytes). The length is None if it is an indirect object
+    which is not resolved yet.
+    """
+    def __init__(self, dictionary, offset, length):
+        self.dictionary = dictionary
+        self.offset = offset
+        self.length = length
+
+    def __repr__(self):
+        return "<StreamObject %r offset=%s length=%s>" \
+            % (self.dictionary, self.offset, self.length)
+
+class TruncatedData(Exception):
+    """
+    The buffer ends before the end of the object: read more data.
+    """
+    pass
+
+class ObjectReader(object):
+    """
+    Decode PDF objects from a buffer. If at_eof is False, TruncatedData is
+    raised when the buffer ends in the middle of an object.
+    """
+    ESCAPES = {"n": "\n", "r": "\r", "t": "\t", "b": "\b", "f": "\f",
+        "(": "(", ")": ")", "\\": "\\"}
+
+    def __init__(self, data, at_eof, pos=0):
+        self.data = data
+        self.at_eof = at_eof
+        self.pos = pos
+
+    def _endOfData(self):
+        if self.at_eof:
+            raise ParserError("PDF: unexpected end of data")
+        raise TruncatedData()
+
+    def skipSpaces(self):
+        """
+        Skip white spaces and comments.
+        """
+        self.pos = space_regex.match(self.data, self.pos).end()
+        if len(self.data) <= self.pos:
+            self._endOfData()
+
+    def readToken(self):
+        """
+        Read a token made of regular characters (number, keyword, etc.).
+        """
+        self.skipSpaces()
+        end = token_regex.match(self.data, self.pos).end()
+        if len(self.data) <= end and not self.at_eof:
+            raise TruncatedData()
+        token = self.data[self.pos:end]
+        self.pos = end
+        return token
+
+    def readInteger(self):
+        token = self.readToken()
+        try:
+            return int(token)
+        except ValueError:
+            raise ParserError("PDF: integer expected, got %r" % token[:20])
+
+    def expect(self, keyword):
+        token = self.readToken()
+        if token != keyword:
+            raise ParserError("PDF: %r expected, got %r" % (keyword, token[:20]))
+
+    def readValue(self):
+        """
+        Read an object: dictionary (dict), array (list), Name, string (str),
+        number (int/float), boolean, None (null) or Reference.
+        """
+        self.skipSpaces()
+        data = self.data
+        char = data[self.pos]
+        if char == "/":
+            end = token_regex.match(data, self.pos + 1).end()
+            if len(data) <= end and not self.at_eof:
+                raise TruncatedData()
+            name = data[self.pos+1:end]
+            self.pos = end
+            if "#" in name:
+                name = name_escape_regex.sub(lambda match: chr(int(match.group(1), 16)), name)
+            return Name(name)
+        if char == "<":
+            if data[self.pos+1:self.pos+2] == "<":
+                return self.readDictionary()
+            if len(data) <= self.pos + 1:
+                self._endOfData()
+            return self.readHexString()
+        if char == "(":
+            return self.readString()
+        if char == "[":
+            self.pos += 1
+            items = []
+            while True:
+                self.skipSpaces()
+                if data[self.pos] == "]":
+                    self.pos += 1
+                    return items
+                items.append(self.readValue())
+        if char in ")>]{}":
+            raise ParserError("PDF: unexpected character %r" % char)
+        token = self.readToken()
+        if token == "true":
+            return True
+        if token == "false":
+            return False
+        if token == "null":
+            return None
+        try:
+            number = int(token)
+        except ValueError:
+            try:
+                return float(token)
+            except ValueError:
+                raise ParserError("PDF: unexpected keyword %r" % token[:20])
+        # Indirect reference "number generation R"?
+        pos = self.pos
+        try:
+            generation = self.readToken()
+            if generation.isdigit() and self.readToken() == "R":
+                return Reference(number, int(generation))
+        except ParserError:
+            # End of the data
+            pass
+        self.pos = pos
+        return number
+
+    def readDictionary(self):
+        self.pos += 2
+        data = self.data
+        items = {}
+        while True:
+            self.skipSpaces()
+            if data[self.pos] == ">":
+                if len(data) <= self.pos + 1:
+                    self._endOfData()
+                if data[self.pos+1] != ">":
+                    raise ParserError("PDF: invalid dictionary end")
+                self.pos += 2
+                return items
+            key = self.readValue()
+            if not isinstance(key, Name):
+                raise ParserError("PDF: dictionary key is not a name")
+            items[str(key)] = self.readValue()
+
+    def readHexString(self):
+        end = hex_regex.match(self.data, self.pos + 1).end()
+        if len(self.data) <= end:
+            self._endOfData()
+        if self.data[end] != ">":
+            raise ParserError("PDF: invalid hexadecimal string")
+        text = "".join(self.data[self.pos+1:end].split())
+        self.pos = end + 1
+        if len(text) % 2:
+            text += "0"
+        return text.decode("hex")
+
+    def readString(self):
+        data = self.data
+        pos = self.pos + 1
+        depth = 1
+        chars = []
+        while True:
+            if len(data) <= pos:
+                self._endOfData()
+            char = data[pos]
+            pos += 1
+            if char == "\\":
+                if len(data) <= pos + 3 and not self.at_eof:
+                    raise TruncatedData()
+                char = data[pos:pos+1]
+                pos += 1
+                if char in self.ESCAPES:
+                    chars.append(self.ESCAPES[char])
+                elif char in "01234567":
+                    digits = char
+                    while len(digits) < 3 and pos < len(data) \
+                    and data[pos] in "01234567":
+                        digits += data[pos]
+                        pos += 1
+                    chars.append(chr(int(digits, 8) & 0xFF))
+                elif char == "\r":
+                    # Line continuation
+                    if data[pos:pos+1] == "\n":
+                        pos += 1
+                elif char != "\n":
+                    chars.append(char)
+                continue
+            if char == "(":
+                depth += 1
+            elif char == ")":
+                depth -= 1
+                if not depth:
+                    break
+            chars.append(char)
+        self.pos = pos
+        return "".join(chars)
+
+    def readIndirectObject(self):
+        """
+        Read "number generation obj value endobj". Returns (number,
+        generation, value), value is a StreamObject for a stream: the
+        length of a stream is not resolved if it is an indirect object.
+        """
+        number = self.readInteger()
+        generation = self.readInteger()
+        self.expect("obj")
+        value = self.readValue()
+        if isinstance(value, dict):
+            self.skipSpaces()
+            if self.data.startswith("stream", self.pos):
+                pos = self.pos + 6
+                if len(self.data) < pos + 2:
+                    self._endOfData()
+                if self.data[pos] == "\r":
+                    pos += 1
+                if self.data[pos] == "\n":
+                    pos += 1
+                length = value.get("Length")
+                if not isinstance(length, (int, long)):
+                    length = None
+                self.pos = pos
+                value = StreamObject(value, pos, length)
+        return (number, generation, value)
+
+def applyPredictor(data, parameters):
+    """
+    Revert the predictor (DecodeParms) of a FlateDecode stream.
+    Only PNG predictors (10 and more) are supported.
+    """
+    predictor = parameters.get("Predictor", 1)
+    if predictor == 1:
+        return data
+    if predictor < 10:
+        raise ParserError("PDF: unsupported predictor %s" % predictor)
+    colors = parameters.get("Colors", 1)
+    bpc = parameters.get("BitsPerComponent", 8)
+    columns = parameters.get("Columns", 1)
+    bpp = max(1, (colors * bpc) // 8)
+    row_size = (colors * bpc * columns + 7) // 8
+    rows = []
+    previous = [0] * row_size
+    for pos in xrange(0, len(data) - row_size, row_size + 1):
+        kind = ord(data[pos])
+        row = map(ord, data[pos+1:pos+1+row_size])
+        if kind == 1:
+            for index in xrange(bpp, row_size):
+                row[index] = (row[index] + row[index-bpp]) & 0xFF
+        elif kind == 2:
+            row = [(value + above) & 0xFF for value, above in zip(row, previous)]
+        elif kind == 3:
+            for index in xrange(row_size):
+                left = row[index-bpp] if bpp <= index else 0
+                row[index] = (row[index] + ((left + previous[index]) >> 1)) & 0xFF
+        elif kind == 4:
+            for index in xrange(row_size):
+                if bpp <= index:
+                    left = row[index-bpp]
+                    upper_left = previous[index-bpp]
+                else:
+                    left = upper_left = 0
+                above = previous[index]
+                estimate = left + above - upper_left
+                pa = abs(estimate - left)
+                pb = abs(estimate - above)
+                pc = abs(estimate - upper_left)
+                if pa <= pb and pa <= pc:
+                    value = left
+                elif pb <= pc:
+                    value = above
+                else:
+                    value = upper_left
+                row[index] = (row[index] + value) & 0xFF
+        elif kind:
+            raise ParserError("PDF: invalid PNG predictor %s" % kind)
+        rows.append("".join(map(chr, row)))
+        previous = row
+    return "".join(rows)
+
+def decodeText(text):
+    """
+    Decode a text string: UTF-16 (with a byte order mark) or PDFDocEncoding
+    (decoded as ISO-8859-1).
+
+    >>> decodeText("\\xfe\\xff\\x00A\\x00b")
+    u'Ab'
+    >>> decodeText("caf\\xe9")
+    u'caf\\xe9'
+    """
+    if text.startswith("\xfe\xff"):
+        return unicode(text[2:], "UTF-16-BE", "replace")
+    if text.startswith("\xef\xbb\xbf"):
+        return unicode(text[3:], "UTF-8", "replace")
+    return unicode(text, "ISO-8859-1")
+
+def readXrefEntries(reader, entries):
+    """
+    Read the subsections of a cross-reference table and its trailer
+    dictionary: the reader is positioned after the "xref" keyword. Entries
+    are stored in the entries dictionary (see PDFDocument.getXref()).
+    Returns the trailer dictionary.
+    """
+    data = reader.data
+    match_entry = xref_entry_regex.match
+    while True:
+        token = reader.readToken()
+        if token == "trailer":
+            break
+        try:
+            start = int(token)
+        except ValueError:
+            raise ParserError("PDF: invalid cross-reference table")
+        count = reader.readInteger()
+        pos = reader.pos
+        for number in xrange(start, start + count):
+            match = match_entry(data, pos)
+            if match is None or (len(data) <= match.end() and not reader.at_eof):
+                if not reader.at_eof and len(data) - pos < 64:
+                    raise TruncatedData()
+                raise ParserError("PDF: invalid cross-reference entry")
+            pos = match.end()
+            if match.group(3) == "n":
+                entries[number] = (1, int(match.group(1)), int(match.group(2)))
+            else:
+                entries[number] = (0, int(match.group(1)), int(match.group(2)))
+        reader.pos = pos
+    trailer = reader.readValue()
+    if not isinstance(trailer, dict):
+        raise ParserError("PDF: invalid trailer")
+    return trailer
+
 class PDFDocument(Parser):
     endian = LITTLE_ENDIAN
     PARSER_TAGS = {
@@ -429,14 +824,314 @@ class PDFDocument(Parser):
             return "Invalid magic string"
         return True
 
+    # Cross-reference mode: don't parse the whole body but read the
+    # cross-reference table(s), objects are stored in raw fields. Set it
+    # using the parser tag ("args", {"use_xref": True})
+    use_xref = False
+
+    def __init__(self, stream, **args):
+        Parser.__init__(self, stream, **args)
+        self._xref = None
+        self._xref_loading = False
+        self._xref_offsets = None
+        self._trailer = None
+        self._object_stream = None
+
+    def _getFileSize(self):
+        if self.stream.size is None:
+            raise ParserError("PDF: unknown file size")
+        return self.stream.size // 8
+
+    def readAt(self, offset, parse):
+        """
+        Call parse(reader) with an ObjectReader of the data at offset (in
+        bytes) and returns its result. The buffer is enlarged until the
+        data are complete.
+        """
+        file_size = self._getFileSize()
+        size = READ_SIZE
+        while True:
+            size = min(size, file_size - offset)
+            if offset < 0 or size <= 0:
+                raise ParserError("PDF: offset %s is outside the file" % offset)
+            at_eof = (file_size <= offset + size)
+            reader = ObjectReader(self.stream.readBytes(offset * 8, size), at_eof)
+            try:
+                return parse(reader)
+            except TruncatedData:
+                if MAX_OBJECT_SIZE <= size:
+                    raise ParserError("PDF: object at offset %s is too big" % offset)
+                size *= 4
+
+    def readObjectAt(self, offset):
+        """
+        Read the indirect object at offset (in bytes).
+        Returns (number, generation, value).
+        """
+        number, generation, value = self.readAt(offset,
+            ObjectReader.readIndirectObject)
+        if isinstance(value, StreamObject):
+            value.offset += offset
+        return number, generation, value
+
+    def findStartXref(self):
+        """
+        Returns the offset of the last cross-reference section, written
+        after the "startxref" keyword at the end of the file.
+        """
+        file_size = self._getFileSize()
+        size = min(TAIL_SIZE, file_size)
+        data = self.stream.readBytes((file_size - size) * 8, size)
+        pos = data.rfind("startxref")
+        if pos < 0:
+            raise ParserError("PDF: unable to find startxref")
+        return ObjectReader(data, True, pos + 9).readInteger()
+
+    def _readXrefTable(self, reader):
+        reader.skipSpaces()
+        if not reader.data.startswith("xref", reader.pos):
+            return None
+        reader.pos += 4
+        entries = {}
+        trailer = readXrefEntries(reader, entries)
+        return trailer, entries
+
+    def _readXrefStream(self, offset):
+        number, generation, stream = self.readObjectAt(offset)
+        if not isinstance(stream, StreamObject) \
+        or stream.dictionary.get("Type") != "XRef":
+            raise ParserError("PDF: invalid cross-reference stream at offset %s" % offset)
+        info = stream.dictionary
+        data = self.decodeStream(stream)
+        widths = info.get("W")
+        if not isinstance(widths, list) or len(widths) != 3 \
+        or not all(isinstance(width, (int, long)) and 0 <= width <= 8 for width in widths):
+            raise ParserError("PDF: invalid cross-reference stream widths")
+        index = info.get("Index", [0, info.get("Size", 0)])
+        entry_size = sum(widths)
+        entries = {}
+        pos = 0
+        for start, count in zip(index[0::2], index[1::2]):
+            if len(data) < pos + count * entry_size:
+                raise ParserError("PDF: truncated cross-reference stream")
+            for number in xrange(start, start + count):
+                fields = []
+                for width in widths:
+                    value = 0
+                    for char in data[pos:pos+width]:
+                        value = (value << 8) | ord(char)
+                    pos += width
+                    fields.append(value)
+                if not widths[0]:
+                    fields[0] = 1
+                entries[number] = tuple(fields)
+        return info, entries
+
+    def getXref(self):
+        """
+        Returns the cross-reference index of the document (all incremental
+        updates): dictionary object number => entry. Entries are tuples
+        (type, field2, field3) as in the cross-reference streams:
+        - (0, next free object, generation): free object
+        - (1, offset, generation): object at offset (in bytes)
+        - (2, object stream number, index): object in an object stream
+        """
+        if self._xref is not None:
+            return self._xref
+        if self._xref_loading:
+            raise ParserError("PDF: indirect object used in a cross-reference stream")
+        self._xref_loading = True
+        try:
+            xref = {}
+            offsets = []
+            offset = self.findStartXref()
+            while isinstance(offset, (int, long)) and offset not in offsets:
+                if MAX_XREF_SECTION <= len(offsets):
+                    raise ParserError("PDF: too many cross-reference sections")
+                offsets.append(offset)
+                section = self.readAt(offset, self._readXrefTable)
+                if section:
+                    trailer, entries = section
+                    if "XRefStm" in trailer:
+                        # Hybrid file: objects stored in object streams are
+                        # free in the table, and listed in a stream
+                        stream_info, stream_entries = self._readXrefStream(trailer["XRefStm"])
+                        for number, entry in stream_entries.iteritems():
+                            if entries.get(number, (0,))[0] == 0:
+                                entries[number] = entry
+                else:
+                    trailer, entries = self._readXrefStream(offset)
+                # Entries of newer updates replace older entries
+                for number, entry in entries.iteritems():
+                    if number not in xref:
+                        xref[number] = entry
+                if self._trailer is None:
+                    self._trailer = trailer
+                offset = trailer.get("Prev")
+        finally:
+            self._xref_loading = False
+        self._xref = xref
+        self._xref_offsets = offsets
+        return xref
+
+    def getTrailer(self):
+        """
+        Returns the trailer dictionary of the last update (with the "Root"
+        and "Info" entries).
+        """
+        self.getXref()
+        return self._trailer
+
+    def resolve(self, value):
+        """
+        Returns the referenced object if value is a Reference, or value.
+        """
+        depth = 0
+        while isinstance(value, Reference):
+            depth += 1
+            if 32 < depth:
+                raise ParserError("PDF: reference loop")
+            value = self.getObject(value.number)
+        return value
+
+    def getObject(self, number):
+        """
+        Read an object from its number (or a Reference) using the cross-
+        reference index. Returns its value (see ObjectReader.readValue()) or
+        a StreamObject, None for a free or missing object.
+        """
+        if isinstance(number, Reference):
+            number = number.number
+        entry = self.getXref().get(number)
+        if entry is None:
+            return None
+        if entry[0] == 1:
+            found, generation, value = self.readObjectAt(entry[1])
+            if found != number:
+                raise ParserError("PDF: object %s not found at offset %s"
+                    % (number, entry[1]))
+            if isinstance(value, StreamObject) and value.length is None:
+                length = self.resolve(value.dictionary.get("Length"))
+                if not isinstance(length, (int, long)):
+                    raise ParserError("PDF: invalid length of stream %s" % number)
+                value.length = length
+            return value
+        elif entry[0] == 2:
+            return self._readCompressedObject(number, entry[1], entry[2])
+        else:
+            return None
+
+    def _readCompressedObject(self, number, stream_number, index):
+        cached = self._object_stream
+        if cached is None or cached[0] != stream_number:
+            if self.getXref().get(stream_number, (0,))[0] != 1:
+                raise ParserError("PDF: invalid object stream %s" % stream_number)
+            stream = self.getObject(stream_number)
+            if not isinstance(stream, StreamObject) \
+            or stream.dictionary.get("Type") != "ObjStm":
+                raise ParserError("PDF: invalid object stream %s" % stream_number)
+            data = self.decodeStream(stream)
+            reader = ObjectReader(data, True)
+            offsets = []
+            for item in xrange(stream.dictionary.get("N", 0)):
+                offsets.append((reader.readInteger(), reader.readInteger()))
+            cached = (stream_number, stream.dictionary.get("First", 0), offsets, data)
+            self._object_stream = cached
+        stream_number, first, offsets, data = cached
+        if len(offsets) <= index or offsets[index][0] != number:
+            raise ParserError("PDF: object %s not found in object stream %s"
+                % (number, stream_number))
+        return ObjectReader(data, True, first + offsets[index][1]).readValue()
+
+    def decodeStream(self, stream):
+        """
+        Read and decode the data of a StreamObject. Only the FlateDecode
+        filter is supported.
+        """
+        if stream.length is None or MAX_STREAM_SIZE < stream.length \
+        or self._getFileSize() < stream.offset + stream.length:
+            raise ParserError("PDF: invalid stream length")
+        data = self.stream.readBytes(stream.offset * 8, stream.length)
+        filters = self.resolve(stream.dictionary.get("Filter", []))
+        parameters = self.resolve(stream.dictionary.get("DecodeParms", []))
+        if not isinstance(filters, list):
+            filters = [filters]
+        if not isinstance(parameters, list):
+            parameters = [parameters]
+        for index, name in enumerate(filters):
+            if index < len(parameters):
+                parameter = self.resolve(parameters[index])
+            else:
+                parameter = None
+            if not isinstance(parameter, dict):
+                parameter = {}
+            if name not in ("FlateDecode", "Fl"):
+                raise ParserError("PDF: unsupported stream filter %s" % name)
+            decompressor = zlib.decompressobj()
+            try:
+                data = decompressor.decompress(data, MAX_STREAM_SIZE)
+            except zlib.error, err:
+                raise ParserError("PDF: unable to decompress stream: %s" % err)
+            if decompressor.unconsumed_tail:
+                raise ParserError("PDF: decoded stream is too big")
+            data = applyPredictor(data, parameter)
+        return data
+
+    def getInfo(self):
+        """
+        Returns the document information dictionary (Title, Author,
+        CreationDate, etc.) with text strings decoded to Unicode, or an
+        empty dictionary. Strings of encrypted documents are not decrypted.
+        """
+        info = self.resolve(self.getTrailer().get("Info"))
+        if not isinstance(info, dict):
+            return {}
+        result = {}
+        for key, value in info.iteritems():
+            value = self.resolve(value)
+            if isinstance(value, Name):
+                value = unicode(value, "ISO-8859-1")
+            elif isinstance(value, str):
+                value = decodeText(value)
+            result[key] = value
+        return result
+
     # Size is not always determined by position of "%%EOF":
     # - updated documents have several of those
     # - PDF files should be parsed from *end*
     # => TODO: find when a document has been updated
 
     def createFields(self):
+        if self.use_xref:
+            for field in self.createXrefFields():
+                yield field
+            return
         yield Header(self, "header")
         yield Body(self, "body")
         yield CrossReferenceTable(self, "cross_ref_table")
         yield Trailer(self, "trailer")
 
+    def createXrefFields(self):
+        yield Header(self, "header")
+        file_size = self._getFileSize()
+        xref = self.getXref()
+        bounds = [(offset, "xref[]", "Cross-reference section")
+            for offset in self._xref_offsets]
+        for number, entry in xref.iteritems():
+            if entry[0] == 1:
+                bounds.append((entry[1], "object[]",
+                    "Object %u %u" % (number, entry[2])))
+        bounds = [bound for bound in bounds if bound[0] < file_size]
+        bounds.sort()
+        for index, (offset, name, description) in enumerate(bounds):
+            if offset * 8 < self.current_size:
+                self.warning("Invalid offset of %s", description)
+                continue
+            if self.current_size < offset * 8:
+                yield RawBytes(self, "unknown[]", offset - self.current_size // 8)
+            if index + 1 < len(bounds):
+                end = bounds[index+1][0]
+            else:
+                end = file_size
+            if offset < end:
+                yield RawBytes(self, name, end - offset, description)
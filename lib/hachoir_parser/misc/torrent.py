@@ -59,7 +59,7 @@ class TorrentString(FieldSet):
             raise ParserError("Invalid string length (%s)" % makePrintable(val.value, "ASCII", to_unicode=True))
         yield String(self, "separator", 1, "String length/value separator")
         if not len:
-            self.info("Empty string: len=%i" % len)
+            self.info("Empty string: len=%i", len)
             return
         if len<512:
             yield String(self, "value", len, "String value", charset="ISO-8859-1")
@@ -94,7 +94,7 @@ class NameHeader(FieldSet):
         try:
             return CHARSET_MAP[platform][encoding]
         except KeyError:
-            self.warning("TTF: Unknown charset (%s,%s)" % (platform, encoding))
+            self.warning("TTF: Unknown charset (%s,%s)", platform, encoding)
             return "ISO-8859-1"
 
     def createDescription(self):
@@ -183,14 +183,14 @@ def parseNames(self):
         # Skip duplicates values
         new = (entry["offset"].value, entry["length"].value)
         if last and last == new:
-            self.warning("Skip duplicate %s %s" % (entry.name, new))
+            self.warning("Skip duplicate %s %s", entry.name, new)
             continue
         last = (entry["offset"].value, entry["length"].value)
 
         # Skip negative offset
         offset = entry["offset"].value + self["offset"].value
         if offset < self.current_size//8:
-            self.warning("Skip value %s (negative offset)" % entry.name)
+            self.warning("Skip value %s (negative offset)", entry.name)
             continue
 
         # Add padding if any
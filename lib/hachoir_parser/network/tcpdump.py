@@ -16,12 +16,15 @@ from hachoir_parser import Parser
 from hachoir_core.field import (FieldSet, ParserError,
     Enum, Bytes, NullBytes, RawBytes,
     UInt8, UInt16, UInt32, Int32, TimestampUnix32,
-    Bit, Bits, NullBits)
-from hachoir_core.endian import NETWORK_ENDIAN, LITTLE_ENDIAN
+    Bit, Bits, NullBits, createOrphanField)
+from hachoir_core.endian import NETWORK_ENDIAN, LITTLE_ENDIAN, BIG_ENDIAN
 from hachoir_core.tools import humanDuration
 from hachoir_core.text_handler import textHandler, hexadecimal
-from hachoir_core.tools import createDict
+from hachoir_core.tools import createDict, createOffsetArray, timestampUNIX
 from hachoir_parser.network.common import MAC48_Address, IPv4_Address, IPv6_Address
+from datetime import timedelta
+from struct import unpack
+from array import array
 
 def diff(field):
     return humanDuration(field.value*1000)
@@ -417,7 +420,7 @@ class Ethernet(Layer2):
             (self["src"].display, self["dst"].display, self["protocol"].display)
 
 class Packet(FieldSet):
-    endian = LITTLE_ENDIAN
+    LAYER_DESC = ("icmp", "tcp", "udp", "arp")
 
     def __init__(self, parent, name, parser, first_name):
         FieldSet.__init__(self, parent, name)
@@ -427,7 +430,10 @@ class Packet(FieldSet):
 
     def createFields(self):
         yield TimestampUnix32(self, "ts_epoch", "Timestamp (Epoch)")
-        yield UInt32(self, "ts_nanosec", "Timestamp (nano second)")
+        if self.root.nanosecond:
+            yield UInt32(self, "ts_nanosec", "Timestamp (nano second)")
+        else:
+            yield UInt32(self, "ts_nanosec", "Timestamp (micro second)")
         yield UInt32(self, "caplen", "length of portion present")
         yield UInt32(self, "len", "length this packet (off wire)")
 
@@ -443,46 +449,140 @@ class Packet(FieldSet):
             yield RawBytes(self, "data", size)
 
     def getTimestamp(self):
-        nano_sec = float(self["ts_nanosec"].value) / 100
-        from datetime import timedelta
-        return self["ts_epoch"].value + timedelta(microseconds=nano_sec)
+        return self["ts_epoch"].value \
+            + self.root.createTimedelta(self["ts_nanosec"].value)
 
     def createDescription(self):
-        t0 = self["/packet[0]"].getTimestamp()
-#        ts = max(self.getTimestamp() - t0, t0)
-        ts = self.getTimestamp() - t0
-        #text = ["%1.6f: " % ts]
+        ts = self.getTimestamp() - self.root.getFirstTimestamp()
         text = ["%s: " % ts]
-        if "icmp" in self:
-            text.append(self["icmp"].description)
-        elif "tcp" in self:
-            text.append(self["tcp"].description)
-        elif "udp" in self:
-            text.append(self["udp"].description)
-        elif "arp" in self:
-            text.append(self["arp"].description)
+        # Parse all layers once, then only use the field dictionary
+        self._feedAll()
+        for name in self.LAYER_DESC:
+            if name in self._fields:
+                text.append(self._fields[name].description)
+                break
         else:
             text.append("Packet")
         return "".join(text)
 
+class PacketIndex(object):
+    """
+    Compact index of the packets of a capture file: one entry per record
+    with its address (in bytes), its timestamp (in seconds since Epoch),
+    its captured length and its length on the wire (in bytes).
+    """
+    def __init__(self):
+        self.offset = createOffsetArray()
+        self.timestamp = array('d')
+        self.caplen = array('L')
+        self.length = array('L')
+
+    def append(self, offset, timestamp, caplen, length):
+        self.offset.append(offset)
+        self.timestamp.append(timestamp)
+        self.caplen.append(caplen)
+        self.length.append(length)
+
+    def __len__(self):
+        return len(self.offset)
+
+    def __getitem__(self, index):
+        return (int(self.offset[index]), self.timestamp[index],
+            self.caplen[index], self.length[index])
+
+    def __iter__(self):
+        for index in xrange(len(self.offset)):
+            yield self[index]
+
+def decodeHeaders(link, data):
+    """
+    Decode the layer headers of a raw packet (without its record header).
+    Returns (layers, addresses, ports): layers is the list of layer names
+    (same names than Packet fields), addresses and ports are tuples
+    (source, destination) or None if the packet has no such information.
+    Addresses use the same format than IPv4_Address and IPv6_Address values.
+    """
+    layers = [link]
+    addresses = ports = None
+    if link == "ethernet":
+        proto_offset, offset = 12, 14
+    else:
+        proto_offset, offset = 14, 16
+    if len(data) < offset:
+        return layers, addresses, ports
+    proto = unpack(">H", data[proto_offset:proto_offset+2])[0]
+    if proto not in Layer2.PROTO_INFO:
+        return layers, addresses, ports
+    name = Layer2.PROTO_INFO[proto][0]
+    layers.append(name)
+    if name == "ipv4" and offset + 20 <= len(data):
+        hdr_size = (ord(data[offset]) & 0x0F) * 4
+        proto = ord(data[offset+9])
+        addresses = (
+            ".".join("%u" % ord(byte) for byte in data[offset+12:offset+16]),
+            ".".join("%u" % ord(byte) for byte in data[offset+16:offset+20]))
+        offset += hdr_size
+    elif name == "ipv6" and offset + 40 <= len(data):
+        proto = ord(data[offset+6])
+        addresses = (
+            ":".join("%04x" % part for part in unpack(">8H", data[offset+8:offset+24])),
+            ":".join("%04x" % part for part in unpack(">8H", data[offset+24:offset+40])))
+        offset += 40
+    else:
+        return layers, addresses, ports
+    if proto not in IP.PROTOCOL_INFO:
+        return layers, addresses, ports
+    name = IP.PROTOCOL_INFO[proto][0]
+    layers.append(name)
+    if name in ("tcp", "udp") and offset + 4 <= len(data):
+        ports = unpack(">HH", data[offset:offset+4])
+    return layers, addresses, ports
+
 class TcpdumpFile(Parser):
     PARSER_TAGS = {
         "id": "tcpdump",
         "category": "misc",
         "min_size": 24*8,
         "description": "Tcpdump file (network)",
-        "magic": (("\xd4\xc3\xb2\xa1", 0),),
+        "magic": (
+            ("\xd4\xc3\xb2\xa1", 0),
+            ("\xa1\xb2\xc3\xd4", 0),
+            ("\x4d\x3c\xb2\xa1", 0),
+            ("\xa1\xb2\x3c\x4d", 0)),
     }
+    # Correct endian is set in constructor
     endian = LITTLE_ENDIAN
 
+    # Magic => (endian, timestamps in nanosecond?)
+    MAGIC = {
+        "\xd4\xc3\xb2\xa1": (LITTLE_ENDIAN, False),
+        "\xa1\xb2\xc3\xd4": (BIG_ENDIAN, False),
+        "\x4d\x3c\xb2\xa1": (LITTLE_ENDIAN, True),
+        "\xa1\xb2\x3c\x4d": (BIG_ENDIAN, True),
+    }
+
     LINK_TYPE = {
           1: ("ethernet", Ethernet),
         113: ("unicast", Unicast),
     }
     LINK_TYPE_DESC = createDict(LINK_TYPE, 0)
 
+    # Maximum number of bytes read to filter a packet in iterPackets()
+    FILTER_SIZE = 128
+
+    def __init__(self, stream, **args):
+        magic = stream.readBytes(0, 4)
+        self.endian, self.nanosecond = self.MAGIC.get(magic, (LITTLE_ENDIAN, False))
+        if self.endian == BIG_ENDIAN:
+            self._record_format = ">IIII"
+        else:
+            self._record_format = "<IIII"
+        self._packet_index = None
+        self._first_timestamp = None
+        Parser.__init__(self, stream, **args)
+
     def validate(self):
-        if self["id"].value != "\xd4\xc3\xb2\xa1":
+        if self["id"].value not in self.MAGIC:
             return "Wrong file signature"
         if self["link_type"].value not in self.LINK_TYPE:
             return "Unknown link type"
@@ -496,10 +596,119 @@ class TcpdumpFile(Parser):
         yield Int32(self, "sigfigs", "accuracy of timestamps")
         yield UInt32(self, "snap_len", "max length saved portion of each pkt")
         yield Enum(UInt32(self, "link_type", "data link type"), self.LINK_TYPE_DESC)
-        link = self["link_type"].value
-        if link not in self.LINK_TYPE:
-            raise ParserError("Unknown link type: %s" % link)
-        name, parser = self.LINK_TYPE[link]
+        name, parser = self.getLinkType()
         while self.current_size < self.size:
             yield Packet(self, "packet[]", parser, name)
 
+    def getLinkType(self):
+        """
+        Get the first layer of the packets: (name, field set class).
+        """
+        link = self["link_type"].value
+        if link not in self.LINK_TYPE:
+            raise ParserError("Unknown link type: %s" % link)
+        return self.LINK_TYPE[link]
+
+    def createTimedelta(self, fraction):
+        """
+        Convert the sub-second part of a record timestamp to timedelta.
+        """
+        if self.nanosecond:
+            fraction //= 1000
+        return timedelta(microseconds=fraction)
+
+    def getFirstTimestamp(self):
+        if self._first_timestamp is None:
+            header = self.stream.readBytes(24*8, 8)
+            seconds, fraction = unpack(self._record_format[:3], header)
+            self._first_timestamp = timestampUNIX(seconds) \
+                + self.createTimedelta(fraction)
+        return self._first_timestamp
+
+    def iterRecords(self):
+        """
+        Iterate on packet records without creating any field: jump from
+        record header to record header using the captured length.
+        Generate tuples (offset, timestamp, caplen, len), where offset is
+        the address in bytes of the record header and timestamp is a number
+        of seconds since Epoch (float).
+        """
+        size = self.stream.size // 8
+        if self.nanosecond:
+            scale = 1e-9
+        else:
+            scale = 1e-6
+        format = self._record_format
+        read = self.stream.readBytes
+        offset = 24
+        while offset + 16 <= size:
+            seconds, fraction, caplen, length = unpack(format, read(offset*8, 16))
+            if size < offset + 16 + caplen:
+                self.warning("Truncated packet at offset %u", offset)
+                break
+            yield offset, seconds + fraction * scale, caplen, length
+            offset += 16 + caplen
+
+    def getPacketIndex(self):
+        """
+        Get the packet index (L{PacketIndex}), built at the first call.
+        """
+        if self._packet_index is None:
+            index = PacketIndex()
+            for record in self.iterRecords():
+                index.append(*record)
+            self._packet_index = index
+        return self._packet_index
+
+    def getPacket(self, index):
+        """
+        Create the Packet field set of the packet number 'index' without
+        parsing the previous packets. The field is not added to the parser.
+        """
+        offset = self.getPacketIndex().offset[index]
+        name, parser = self.getLinkType()
+        return createOrphanField(self, int(offset) * 8, Packet,
+            "packet[%u]" % index, parser, name)
+
+    def iterPackets(self, protocol=None, ip=None, port=None, start=None, end=None):
+        """
+        Iterate on packets matching all specified filters:
+        - protocol: layer name like "tcp", "udp", "icmp", "arp" or "ipv6" ;
+        - ip: source or destination address (eg. "192.168.0.1") ;
+        - port: TCP or UDP source or destination port ;
+        - start, end: time range in seconds since Epoch (end excluded).
+
+        Only layer headers of the packets are read to check the filters:
+        L{Packet} field sets are only created for matching packets.
+        """
+        index = self.getPacketIndex()
+        link = self.getLinkType()[0]
+        header_filter = (protocol, ip, port) != (None, None, None)
+        for number in xrange(len(index)):
+            timestamp = index.timestamp[number]
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and end <= timestamp:
+                continue
+            if header_filter:
+                offset = int(index.offset[number]) + 16
+                size = min(index.caplen[number], self.FILTER_SIZE)
+                if size:
+                    data = self.stream.readBytes(offset*8, size)
+                else:
+                    data = ''
+                layers, addresses, ports = decodeHeaders(link, data)
+                if protocol is not None and protocol not in layers:
+                    continue
+                if ip is not None and (not addresses or ip not in addresses):
+                    continue
+                if port is not None and (not ports or port not in ports):
+                    continue
+            yield self.getPacket(number)
+
+    def createContentSize(self):
+        index = self.getPacketIndex()
+        if not index:
+            return 24*8
+        offset, timestamp, caplen, length = index[len(index)-1]
+        return (offset + 16 + caplen) * 8
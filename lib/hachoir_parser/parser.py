@@ -89,7 +89,7 @@ class HachoirParser(object):
             try:
                 self._mime_type = self.createMimeType()
             except HACHOIR_ERRORS, err:
-                self.error("Error when creating MIME type: %s" % unicode(err))
+                self.error("Error when creating MIME type: %s", unicode(err))
             if not self._mime_type \
             and self.createMimeType != Parser.createMimeType:
                 self._mime_type = Parser.createMimeType(self)
@@ -11,6 +11,125 @@ from hachoir_core.field import (RootSeekableFieldSet, FieldSet, ParserError, Bit
     String, RawBytes, Bytes)
 from hachoir_core.text_handler import textHandler, hexadecimal
 from hachoir_core.endian import LITTLE_ENDIAN, BIG_ENDIAN
+from hachoir_core.tools import createOffsetArray
+from array import array
+from struct import unpack
+
+# Section types
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_HASH = 5
+SHT_DYNAMIC = 6
+SHT_NOTE = 7
+SHT_DYNSYM = 11
+SHT_GNU_HASH = 0x6ffffff6
+
+# Program header types
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_NOTE = 4
+
+# Dynamic section tags
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_STRSZ = 10
+DT_SONAME = 14
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+# Note types
+NT_GNU_BUILD_ID = 3
+
+MAX_DYNAMIC_ENTRIES = 100000
+MAX_NOTE_SIZE = 1024*1024
+
+def elfHash(name):
+    """
+    Hash function of the SysV symbol hash table (DT_HASH).
+
+    >>> elfHash("printf")
+    125371814
+    """
+    value = 0
+    for char in name:
+        value = (value << 4) + ord(char)
+        high = value & 0xF0000000
+        if high:
+            value ^= high >> 24
+        value &= ~high
+    return value
+
+def gnuHash(name):
+    """
+    Hash function of the GNU symbol hash table (DT_GNU_HASH).
+
+    >>> gnuHash("printf")
+    359345080
+    """
+    value = 5381
+    for char in name:
+        value = (value * 33 + ord(char)) & 0xFFFFFFFF
+    return value
+
+class SymbolTable(object):
+    """
+    Symbol table (.symtab or .dynsym) decoded in compact arrays: name
+    (offset in the string table), value, size, info (type and binding)
+    and section index. Names are only read when needed.
+    """
+    def __init__(self, data, strtab, is64bit, prefix):
+        if is64bit:
+            entry_size = 24
+            count = len(data) // entry_size
+            values = unpack(prefix + "IBBHQQ" * count, data[:count*entry_size])
+            name, info, shndx, value, size = (values[0::6], values[1::6],
+                values[3::6], values[4::6], values[5::6])
+        else:
+            entry_size = 16
+            count = len(data) // entry_size
+            values = unpack(prefix + "IIIBBH" * count, data[:count*entry_size])
+            name, value, size, info, shndx = (values[0::6], values[1::6],
+                values[2::6], values[3::6], values[5::6])
+        self.name = array('I', name)
+        self.value = createOffsetArray(value)
+        self.size = createOffsetArray(size)
+        self.info = array('B', info)
+        self.shndx = array('H', shndx)
+        self.strtab = strtab
+        self._positions = None
+
+    def __len__(self):
+        return len(self.name)
+
+    def getName(self, index):
+        offset = self.name[index]
+        end = self.strtab.find("\0", offset)
+        if end < 0:
+            end = len(self.strtab)
+        return self.strtab[offset:end]
+
+    def __getitem__(self, index):
+        """
+        Get the symbol: (name, value, size, type, binding, section index).
+        """
+        info = self.info[index]
+        return (self.getName(index), int(self.value[index]),
+            int(self.size[index]), info & 0xF, info >> 4, self.shndx[index])
+
+    def __iter__(self):
+        for index in xrange(len(self.name)):
+            yield self[index]
+
+    def find(self, name):
+        """
+        Get the index of the symbol called name (linear search, see also
+        ElfFile.lookupSymbol()). Raise KeyError if there is no such symbol.
+        """
+        if self._positions is None:
+            self._positions = dict((self.getName(index), index)
+                for index in xrange(len(self.name)))
+        return self._positions[name]
 
 class ElfHeader(FieldSet):
     LITTLE_ENDIAN_ID = 1
@@ -159,9 +278,7 @@ class SectionFlags(FieldSet):
 class SymbolStringTableOffset(UInt32):
     def createDisplay(self):
         section_index = self['/header/shstrndx'].value
-        section = self['/section['+str(section_index)+']']
-        text = section.value[self.value:]
-        return text.split('\0',1)[0]
+        return self.parent.root.getString(section_index, self.value)
 
 class SectionHeader32(FieldSet):
     static_size = 40*8
@@ -295,6 +412,12 @@ class ElfFile(HachoirParser, RootSeekableFieldSet):
     def __init__(self, stream, **args):
         RootSeekableFieldSet.__init__(self, None, "root", stream, None, stream.askSize(self))
         HachoirParser.__init__(self, stream, **args)
+        self._elf_info = None
+        self._sections = None
+        self._segments = None
+        self._string_tables = {}
+        self._symbols = {}
+        self._dynamic = None
 
     def validate(self):
         if self.stream.readBytes(0, len(self.MAGIC)) != self.MAGIC:
@@ -339,3 +462,319 @@ class ElfFile(HachoirParser, RootSeekableFieldSet):
         return "ELF Unix/BSD program/library: %s" % (
             self["header/class"].display)
 
+
+    def getElfInfo(self):
+        """
+        Read the ELF header without creating fields: returns (is64bit,
+        prefix, header) where prefix is the struct endian prefix ("<" or
+        ">") and header is the tuple (type, machine, version, entry, phoff,
+        shoff, flags, ehsize, phentsize, phnum, shentsize, shnum, shstrndx).
+        """
+        if self._elf_info is not None:
+            return self._elf_info
+        ident = self.stream.readBytes(0, 16)
+        is64bit = (ord(ident[4]) == 2)
+        if ord(ident[5]) == ElfHeader.BIG_ENDIAN_ID:
+            prefix = ">"
+        else:
+            prefix = "<"
+        if is64bit:
+            format = prefix + "HHIQQQIHHHHHH"
+            size = 48
+        else:
+            format = prefix + "HHIIIIIHHHHHH"
+            size = 36
+        header = unpack(format, self.stream.readBytes(16*8, size))
+        self._elf_info = (is64bit, prefix, header)
+        return self._elf_info
+
+    def getSections(self):
+        """
+        Read the section headers: list of (name, type, flags, address,
+        offset, size, link, info, entry_size) tuples.
+        """
+        if self._sections is not None:
+            return self._sections
+        is64bit, prefix, header = self.getElfInfo()
+        shoff, shentsize, shnum, shstrndx = header[5], header[10], header[11], header[12]
+        if is64bit:
+            format = prefix + "IIQQQQIIQQ"
+            size = 64
+        else:
+            format = prefix + "IIIIIIIIII"
+            size = 40
+        sections = []
+        if shoff and shnum and size <= shentsize:
+            data = self.stream.readBytes(shoff*8, shnum * shentsize)
+            for pos in xrange(0, shnum * shentsize, shentsize):
+                (name, type, flags, address, offset, sh_size,
+                 link, info, align, entry_size) = unpack(format, data[pos:pos+size])
+                sections.append([name, type, flags, address, offset, sh_size,
+                    link, info, entry_size])
+        # Section names are read using the section table
+        self._sections = sections
+        for section in sections:
+            section[0] = self.getString(shstrndx, section[0])
+        self._sections = [tuple(section) for section in sections]
+        return self._sections
+
+    def getSegments(self):
+        """
+        Read the program headers: list of (type, flags, offset, address,
+        file_size, mem_size) tuples.
+        """
+        if self._segments is not None:
+            return self._segments
+        is64bit, prefix, header = self.getElfInfo()
+        phoff, phentsize, phnum = header[4], header[8], header[9]
+        segments = []
+        if phoff and phnum:
+            data = self.stream.readBytes(phoff*8, phnum * phentsize)
+            for pos in xrange(0, phnum * phentsize, phentsize):
+                if is64bit:
+                    type, flags, offset, address, paddr, file_size, mem_size, align = \
+                        unpack(prefix + "IIQQQQQQ", data[pos:pos+56])
+                else:
+                    type, offset, address, paddr, file_size, mem_size, flags, align = \
+                        unpack(prefix + "8I", data[pos:pos+32])
+                segments.append((type, flags, offset, address, file_size, mem_size))
+        self._segments = segments
+        return segments
+
+    def address2file(self, address):
+        """
+        Convert a virtual address to a file offset using the loadable
+        segments, or None if the address is not mapped to the file.
+        """
+        for type, flags, offset, start, file_size, mem_size in self.getSegments():
+            if type == PT_LOAD and start <= address < start + file_size:
+                return offset + (address - start)
+        return None
+
+    def readSection(self, index):
+        """
+        Read the content of a section (empty string for SHT_NOBITS).
+        """
+        name, type, flags, address, offset, size = self.getSections()[index][:6]
+        if type == 8 or not size:
+            return ""
+        return self.stream.readBytes(offset*8, size)
+
+    def findSections(self, type=None, name=None):
+        """
+        Get the indexes of the sections matching a type and/or a name.
+        """
+        return [index for index, section in enumerate(self.getSections())
+            if (type is None or section[1] == type)
+            and (name is None or section[0] == name)]
+
+    def getString(self, section_index, offset):
+        """
+        Read a nul terminated string of a string table section.
+        The section content is cached.
+        """
+        try:
+            data = self._string_tables[section_index]
+        except KeyError:
+            if self._sections is None:
+                self.getSections()
+            if not(0 <= section_index < len(self._sections)):
+                return ""
+            data = self.readSection(section_index)
+            self._string_tables[section_index] = data
+        end = data.find("\0", offset)
+        if end < 0:
+            end = len(data)
+        return data[offset:end]
+
+    def getSymbols(self, type=SHT_DYNSYM):
+        """
+        Get the symbol table (SymbolTable) of the section of the type
+        SHT_DYNSYM (default) or SHT_SYMTAB, or None if there is none.
+        """
+        if type in self._symbols:
+            return self._symbols[type]
+        indexes = self.findSections(type)
+        if indexes:
+            section = self.getSections()[indexes[0]]
+            link = section[6]
+            self.getString(link, 0)
+            strtab = self._string_tables.get(link, "")
+            is64bit, prefix, header = self.getElfInfo()
+            table = SymbolTable(self.readSection(indexes[0]), strtab, is64bit, prefix)
+        else:
+            table = None
+        self._symbols[type] = table
+        return table
+
+    def getDynamic(self):
+        """
+        Read the dynamic section (.dynamic section or PT_DYNAMIC segment):
+        list of (tag, value) tuples.
+        """
+        if self._dynamic is not None:
+            return self._dynamic
+        indexes = self.findSections(SHT_DYNAMIC)
+        if indexes:
+            data = self.readSection(indexes[0])
+        else:
+            data = ""
+            for type, flags, offset, address, file_size, mem_size in self.getSegments():
+                if type == PT_DYNAMIC:
+                    data = self.stream.readBytes(offset*8, file_size)
+                    break
+        is64bit, prefix, header = self.getElfInfo()
+        if is64bit:
+            format = prefix + "QQ"
+            size = 16
+        else:
+            format = prefix + "II"
+            size = 8
+        dynamic = []
+        for pos in xrange(0, min(len(data), MAX_DYNAMIC_ENTRIES * size) - size + 1, size):
+            tag, value = unpack(format, data[pos:pos+size])
+            if tag == DT_NULL:
+                break
+            dynamic.append((tag, value))
+        self._dynamic = dynamic
+        return dynamic
+
+    def getDynamicStrings(self, tag):
+        """
+        Get the strings of the dynamic entries of the specified tag (eg.
+        DT_NEEDED), read in the dynamic string table (DT_STRTAB).
+        """
+        dynamic = self.getDynamic()
+        entries = dict(dynamic)
+        if DT_STRTAB not in entries:
+            return []
+        offset = self.address2file(entries[DT_STRTAB])
+        if offset is None:
+            return []
+        size = entries.get(DT_STRSZ)
+        if size is None or not self.stream.sizeGe((offset + size) * 8):
+            size = self.stream.size // 8 - offset
+        data = self.stream.readBytes(offset*8, size)
+        strings = []
+        for entry_tag, value in dynamic:
+            if entry_tag == tag:
+                end = data.find("\0", value)
+                if end < 0:
+                    end = len(data)
+                strings.append(data[value:end])
+        return strings
+
+    def getNeeded(self):
+        """
+        Get the names of the needed libraries (DT_NEEDED).
+        """
+        return self.getDynamicStrings(DT_NEEDED)
+
+    def getSoname(self):
+        """
+        Get the shared object name (DT_SONAME), or None.
+        """
+        names = self.getDynamicStrings(DT_SONAME)
+        if names:
+            return names[0]
+        return None
+
+    def getNotes(self):
+        """
+        Read the notes (SHT_NOTE sections or PT_NOTE segments): list of
+        (name, type, description) tuples.
+        """
+        is64bit, prefix, header = self.getElfInfo()
+        ranges = [(section[4], section[5])
+            for section in self.getSections() if section[1] == SHT_NOTE]
+        if not ranges:
+            ranges = [(segment[2], segment[4])
+                for segment in self.getSegments() if segment[0] == PT_NOTE]
+        notes = []
+        for offset, size in ranges:
+            data = self.stream.readBytes(offset*8, min(size, MAX_NOTE_SIZE))
+            pos = 0
+            while pos + 12 <= len(data):
+                name_size, desc_size, type = unpack(prefix + "III", data[pos:pos+12])
+                pos += 12
+                name = data[pos:pos+name_size].rstrip("\0")
+                pos += (name_size + 3) & ~3
+                notes.append((name, type, data[pos:pos+desc_size]))
+                pos += (desc_size + 3) & ~3
+        return notes
+
+    def getBuildId(self):
+        """
+        Get the GNU build identifier (hexadecimal string), or None.
+        """
+        for name, type, description in self.getNotes():
+            if name == "GNU" and type == NT_GNU_BUILD_ID:
+                return description.encode("hex")
+        return None
+
+    def lookupSymbol(self, name):
+        """
+        Find a dynamic symbol using the GNU hash table (DT_GNU_HASH) or the
+        SysV hash table (DT_HASH). Returns the symbol, see
+        SymbolTable.__getitem__(), or None if the symbol doesn't exist.
+        """
+        symbols = self.getSymbols(SHT_DYNSYM)
+        if not symbols:
+            return None
+        is64bit, prefix, header = self.getElfInfo()
+        indexes = self.findSections(SHT_GNU_HASH)
+        if indexes:
+            data = self.readSection(indexes[0])
+            nb_bucket, symbol_offset, bloom_size, bloom_shift = unpack(prefix + "4I", data[:16])
+            if not nb_bucket:
+                return None
+            if is64bit:
+                word_size = 8
+                word_format = "Q"
+            else:
+                word_size = 4
+                word_format = "I"
+            word_bits = word_size * 8
+            hash = gnuHash(name)
+            if bloom_size:
+                pos = 16 + ((hash // word_bits) % bloom_size) * word_size
+                word = unpack(prefix + word_format, data[pos:pos+word_size])[0]
+                mask = (1 << (hash % word_bits)) | (1 << ((hash >> bloom_shift) % word_bits))
+                if word & mask != mask:
+                    return None
+            pos = 16 + bloom_size * word_size
+            index = unpack(prefix + "I", data[pos + (hash % nb_bucket)*4:][:4])[0]
+            if not index:
+                return None
+            chains = pos + nb_bucket * 4
+            while index < len(symbols):
+                pos = chains + (index - symbol_offset) * 4
+                value = unpack(prefix + "I", data[pos:pos+4])[0]
+                if (value | 1) == (hash | 1) and symbols.getName(index) == name:
+                    return symbols[index]
+                if value & 1:
+                    break
+                index += 1
+            return None
+        indexes = self.findSections(SHT_HASH)
+        if indexes:
+            data = self.readSection(indexes[0])
+            nb_bucket, nb_chain = unpack(prefix + "II", data[:8])
+            if not nb_bucket:
+                return None
+            pos = 8 + (elfHash(name) % nb_bucket) * 4
+            index = unpack(prefix + "I", data[pos:pos+4])[0]
+            chains = 8 + nb_bucket * 4
+            visited = 0
+            while index and index < len(symbols) and visited < nb_chain:
+                if symbols.getName(index) == name:
+                    return symbols[index]
+                pos = chains + index * 4
+                index = unpack(prefix + "I", data[pos:pos+4])[0]
+                visited += 1
+            return None
+        # No hash table
+        try:
+            return symbols[symbols.find(name)]
+        except KeyError:
+            return None
@@ -13,13 +13,37 @@ from hachoir_parser import HachoirParser
 from hachoir_core.endian import LITTLE_ENDIAN
 from hachoir_core.field import (FieldSet, RootSeekableFieldSet,
     UInt16, UInt32, String,
-    RawBytes, PaddingBytes)
+    RawBytes, PaddingBytes, ParserError)
 from hachoir_core.text_handler import textHandler, hexadecimal
 from hachoir_parser.program.exe_ne import NE_Header
-from hachoir_parser.program.exe_pe import PE_Header, PE_OptHeader, SectionHeader
-from hachoir_parser.program.exe_res import PE_Resource, NE_VersionInfoNode
+from hachoir_parser.program.exe_pe import (PE_Header, PE_OptHeader, SectionHeader,
+    SectionIndex, PE_HEADER, SECTION_HEADER)
+from hachoir_parser.program.exe_res import (PE_Resource,
+    VersionInfoNode, NE_VersionInfoNode,
+    ResourceIndex, readPEResourceIndex, readNEResourceIndex,
+    RT_ICON, RT_STRING, RT_VERSION)
+from hachoir_core.field import createOrphanField
+from struct import unpack
 
 MAX_NB_SECTION = 50
+MAX_IMPORT_DLL = 1024
+MAX_IMPORT_FUNCTION = 65536
+MAX_EXPORT_FUNCTION = 65536
+MAX_DEBUG_ENTRY = 64
+MAX_STRING_LENGTH = 1024
+
+# Sizes of the first reads of strings (bytes) and import thunks (number of
+# thunks): the read size is doubled until the terminator is found
+STRING_READ_SIZE = 32
+THUNK_READ_COUNT = 16
+
+# Optional header signatures
+PE32_SIGNATURE = 0x010b
+PE32_PLUS_SIGNATURE = 0x020b
+
+# Index of the data directories, eg. DIRECTORY_INDEX["import"] = 1
+DIRECTORY_INDEX = dict((name, index)
+    for index, name in PE_OptHeader.DIRECTORY_NAME.iteritems())
 
 class MSDosHeader(FieldSet):
     static_size = 64*8
@@ -72,6 +96,11 @@ class ExeFile(HachoirParser, RootSeekableFieldSet):
     def __init__(self, stream, **args):
         RootSeekableFieldSet.__init__(self, None, "root", stream, None, stream.askSize(self))
         HachoirParser.__init__(self, stream, **args)
+        self._pe_info = None
+        self._section_index = None
+        self._imports = None
+        self._exports = None
+        self._resource_index = None
 
     def validate(self):
         if self.stream.readBytes(0, 2) != 'MZ':
@@ -105,12 +134,10 @@ class ExeFile(HachoirParser, RootSeekableFieldSet):
     def parseNE_Executable(self):
         yield NE_Header(self, "ne_header")
 
-        # FIXME: Compute resource offset instead of using searchBytes()
-        # Ugly hack to get find version info structure
-        start = self.current_size
-        addr = self.stream.searchBytes('VS_VERSION_INFO', start)
-        if addr:
-            self.seekBit(addr-32)
+        keys = self.getResourceIndex().find(RT_VERSION)
+        if keys:
+            offset = self.getResourceIndex()[keys[0]][0]
+            self.seekByte(offset, relative=False)
             yield NE_VersionInfoNode(self, "info")
 
     def parsePortableExecutable(self):
@@ -165,6 +192,355 @@ class ExeFile(HachoirParser, RootSeekableFieldSet):
                 self._is_ne = True
         return self._is_ne
 
+    def getPEInfo(self):
+        """
+        Read the PE headers without creating fields: returns (is_pe32_plus,
+        directories, section_offset, nb_section, header_size) where
+        directories is the list of the data directories (rva, size) and
+        section_offset is the offset (in bytes) of the section table.
+        """
+        if self._pe_info is not None:
+            return self._pe_info
+        if not self.isPE():
+            raise ParserError("Not a PE program")
+        offset = self["msdos/next_offset"].value + 4
+        cpu, nb_section, creation_date, ptr_to_sym, nb_symbols, opt_size, flags = \
+            PE_HEADER.unpack(self.stream.readBytes(offset*8, PE_HEADER.size))
+        offset += PE_HEADER.size
+        section_offset = offset + opt_size
+        is_pe32_plus = False
+        directories = []
+        header_size = 0
+        if 2 <= opt_size:
+            data = self.stream.readBytes(offset*8, opt_size)
+            signature = unpack("<H", data[:2])[0]
+            if signature == PE32_PLUS_SIGNATURE:
+                is_pe32_plus = True
+                dir_offset = 112
+            elif signature == PE32_SIGNATURE:
+                dir_offset = 96
+            else:
+                raise ParserError("Invalid PE optional header signature")
+            if dir_offset <= opt_size:
+                header_size = unpack("<I", data[60:64])[0]
+                nb_directory = unpack("<I", data[dir_offset-4:dir_offset])[0]
+                nb_directory = min(nb_directory, (opt_size - dir_offset) // 8)
+                directories = [unpack("<II", data[pos:pos+8])
+                    for pos in xrange(dir_offset, dir_offset + nb_directory*8, 8)]
+        self._pe_info = (is_pe32_plus, directories, section_offset, nb_section, header_size)
+        return self._pe_info
+
+    def getSectionIndex(self):
+        """
+        Get the RVA => file offset map (SectionIndex), built once from
+        the section table.
+        """
+        if self._section_index is not None:
+            return self._section_index
+        is_pe32_plus, directories, offset, nb_section, header_size = self.getPEInfo()
+        if MAX_NB_SECTION < nb_section:
+            raise ParserError("Invalid number of section (%s)" % nb_section)
+        size = SECTION_HEADER.size
+        data = self.stream.readBytes(offset*8, nb_section * size)
+        sections = []
+        for pos in xrange(0, nb_section * size, size):
+            name, mem_size, rva, phys_size, phys_off = \
+                SECTION_HEADER.unpack(data[pos:pos+size])
+            sections.append((rva, mem_size, phys_off, phys_size))
+        self._section_index = SectionIndex(sections, header_size)
+        return self._section_index
+
+    def rva2file(self, rva):
+        """
+        Convert a RVA to a file offset (in bytes), or None if the RVA is
+        not mapped to the file.
+        """
+        return self.getSectionIndex().rva2file(rva)
+
+    def getDataDirectory(self, name):
+        """
+        Get the data directory called name (eg. "import") of the optional
+        header: (rva, size), or None if the directory is empty.
+        """
+        directories = self.getPEInfo()[1]
+        index = DIRECTORY_INDEX[name]
+        if len(directories) <= index:
+            return None
+        rva, size = directories[index]
+        if not(rva and size):
+            return None
+        return rva, size
+
+    def readRVA(self, rva, size):
+        """
+        Read at most size bytes at the RVA: stop at the end of the section
+        data. Raise a ParserError if the RVA is not mapped to the file.
+        """
+        index = self.getSectionIndex()
+        offset = index.rva2file(rva)
+        if offset is None:
+            raise ParserError("RVA 0x%08x is not mapped to the file" % rva)
+        size = min(size, index.fileSize(rva))
+        if not self.stream.sizeGe((offset + size) * 8):
+            size = max(self.stream.size // 8 - offset, 0)
+        return self.stream.readBytes(offset*8, size)
+
+    def readStringRVA(self, rva):
+        """
+        Read a nul terminated string at the RVA (at most MAX_STRING_LENGTH
+        bytes).
+        """
+        size = STRING_READ_SIZE
+        while True:
+            data = self.readRVA(rva, size)
+            pos = data.find("\0")
+            if 0 <= pos:
+                return data[:pos]
+            if len(data) < size or MAX_STRING_LENGTH <= size:
+                return data
+            size = min(size * 2, MAX_STRING_LENGTH)
+
+    def _readThunks(self, rva, thunk_format, thunk_size):
+        """
+        Read the array of import thunks at the RVA up to the null thunk,
+        by blocks of growing size.
+        """
+        thunks = []
+        count = THUNK_READ_COUNT
+        while len(thunks) < MAX_IMPORT_FUNCTION:
+            count = min(count, MAX_IMPORT_FUNCTION - len(thunks))
+            data = self.readRVA(rva, count * thunk_size)
+            nb_thunk = len(data) // thunk_size
+            values = unpack("<%u%s" % (nb_thunk, thunk_format),
+                data[:nb_thunk * thunk_size])
+            if 0 in values:
+                thunks.extend(values[:values.index(0)])
+                break
+            thunks.extend(values)
+            if nb_thunk < count:
+                break
+            rva += nb_thunk * thunk_size
+            count *= 2
+        return thunks
+
+    def imports(self):
+        """
+        Read the import directory: list of (dll name, functions) where
+        functions is a list of function names (str) or ordinals (int).
+        """
+        if self._imports is not None:
+            return self._imports
+        is_pe32_plus = self.getPEInfo()[0]
+        if is_pe32_plus:
+            thunk_format = "Q"
+            thunk_size = 8
+            ordinal_flag = 1 << 63
+        else:
+            thunk_format = "I"
+            thunk_size = 4
+            ordinal_flag = 1 << 31
+        imports = []
+        directory = self.getDataDirectory("import")
+        if directory:
+            rva = directory[0]
+            for index in xrange(MAX_IMPORT_DLL):
+                data = self.readRVA(rva + index*20, 20)
+                if len(data) < 20:
+                    break
+                lookup_rva, date, forwarder, name_rva, thunk_rva = unpack("<5I", data)
+                if not(lookup_rva or name_rva or thunk_rva):
+                    break
+                name = self.readStringRVA(name_rva)
+                thunks = self._readThunks(lookup_rva or thunk_rva,
+                    thunk_format, thunk_size)
+                functions = []
+                for thunk in thunks:
+                    if thunk & ordinal_flag:
+                        functions.append(int(thunk & 0xFFFF))
+                    else:
+                        # Skip the hint
+                        functions.append(self.readStringRVA((thunk & 0x7FFFFFFF) + 2))
+                imports.append((name, functions))
+        self._imports = imports
+        return imports
+
+    def exports(self):
+        """
+        Read the export directory: list of (ordinal, name, address) sorted
+        by ordinal. name is None for functions exported by ordinal only.
+        address is a RVA, or a string "DLL.function" for forwarded
+        functions.
+        """
+        if self._exports is not None:
+            return self._exports
+        exports = []
+        directory = self.getDataDirectory("export")
+        if directory:
+            dir_rva, dir_size = directory
+            data = self.readRVA(dir_rva, 40)
+            if len(data) < 40:
+                raise ParserError("Truncated export directory")
+            (name_rva, base, nb_function, nb_name,
+             functions_rva, names_rva, ordinals_rva) = unpack("<12x7I", data)
+            if MAX_EXPORT_FUNCTION < nb_function or MAX_EXPORT_FUNCTION < nb_name:
+                raise ParserError("Invalid number of exported functions")
+            addresses = []
+            if nb_function:
+                data = self.readRVA(functions_rva, nb_function*4)
+                addresses = unpack("<%uI" % (len(data) // 4), data[:len(data) & ~3])
+            names = {}
+            if nb_name:
+                data = self.readRVA(names_rva, nb_name*4)
+                name_rvas = unpack("<%uI" % (len(data) // 4), data[:len(data) & ~3])
+                data = self.readRVA(ordinals_rva, nb_name*2)
+                ordinals = unpack("<%uH" % (len(data) // 2), data[:len(data) & ~1])
+                for name_rva, ordinal in zip(name_rvas, ordinals):
+                    names[ordinal] = self.readStringRVA(name_rva)
+            for index, address in enumerate(addresses):
+                if not address:
+                    continue
+                if dir_rva <= address < dir_rva + dir_size:
+                    address = self.readStringRVA(address)
+                exports.append((base + index, names.get(index), address))
+        self._exports = exports
+        return exports
+
+    def relocations(self):
+        """
+        Iterate on the base relocations: generate (rva, type) tuples.
+        """
+        directory = self.getDataDirectory("relocation")
+        if not directory:
+            return
+        data = self.readRVA(*directory)
+        pos = 0
+        while pos + 8 <= len(data):
+            page_rva, size = unpack("<II", data[pos:pos+8])
+            if size < 8:
+                break
+            count = (min(pos + size, len(data)) - pos - 8) // 2
+            for entry in unpack("<%uH" % count, data[pos+8:pos+8+count*2]):
+                type = entry >> 12
+                if type:
+                    # Type 0 (absolute) is used as padding
+                    yield page_rva + (entry & 0xFFF), type
+            pos += size
+
+    def debug_entries(self):
+        """
+        Read the debug directory: list of (type, creation date, file
+        offset, size) tuples, type 2 is CodeView.
+        """
+        directory = self.getDataDirectory("debug")
+        if not directory:
+            return []
+        rva, size = directory
+        nb_entry = min(size // 28, MAX_DEBUG_ENTRY)
+        data = self.readRVA(rva, nb_entry*28)
+        entries = []
+        for pos in xrange(0, len(data) - 27, 28):
+            date, type, size, data_rva, offset = unpack("<4xI4xIIII", data[pos:pos+28])
+            entries.append((type, date, offset, size))
+        return entries
+
+    def getResourceIndex(self):
+        """
+        Get the index of the resources (ResourceIndex), built from the
+        resource directories (PE) or the resource table (NE) without
+        reading the resource data. Returns None for MS-DOS programs.
+        """
+        if self._resource_index is not None:
+            return self._resource_index
+        if self.isPE():
+            directory = self.getDataDirectory("resource")
+            if directory:
+                index = readPEResourceIndex(self.readRVA, self.rva2file, directory[0])
+            else:
+                index = ResourceIndex()
+        elif self.isNE():
+            header = self["msdos/next_offset"].value
+            offset = self["ne_header/rsrc_ofs"].value
+            if offset != self["ne_header/res_name_tab_ofs"].value:
+                index = readNEResourceIndex(self.stream, header + offset)
+            else:
+                index = ResourceIndex()
+        else:
+            return None
+        self._resource_index = index
+        return index
+
+    def readResource(self, key):
+        """
+        Read the data of a resource: key is (type, name, language), see
+        getResourceIndex().
+        """
+        offset, size, codepage = self.getResourceIndex()[key]
+        return self.stream.readBytes(offset*8, size)
+
+    def icons(self):
+        """
+        Read the icons: list of (key, data) where data is an icon image
+        (bitmap header and data, without icon file header).
+        """
+        index = self.getResourceIndex()
+        if not index:
+            return []
+        return [(key, self.readResource(key)) for key in index.find(RT_ICON)]
+
+    def string_table(self):
+        """
+        Read the string tables: dictionary (string identifier, language)
+        => unicode string.
+        """
+        index = self.getResourceIndex()
+        strings = {}
+        if not index:
+            return strings
+        for key in index.find(RT_STRING):
+            if not isinstance(key[1], (int, long)):
+                continue
+            data = self.readResource(key)
+            pos = 0
+            # Each block stores 16 strings
+            for string_id in xrange((key[1] - 1) * 16, key[1] * 16):
+                if len(data) < pos + 2:
+                    break
+                length = unpack("<H", data[pos:pos+2])[0] * 2
+                pos += 2
+                if length:
+                    strings[string_id, key[2]] = unicode(data[pos:pos+length], "UTF-16-LE", "replace")
+                pos += length
+        return strings
+
+    def version_info(self):
+        """
+        Get the strings of the version information resource, eg.
+        {u"FileVersion": u"1.0", ...}, or None if there is no version
+        information.
+        """
+        index = self.getResourceIndex()
+        if not index:
+            return None
+        keys = index.find(RT_VERSION)
+        if not keys:
+            return None
+        if self.isPE():
+            node_class = VersionInfoNode
+        else:
+            node_class = NE_VersionInfoNode
+        offset = index[keys[0]][0]
+        root = createOrphanField(self, offset*8, node_class, "version_info")
+        strings = {}
+        nodes = [root]
+        while nodes:
+            node = nodes.pop()
+            for field in node:
+                if field.name.startswith("node["):
+                    nodes.append(field)
+                elif field.name == "value" and isinstance(field.value, unicode):
+                    strings[node["name"].value] = field.value.rstrip(u"\0")
+        return strings
+
     def getResource(self):
         # MS-DOS program: no resource
         if not self.isPE():
@@ -198,19 +574,9 @@ class ExeFile(HachoirParser, RootSeekableFieldSet):
 
     def createContentSize(self):
         if self.isPE():
-            size = 0
-            for index in xrange(self["pe_header/nb_section"].value):
-                section = self["section_hdr[%u]" % index]
-                section_size = section["phys_size"].value
-                if not section_size:
-                    continue
-                section_size = (section_size + section["phys_off"].value) * 8
-                if size:
-                    size = max(size, section_size)
-                else:
-                    size = section_size
+            size = self.getSectionIndex().getContentSize()
             if size:
-                return size
+                return size*8
             else:
                 return None
         elif self.isNE():
@@ -4,6 +4,87 @@ from hachoir_core.field import (FieldSet, ParserError,
     PaddingBytes, PaddingBits, NullBytes, NullBits)
 from hachoir_core.text_handler import textHandler, hexadecimal, filesizeHandler
 from hachoir_core.error import HACHOIR_ERRORS
+from hachoir_core.tools import createOffsetArray
+from bisect import bisect_right
+from struct import Struct
+
+# PE header (after the signature): cpu, nb_section, creation_date,
+# ptr_to_sym, nb_symbols, opt_hdr_size, flags
+PE_HEADER = Struct("<HHIIIHH")
+# Section header: name, mem_size, rva, phys_size, phys_off
+SECTION_HEADER = Struct("<8sIIII16x")
+
+class SectionIndex(object):
+    """
+    RVA to file offset map built from the section table: sections sorted
+    by RVA (rva, mem_size, phys_off and phys_size arrays, in bytes).
+    """
+    def __init__(self, sections, header_size=0):
+        """
+        sections: list of (rva, mem_size, phys_off, phys_size) tuples.
+        header_size: size of the headers, mapped at RVA 0.
+        """
+        sections = sorted(sections)
+        self.rva = createOffsetArray(section[0] for section in sections)
+        self.mem_size = createOffsetArray(section[1] for section in sections)
+        self.phys_off = createOffsetArray(section[2] for section in sections)
+        self.phys_size = createOffsetArray(section[3] for section in sections)
+        self.header_size = header_size
+
+    def __len__(self):
+        return len(self.rva)
+
+    def find(self, rva):
+        """
+        Get the index of the section containing rva, or None.
+        """
+        index = bisect_right(self.rva, rva) - 1
+        if index < 0:
+            return None
+        size = max(self.mem_size[index], self.phys_size[index])
+        if self.rva[index] + size <= rva:
+            return None
+        return index
+
+    def rva2file(self, rva):
+        """
+        Convert a RVA to a file offset (in bytes). Returns None if the RVA
+        is not mapped to the file (eg. uninitialized data).
+        """
+        index = self.find(rva)
+        if index is None:
+            if rva < self.header_size and (not self.rva or rva < self.rva[0]):
+                return rva
+            return None
+        offset = rva - int(self.rva[index])
+        if self.phys_size[index] <= offset:
+            return None
+        return int(self.phys_off[index]) + offset
+
+    def fileSize(self, rva):
+        """
+        Number of bytes of the file mapped from rva to the end of its
+        section (0 if the RVA is not mapped).
+        """
+        index = self.find(rva)
+        if index is None:
+            if rva < self.header_size and (not self.rva or rva < self.rva[0]):
+                return self.header_size - rva
+            return 0
+        return max(int(self.phys_size[index]) - (rva - int(self.rva[index])), 0)
+
+    def getContentSize(self):
+        """
+        End of the last section in the file (in bytes), or None.
+        """
+        size = None
+        for index in xrange(len(self.rva)):
+            if not self.phys_size[index]:
+                continue
+            end = int(self.phys_off[index] + self.phys_size[index])
+            if size is None or size < end:
+                size = end
+        return size
 
 class SectionHeader(FieldSet):
     static_size = 40 * 8
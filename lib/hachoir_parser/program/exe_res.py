@@ -18,10 +18,18 @@ from hachoir_core.text_handler import textHandler, filesizeHandler, hexadecimal
 from hachoir_core.tools import createDict, paddingSize, alignValue, makePrintable
 from hachoir_core.error import HACHOIR_ERRORS
 from hachoir_parser.common.win32 import BitmapInfoHeader
+from struct import unpack
 
 MAX_DEPTH = 5
 MAX_INDEX_PER_HEADER = 300
 MAX_NAME_PER_HEADER = MAX_INDEX_PER_HEADER
+MAX_NE_RESOURCE = 4096
+
+# Resource types
+RT_ICON = 3
+RT_STRING = 6
+RT_GROUP_ICON = 14
+RT_VERSION = 16
 
 class Version(FieldSet):
     static_size = 32
@@ -356,7 +364,7 @@ class PE_Resource(SeekableFieldSet):
         while subdirs:
             depth += 1
             if MAX_DEPTH < depth:
-                self.error("EXE resource: depth too high (%s), stop parsing directories" % depth)
+                self.error("EXE resource: depth too high (%s), stop parsing directories", depth)
                 break
             newsubdirs = []
             for index, subdir in enumerate(subdirs):
@@ -367,7 +375,7 @@ class PE_Resource(SeekableFieldSet):
                             newsubdirs.append(field)
                         yield field
                 except HACHOIR_ERRORS, err:
-                    self.error("Unable to create directory %s: %s" % (name, err))
+                    self.error("Unable to create directory %s: %s", name, err)
             subdirs = newsubdirs
             alldirs.extend(subdirs)
 
@@ -399,7 +407,7 @@ class PE_Resource(SeekableFieldSet):
                     yield padding
                 yield ResourceContent(self, "content[]", entry)
             except HACHOIR_ERRORS, err:
-                self.warning("Error when parsing entry %s: %s" % (entry.path, err))
+                self.warning("Error when parsing entry %s: %s", entry.path, err)
 
         size = (self.size - self.current_size) // 8
         if size:
@@ -443,3 +451,127 @@ class NE_VersionInfoNode(FieldSet):
 #            text += "=%s" % self["value"].value
         return text
 
+
+class ResourceIndex(object):
+    """
+    Index of the resources of a program: (type, name, language) =>
+    (offset, size, codepage), offset and size are in bytes. Type and name
+    are identifiers (int) or names (unicode), language is None for NE
+    programs. Built from the resource directories, without reading the
+    resource data.
+    """
+    def __init__(self):
+        self.keys = []
+        self.entries = {}
+
+    def append(self, key, offset, size, codepage=0):
+        if key not in self.entries:
+            self.keys.append(key)
+        self.entries[key] = (offset, size, codepage)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __getitem__(self, key):
+        return self.entries[key]
+
+    def find(self, type, name=None, language=None):
+        """
+        Get the list of the keys of the resources of the specified type
+        (and name and language, if set).
+        """
+        return [key for key in self.keys
+            if key[0] == type
+            and (name is None or key[1] == name)
+            and (language is None or key[2] == language)]
+
+def readPEResourceIndex(read, rva2file, root_rva):
+    """
+    Build the ResourceIndex of a PE program from its resource directories
+    (type, name and language levels). read(rva, size) reads bytes at a
+    RVA, rva2file(rva) converts a RVA to a file offset and root_rva is the
+    RVA of the root directory.
+    """
+    def readExact(rva, size):
+        data = read(rva, size)
+        if len(data) != size:
+            raise ParserError("EXE resource: truncated directory")
+        return data
+
+    def readName(offset):
+        length = unpack("<H", readExact(root_rva + offset, 2))[0]
+        data = readExact(root_rva + offset + 2, length*2)
+        return unicode(data, "UTF-16-LE", "replace")
+
+    def readDirectory(offset):
+        nb_name, nb_index = unpack("<12xHH", readExact(root_rva + offset, 16))
+        count = nb_name + nb_index
+        if MAX_NAME_PER_HEADER < nb_name or MAX_INDEX_PER_HEADER < nb_index:
+            raise ParserError("EXE resource: invalid number of entries (%s)" % count)
+        data = readExact(root_rva + offset + 16, count*8)
+        for pos in xrange(0, len(data) - 7, 8):
+            name, child = unpack("<II", data[pos:pos+8])
+            if name & 0x80000000:
+                name = readName(name & 0x7FFFFFFF)
+            yield name, child
+
+    index = ResourceIndex()
+    visited = set()
+    stack = [((), 0)]
+    while stack:
+        path, offset = stack.pop()
+        if offset in visited:
+            raise ParserError("EXE resource: loop in the directories")
+        visited.add(offset)
+        entries = list(readDirectory(offset))
+        entries.reverse()
+        for name, child in entries:
+            key = path + (name,)
+            if child & 0x80000000:
+                if 3 <= len(key):
+                    raise ParserError("EXE resource: directory too deep")
+                stack.append((key, child & 0x7FFFFFFF))
+                continue
+            if len(key) == 2:
+                # No language directory
+                key += (0,)
+            elif len(key) != 3:
+                continue
+            data_rva, size, codepage = unpack("<III", readExact(root_rva + child, 12))
+            offset = rva2file(data_rva)
+            if offset is not None:
+                index.append(key, offset, size, codepage)
+    return index
+
+def readNEResourceIndex(stream, offset):
+    """
+    Build the ResourceIndex of a NE program from its resource table
+    starting at offset (in bytes).
+    """
+    def readName(name_id):
+        if name_id & 0x8000:
+            return name_id & 0x7FFF
+        length = ord(stream.readBytes((offset + name_id)*8, 1))
+        return unicode(stream.readBytes((offset + name_id + 1)*8, length), "ISO-8859-1")
+
+    index = ResourceIndex()
+    shift = unpack("<H", stream.readBytes(offset*8, 2))[0]
+    if 16 < shift:
+        raise ParserError("EXE resource: invalid alignment shift (%s)" % shift)
+    pos = offset + 2
+    while len(index) < MAX_NE_RESOURCE:
+        type_id, count = unpack("<HH", stream.readBytes(pos*8, 4))
+        if not type_id:
+            break
+        res_type = readName(type_id)
+        pos += 8
+        data = stream.readBytes(pos*8, count*12)
+        pos += count*12
+        for entry in xrange(0, count*12, 12):
+            res_offset, res_size, flags, name_id = unpack("<HHHH", data[entry:entry+8])
+            index.append((res_type, readName(name_id), None),
+                res_offset << shift, res_size << shift)
+    return index
@@ -25,6 +25,13 @@ Introduction:
       what type of CPInfo they are allowed to points to.  They also have a
       custom display method, usually printing something like "->  foo", where
       foo is the str() of their target CPInfo.
+ * For quick access (eg. dependency scanning of JAR files), the constant pool
+   is also decoded in one pass from the raw data into a flat table (see
+   ConstantPoolTable and JavaCompiledClassFile.getConstantPool()), and
+   getSummary() returns the class name, super class, interfaces, fields,
+   methods and referenced classes without creating any field.  The bytecode
+   of Code attributes is stored in raw fields unless the parse_bytecode
+   option is set (see AttributeInfo.getBytecode()).
 
 References:
  * The Java Virtual Machine Specification, 2nd edition, chapter 4, in HTML:
@@ -66,8 +73,36 @@ from hachoir_core.field import (
         Int8, UInt8, Int16, UInt16, Int32, UInt32, Int64,
         Bit, NullBits )
 from hachoir_core.endian import BIG_ENDIAN
+from hachoir_core.field.helper import createOrphanField
 from hachoir_core.text_handler import textHandler, hexadecimal
 from hachoir_core.tools import paddingSize
+from array import array
+from struct import unpack
+import re
+
+# Maximum size of a class file read by JavaCompiledClassFile.getClassData()
+MAX_CLASS_SIZE = 64 * 1024 * 1024
+
+# Size in bytes of the constant pool entries (excluding the tag), Utf8
+# entries (tag 1) have a variable size
+CONSTANT_SIZE = {
+     3: 4,  # Integer
+     4: 4,  # Float
+     5: 8,  # Long
+     6: 8,  # Double
+     7: 2,  # Class
+     8: 2,  # String
+     9: 4,  # Fieldref
+    10: 4,  # Methodref
+    11: 4,  # InterfaceMethodref
+    12: 4,  # NameAndType
+    15: 3,  # MethodHandle
+    16: 2,  # MethodType
+    17: 4,  # Dynamic
+    18: 4,  # InvokeDynamic
+    19: 2,  # Module
+    20: 2,  # Package
+}
 
 ###############################################################################
 def parse_flags(flags, flags_dict, show_unknown_flags=True, separator=" "):
@@ -167,6 +202,22 @@ def parse_any_descriptor(descr, name=None):
         return parse_field_descriptor(descr, name)
 
 
+descriptor_class_regex = re.compile(r"L([^;]+);")
+
+def descriptor_classes(descr):
+    """
+    Returns the list of the class names (with dots) used in a field or method
+    descriptor, or in an array class name.
+
+    >>> descriptor_classes("(I[Ljava/lang/String;Ljava/util/Map;)V")
+    ['java.lang.String', 'java.util.Map']
+    >>> descriptor_classes("[[I")
+    []
+    """
+    return [name.replace("/", ".")
+        for name in descriptor_class_regex.findall(descr)]
+
+
 ###############################################################################
 class FieldArray(FieldSet):
     """
@@ -234,11 +285,13 @@ class CPIndex(UInt16):
         self.getOriginalDisplay = lambda: self.value
 
     def createDisplay(self):
-        cp_entry = self.get_cp_entry()
-        if self.allow_zero and not cp_entry:
+        if self.allow_zero and not self.value:
             return "ZERO"
-        assert cp_entry
-        return "-> " + self.target_text_handler(str(cp_entry))
+        pool = self.parent.root.getConstantPool()
+        assert 0 < self.value < len(pool)
+        if self.target_types:
+            assert pool.getType(self.value) in self.target_types
+        return "-> " + self.target_text_handler(pool.getText(self.value))
 
     def get_cp_entry(self):
         """
@@ -253,6 +306,167 @@ class CPIndex(UInt16):
         return cp_entry
 
 
+###############################################################################
+class ConstantPoolTable(object):
+    """
+    Constant pool decoded in one pass from the raw bytes of the class file,
+    without creating any field.  Entries are stored in a flat table indexed
+    by the constant pool index (index 0 and the index following a Long or a
+    Double entry are unused, their tag is 0):
+    - tags[index] is the constant type (see CONSTANT_TYPES)
+    - values[index] is the unicode string of Utf8 entries, the number of
+      Integer, Float, Long and Double entries, the referenced index of Class,
+      String, MethodType, Module and Package entries, or a tuple of integers
+      for the other types (eg. (class_index, name_and_type_index) for a
+      Methodref)
+
+    The end attribute is the offset (in bytes) of the data following the
+    constant pool.
+    """
+    def __init__(self, data, count, offset=10):
+        tags = array("B", (0,))
+        values = [None]
+        index = 1
+        while index < count:
+            if len(data) <= offset:
+                raise ParserError("Java: truncated constant pool")
+            tag = ord(data[offset])
+            offset += 1
+            if tag == 1:
+                length = unpack(">H", data[offset:offset+2])[0]
+                offset += 2
+                value = data[offset:offset+length]
+                offset += length
+                # Modified UTF-8: the nul character is encoded on two bytes
+                value = unicode(value.replace("\xc0\x80", "\0"), "UTF-8", "replace")
+            elif tag in CONSTANT_SIZE:
+                size = CONSTANT_SIZE[tag]
+                raw = data[offset:offset+size]
+                if len(raw) != size:
+                    raise ParserError("Java: truncated constant pool")
+                offset += size
+                if tag == 3:
+                    value = unpack(">i", raw)[0]
+                elif tag == 4:
+                    value = unpack(">f", raw)[0]
+                elif tag == 5:
+                    value = unpack(">q", raw)[0]
+                elif tag == 6:
+                    value = unpack(">d", raw)[0]
+                elif size == 2:
+                    value = unpack(">H", raw)[0]
+                elif size == 3:
+                    value = unpack(">BH", raw)
+                else:
+                    value = unpack(">HH", raw)
+            else:
+                raise ParserError("Java: unknown constant type (%s)" % tag)
+            tags.append(tag)
+            values.append(value)
+            index += 1
+            if tag in (5, 6):
+                # Long and Double entries use two indexes
+                tags.append(0)
+                values.append(None)
+                index += 1
+        self.tags = tags
+        self.values = values
+        self.end = offset
+
+    def __len__(self):
+        return len(self.tags)
+
+    def getType(self, index):
+        """
+        Returns the constant type name of an entry, or None for an unused
+        index.
+        """
+        return JavaCompiledClassFile.CONSTANT_TYPES.get(self.tags[index])
+
+    def getUtf8(self, index):
+        if self.tags[index] != 1:
+            raise ParserError("Java: constant %s is not an Utf8 entry" % index)
+        return self.values[index]
+
+    def getClassName(self, index):
+        """
+        Returns the name (with dots) of a Class entry.
+        """
+        if self.tags[index] != 7:
+            raise ParserError("Java: constant %s is not a Class entry" % index)
+        return self.getUtf8(self.values[index]).replace("/", ".")
+
+    def getNameAndType(self, index):
+        """
+        Returns (name, descriptor) of a NameAndType entry.
+        """
+        if self.tags[index] != 12:
+            raise ParserError("Java: constant %s is not a NameAndType entry" % index)
+        name_index, descriptor_index = self.values[index]
+        return (self.getUtf8(name_index), self.getUtf8(descriptor_index))
+
+    def getReference(self, index):
+        """
+        Returns (class name, name, descriptor) of a Fieldref, Methodref or
+        InterfaceMethodref entry.
+        """
+        if self.tags[index] not in (9, 10, 11):
+            raise ParserError("Java: constant %s is not a reference" % index)
+        class_index, name_and_type_index = self.values[index]
+        name, descriptor = self.getNameAndType(name_and_type_index)
+        return (self.getClassName(class_index), name, descriptor)
+
+    def getText(self, index):
+        """
+        Returns a human-readable string representation of an entry, similar
+        to str() of the CPInfo field.
+        """
+        tag = self.tags[index]
+        value = self.values[index]
+        if tag == 1:
+            return value
+        elif tag in (3, 4, 5, 6):
+            return unicode(value)
+        elif tag == 7:
+            return self.getClassName(index)
+        elif tag in (8, 16, 19, 20):
+            return self.getUtf8(value)
+        elif tag in (9, 10, 11):
+            class_index, name_and_type_index = value
+            return u"%s (from %s)" % (self.getText(name_and_type_index),
+                self.getClassName(class_index))
+        elif tag == 12:
+            name, descriptor = self.getNameAndType(index)
+            return parse_any_descriptor(descriptor, name=name)
+        elif tag in (15, 17, 18):
+            return self.getText(value[1])
+        else:
+            raise ParserError("Java: unused constant pool index (%s)" % index)
+
+    def iterClassNames(self):
+        """
+        Iterate on the names of the classes referenced by the constant pool:
+        Class entries and class types used in the descriptors.
+        """
+        tags = self.tags
+        values = self.values
+        for index in xrange(1, len(tags)):
+            tag = tags[index]
+            if tag == 7:
+                name = self.getUtf8(values[index])
+                if name.startswith("["):
+                    for name in descriptor_classes(name):
+                        yield name
+                else:
+                    yield name.replace("/", ".")
+            elif tag == 12:
+                for name in descriptor_classes(self.getUtf8(values[index][1])):
+                    yield name
+            elif tag == 16:
+                for name in descriptor_classes(self.getUtf8(values[index])):
+                    yield name
+
+
 ###############################################################################
 class JavaOpcode(FieldSet):
     OPSIZE = 0
@@ -668,6 +882,17 @@ class CPInfo(FieldSet):
         elif self.constant_type == "NameAndType":
             yield CPIndex(self, "name_index", target_types="Utf8")
             yield CPIndex(self, "descriptor_index", target_types="Utf8")
+        elif self.constant_type == "MethodHandle":
+            yield UInt8(self, "reference_kind")
+            yield CPIndex(self, "reference_index",
+                target_types=("Fieldref", "Methodref", "InterfaceMethodref"))
+        elif self.constant_type == "MethodType":
+            yield CPIndex(self, "descriptor_index", target_types="Utf8")
+        elif self.constant_type in ("Dynamic", "InvokeDynamic"):
+            yield UInt16(self, "bootstrap_method_attr_index")
+            yield CPIndex(self, "name_and_type_index", target_types="NameAndType")
+        elif self.constant_type in ("Module", "Package"):
+            yield CPIndex(self, "name_index", target_types="Utf8")
         else:
             raise ParserError("Not a valid constant pool element type: "
                     + self["tag"].value)
@@ -697,6 +922,14 @@ class CPInfo(FieldSet):
             return parse_any_descriptor(
                     str(self["descriptor_index"].get_cp_entry()),
                     name=str(self["name_index"].get_cp_entry()))
+        elif self.constant_type == "MethodHandle":
+            return str(self["reference_index"].get_cp_entry())
+        elif self.constant_type == "MethodType":
+            return str(self["descriptor_index"].get_cp_entry())
+        elif self.constant_type in ("Dynamic", "InvokeDynamic"):
+            return str(self["name_and_type_index"].get_cp_entry())
+        elif self.constant_type in ("Module", "Package"):
+            return str(self["name_index"].get_cp_entry())
         else:
             # FIXME: Return "<error>" instead of raising an exception?
             raise ParserError("Not a valid constant pool element type: "
@@ -782,7 +1015,8 @@ class AttributeInfo(FieldSet):
     def createFields(self):
         yield CPIndex(self, "attribute_name_index", "Attribute name", target_types="Utf8")
         yield UInt32(self, "attribute_length", "Length of the attribute")
-        attr_name = str(self["attribute_name_index"].get_cp_entry())
+        attr_name = self.root.getConstantPool().getUtf8(
+            self["attribute_name_index"].value)
 
         # ConstantValue_attribute {
         #   u2 attribute_name_index;
@@ -817,7 +1051,10 @@ class AttributeInfo(FieldSet):
             yield UInt16(self, "max_locals")
             yield UInt32(self, "code_length")
             if self["code_length"].value > 0:
-                yield JavaBytecode(self, "code", self["code_length"].value)
+                if self.root.parse_bytecode:
+                    yield JavaBytecode(self, "code", self["code_length"].value)
+                else:
+                    yield RawBytes(self, "code", self["code_length"].value)
             yield UInt16(self, "exception_table_length")
             if self["exception_table_length"].value > 0:
                 yield FieldArray(self, "exception_table", ExceptionTableEntry,
@@ -923,6 +1160,20 @@ class AttributeInfo(FieldSet):
         elif self["attribute_length"].value > 0:
             yield RawBytes(self, "info", self["attribute_length"].value)
 
+    def getBytecode(self):
+        """
+        Returns the bytecode of a Code attribute as a JavaBytecode field set
+        (opcode fields), even if the "code" field is stored as raw bytes.
+        Returns None if the attribute has no code.
+        """
+        if "code" not in self:
+            return None
+        code = self["code"]
+        if isinstance(code, JavaBytecode):
+            return code
+        return createOrphanField(self, code.address,
+            JavaBytecode, "code", self["code_length"].value)
+
 class ExceptionTableEntry(FieldSet):
     static_size = 48 + CPIndex.static_size
 
@@ -1013,7 +1264,18 @@ class JavaCompiledClassFile(Parser):
         "47.0": "JDK 1.3",
         "48.0": "JDK 1.4",
         "49.0": "JDK 1.5",
-        "50.0": "JDK 1.6"
+        "50.0": "JDK 1.6",
+        "51.0": "JDK 1.7",
+        "52.0": "JDK 1.8",
+        "53.0": "JDK 9",
+        "54.0": "JDK 10",
+        "55.0": "JDK 11",
+        "56.0": "JDK 12",
+        "57.0": "JDK 13",
+        "58.0": "JDK 14",
+        "59.0": "JDK 15",
+        "60.0": "JDK 16",
+        "61.0": "JDK 17",
     }
 
     # Constants go here since they will probably depend on the detected format
@@ -1030,9 +1292,26 @@ class JavaCompiledClassFile(Parser):
          9: "Fieldref",
         10: "Methodref",
         11: "InterfaceMethodref",
-        12: "NameAndType"
+        12: "NameAndType",
+        15: "MethodHandle",
+        16: "MethodType",
+        17: "Dynamic",
+        18: "InvokeDynamic",
+        19: "Module",
+        20: "Package",
     }
 
+    # Store the bytecode of the Code attributes in raw fields, use
+    # AttributeInfo.getBytecode() to parse it. Set it using the parser tag
+    # ("args", {"parse_bytecode": True}) to parse all opcodes.
+    parse_bytecode = False
+
+    def __init__(self, stream, **args):
+        Parser.__init__(self, stream, **args)
+        self._class_data = None
+        self._constant_pool = None
+        self._summary = None
+
     def validate(self):
         if self["magic"].value != self.MAGIC:
             return "Wrong magic signature!"
@@ -1048,6 +1327,102 @@ class JavaCompiledClassFile(Parser):
         else:
             return "Compiled Java class, version %s" % version
 
+    def getClassData(self):
+        """
+        Returns the content of the class file (string).
+        """
+        if self._class_data is None:
+            if self.stream.sizeGe(MAX_CLASS_SIZE * 8 + 1):
+                raise ParserError("Java: class file is too big")
+            self._class_data = self.stream.readBytes(0, self.stream.size // 8)
+        return self._class_data
+
+    def getConstantPool(self):
+        """
+        Returns the constant pool as a ConstantPoolTable, decoded without
+        creating the constant pool fields.
+        """
+        if self._constant_pool is None:
+            data = self.getClassData()
+            if len(data) < 10:
+                raise ParserError("Java: truncated class file")
+            count = unpack(">H", data[8:10])[0]
+            self._constant_pool = ConstantPoolTable(data, count)
+        return self._constant_pool
+
+    def getSummary(self):
+        """
+        Returns a summary of the class read directly from the raw data (no
+        field is created and the bytecode is skipped). It is a dictionary:
+        - "version": format version (string, eg. "50.0")
+        - "access_flags": access flags (integer)
+        - "name": class name, with dots (eg. "java.lang.String")
+        - "super": super class name, or None (java.lang.Object)
+        - "interfaces": list of implemented interface names
+        - "fields": list of (name, descriptor)
+        - "methods": list of (name, descriptor)
+        - "references": sorted list of the referenced class names (classes
+          of the constant pool and of the descriptors), without the class
+          itself
+        """
+        if self._summary is not None:
+            return self._summary
+        data = self.getClassData()
+        pool = self.getConstantPool()
+        offset = pool.end
+        if len(data) < offset + 8:
+            raise ParserError("Java: truncated class file")
+        access_flags, this_class, super_class, count = \
+            unpack(">HHHH", data[offset:offset+8])
+        offset += 8
+        if len(data) < offset + count * 2:
+            raise ParserError("Java: truncated class file")
+        interfaces = unpack(">%uH" % count, data[offset:offset + count * 2])
+        offset += count * 2
+        members = []
+        for kind in ("fields", "methods"):
+            if len(data) < offset + 2:
+                raise ParserError("Java: truncated class file")
+            count = unpack(">H", data[offset:offset+2])[0]
+            offset += 2
+            items = []
+            for index in xrange(count):
+                if len(data) < offset + 8:
+                    raise ParserError("Java: truncated class file")
+                name_index, descriptor_index, attributes = \
+                    unpack(">HHH", data[offset+2:offset+8])
+                offset += 8
+                # Skip the attributes (and so the bytecode)
+                for attribute in xrange(attributes):
+                    if len(data) < offset + 6:
+                        raise ParserError("Java: truncated class file")
+                    offset += 6 + unpack(">I", data[offset+2:offset+6])[0]
+                items.append((pool.getUtf8(name_index), pool.getUtf8(descriptor_index)))
+            members.append(items)
+        fields, methods = members
+
+        name = pool.getClassName(this_class)
+        if super_class:
+            super_name = pool.getClassName(super_class)
+        else:
+            super_name = None
+        references = set(pool.iterClassNames())
+        for field_name, descriptor in fields + methods:
+            references.update(descriptor_classes(descriptor))
+        references.discard(name)
+        major, minor = unpack(">HH", data[6:8] + data[4:6])
+        self._summary = {
+            "version": "%u.%u" % (major, minor),
+            "access_flags": access_flags,
+            "name": name,
+            "super": super_name,
+            "interfaces": [pool.getClassName(index) for index in interfaces],
+            "fields": fields,
+            "methods": methods,
+            "references": sorted(references),
+        }
+        return self._summary
+
     def createFields(self):
         yield textHandler(UInt32(self, "magic", "Java compiled class signature"),
             hexadecimal)
@@ -13,6 +13,10 @@ Creation date: 4 november 2006
 from hachoir_core.field import (FieldSet, ParserError,
     UInt8, UInt16, UInt32, PascalString16, Float64)
 from hachoir_core.tools import timestampUNIX
+from struct import unpack, error as struct_error
+
+# Maximum nesting level of objects and arrays read by readValue()
+MAX_DEPTH = 32
 
 def parseUTF8(parent):
     yield PascalString16(parent, "value", charset="UTF-8")
@@ -108,3 +112,77 @@ class Attribute(AMFObject):
     def createDescription(self):
         return 'Attribute "%s"' % self["key"].value
 
+def _readString(data, pos, length_size):
+    if length_size == 2:
+        end = pos + 2 + unpack(">H", data[pos:pos+2])[0]
+    else:
+        end = pos + 4 + unpack(">I", data[pos:pos+4])[0]
+    if len(data) < end:
+        raise ParserError("AMF: truncated string")
+    return unicode(data[pos+length_size:end], "UTF-8", "replace"), end
+
+def _readAttributes(data, pos, depth):
+    # Read "key, value" pairs up to the empty key and the end of object marker
+    value = {}
+    while True:
+        key, pos = _readString(data, pos, 2)
+        if not key and data[pos:pos+1] == "\x09":
+            return value, pos + 1
+        value[key], pos = readValue(data, pos, depth + 1)
+
+def readValue(data, pos=0, depth=0):
+    """
+    Decode an AMF0 value from raw data, without creating fields. Returns
+    (value, position after the value). Objects and mixed arrays are
+    decoded to dictionaries, arrays to lists, dates to datetime objects,
+    null and undefined values to None.
+
+    >>> readValue("\\x02\\x00\\x03abc")
+    (u'abc', 6)
+    >>> readValue("\\x03\\x00\\x01x\\x01\\x01\\x00\\x00\\x09")
+    ({u'x': True}, 9)
+    """
+    if MAX_DEPTH < depth:
+        raise ParserError("AMF: too many nested objects")
+    try:
+        code = ord(data[pos])
+        pos += 1
+        if code == 0:
+            return unpack(">d", data[pos:pos+8])[0], pos + 8
+        elif code == 1:
+            return bool(ord(data[pos])), pos + 1
+        elif code == 2:
+            return _readString(data, pos, 2)
+        elif code == 12:
+            return _readString(data, pos, 4)
+        elif code == 3:
+            return _readAttributes(data, pos, depth)
+        elif code == 8:
+            # Mixed array: the count is only a hint
+            return _readAttributes(data, pos + 4, depth)
+        elif code == 10:
+            count = unpack(">I", data[pos:pos+4])[0]
+            pos += 4
+            if len(data) < pos + count:
+                raise ParserError("AMF: truncated array")
+            value = []
+            for index in xrange(count):
+                item, pos = readValue(data, pos, depth + 1)
+                value.append(item)
+            return value, pos
+        elif code == AMFObject.CODE_DATE:
+            timestamp = unpack(">d", data[pos:pos+8])[0]
+            try:
+                value = timestampUNIX(timestamp / 1000)
+            except ValueError:
+                value = None
+            return value, pos + 10
+        elif code in (5, 6, 13):
+            # Null, undefined and unsupported
+            return None, pos
+        elif code == 7:
+            # Reference: index of a previous object
+            return unpack(">H", data[pos:pos+2])[0], pos + 2
+    except (IndexError, struct_error):
+        raise ParserError("AMF: truncated value")
+    raise ParserError("AMF: Unable to parse type %s" % code)
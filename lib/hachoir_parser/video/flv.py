@@ -8,6 +8,9 @@ Documentation:
  - flashticle: Python project to read Flash (SWF and FLV with AMF metadata)
    http://undefined.org/python/#flashticle
 
+FlvFile.getTagIndex() walks the tags with their 11-byte headers (without
+creating Chunk fields) to get the duration and the keyframes quickly.
+
 Author: Victor Stinner
 Creation date: 4 november 2006
 """
@@ -18,8 +21,24 @@ from hachoir_core.field import (FieldSet,
     Bit, Bits, String, RawBytes, Enum)
 from hachoir_core.endian import BIG_ENDIAN
 from hachoir_parser.audio.mpeg_audio import Frame
-from hachoir_parser.video.amf import AMFObject
-from hachoir_core.tools import createDict
+from hachoir_parser.video.amf import AMFObject, readValue
+from hachoir_core.tools import createDict, createOffsetArray
+from datetime import timedelta
+from struct import unpack
+from array import array
+
+TAG_AUDIO = 8
+TAG_VIDEO = 9
+TAG_METADATA = 18
+
+# Size in bytes of the blocks read by the tag walker
+WALK_BLOCK_SIZE = 64 * 1024
+
+# Maximum number of tags read to find the onMetaData tag
+METADATA_MAX_TAGS = 32
+
+# Maximum size in bytes of a script data (AMF) tag read by getMetadata()
+MAX_METADATA_SIZE = 16 * 1024 * 1024
 
 SAMPLING_RATE = {
     0: ( 5512, "5.5 kHz"),
@@ -88,9 +107,9 @@ def parseAMF(parent, size):
 
 class Chunk(FieldSet):
     tag_info = {
-         8: ("audio[]", parseAudio, ""),
-         9: ("video[]", parseVideo, ""),
-        18: ("metadata", parseAMF, ""),
+        TAG_AUDIO: ("audio[]", parseAudio, ""),
+        TAG_VIDEO: ("video[]", parseVideo, ""),
+        TAG_METADATA: ("metadata", parseAMF, ""),
     }
 
     def __init__(self, *args, **kw):
@@ -106,7 +125,8 @@ class Chunk(FieldSet):
         yield UInt8(self, "tag")
         yield UInt24(self, "size", "Content size")
         yield UInt24(self, "timestamp", "Timestamp in millisecond")
-        yield NullBytes(self, "reserved", 4)
+        yield UInt8(self, "timestamp_ext", "Upper 8 bits of the timestamp")
+        yield NullBytes(self, "stream_id", 3)
         size = self["size"].value
         if size:
             if self.parser:
@@ -121,6 +141,38 @@ class Chunk(FieldSet):
         except LookupError:
             return None
 
+class TagIndex(object):
+    """
+    Compact index of the tags of a FLV file: one entry per tag with its
+    address (in bytes), its type (TAG_AUDIO, TAG_VIDEO, ...), its timestamp
+    (in milliseconds), its content size (in bytes) and a keyframe flag
+    (video tags).
+    """
+    def __init__(self):
+        self.offset = createOffsetArray()
+        self.tag = array('B')
+        self.timestamp = array('L')
+        self.size = array('L')
+        self.keyframe = array('B')
+
+    def append(self, offset, tag, timestamp, size, keyframe):
+        self.offset.append(offset)
+        self.tag.append(tag)
+        self.timestamp.append(timestamp)
+        self.size.append(size)
+        self.keyframe.append(keyframe)
+
+    def __len__(self):
+        return len(self.offset)
+
+    def __getitem__(self, index):
+        return (int(self.offset[index]), self.tag[index],
+            self.timestamp[index], self.size[index], bool(self.keyframe[index]))
+
+    def __iter__(self):
+        for index in xrange(len(self.offset)):
+            yield self[index]
+
 class FlvFile(Parser):
     PARSER_TAGS = {
         "id": "flv",
@@ -138,6 +190,11 @@ class FlvFile(Parser):
     }
     endian = BIG_ENDIAN
 
+    def __init__(self, stream, **args):
+        Parser.__init__(self, stream, **args)
+        self._tag_index = None
+        self._metadata = False
+
     def validate(self):
         if self.stream.readBytes(0, 3) != "FLV":
             return "Wrong file signature"
@@ -155,3 +212,91 @@ class FlvFile(Parser):
     def createDescription(self):
         return u"Macromedia Flash video version %s" % self["header/version"].value
 
+    def iterTags(self, block_size=WALK_BLOCK_SIZE):
+        """
+        Walk the tags using their headers: yield (offset, tag, timestamp,
+        size, keyframe) where offset is the address of the tag (in bytes),
+        timestamp in milliseconds and size the content size (in bytes).
+        Stop at the first truncated tag.
+        """
+        stream = self.stream
+        pos = unpack(">I", stream.readBytes(5 * 8, 4))[0] + 4
+        data = ""
+        data_offset = pos
+        while True:
+            index = pos - data_offset
+            if len(data) < index + 12:
+                # Read the next block from the current tag
+                if not stream.sizeGe((pos + 11) * 8):
+                    break
+                size = block_size
+                if not stream.sizeGe((pos + size) * 8):
+                    size = stream.size // 8 - pos
+                data = stream.readBytes(pos * 8, size)
+                data_offset = pos
+                index = 0
+            size, timestamp = unpack(">II", data[index:index+8])
+            tag, size = size >> 24, size & 0xFFFFFF
+            timestamp = (timestamp >> 8) | ((timestamp & 0xFF) << 24)
+            end = pos + 11 + size
+            if not stream.sizeGe(end * 8):
+                break
+            keyframe = (tag == TAG_VIDEO and size \
+                and (ord(data[index+11]) >> 4) == 1)
+            yield pos, tag, timestamp, size, keyframe
+            # Skip the content and the size of the previous tag
+            pos = end + 4
+
+    def getTagIndex(self):
+        """
+        Get the TagIndex of the file (the tags are only walked once).
+        """
+        if self._tag_index is None:
+            index = TagIndex()
+            for entry in self.iterTags():
+                index.append(*entry)
+            self._tag_index = index
+        return self._tag_index
+
+    def getDuration(self):
+        """
+        Duration computed from the timestamps of the audio and video tags:
+        returns a timedelta, or None if there is no such tag.
+        """
+        index = self.getTagIndex()
+        timestamps = [timestamp
+            for tag, timestamp in zip(index.tag, index.timestamp)
+            if tag in (TAG_AUDIO, TAG_VIDEO)]
+        if not timestamps:
+            return None
+        return timedelta(milliseconds=max(timestamps))
+
+    def getKeyframes(self):
+        """
+        Keyframe seek table: list of (timestamp in milliseconds, address of
+        the tag in bytes) of the video keyframes.
+        """
+        index = self.getTagIndex()
+        return [(index.timestamp[item], int(index.offset[item]))
+            for item in xrange(len(index)) if index.keyframe[item]]
+
+    def getMetadata(self):
+        """
+        Decode the onMetaData script tag (usually the first tag): returns
+        the AMF value (dictionary), or None if there is no such tag.
+        """
+        if self._metadata is not False:
+            return self._metadata
+        self._metadata = None
+        for count, (offset, tag, timestamp, size, keyframe) in enumerate(self.iterTags()):
+            if METADATA_MAX_TAGS <= count:
+                break
+            if tag != TAG_METADATA or MAX_METADATA_SIZE < size:
+                continue
+            data = self.stream.readBytes((offset + 11) * 8, size)
+            name, pos = readValue(data)
+            if name != u"onMetaData":
+                continue
+            self._metadata = readValue(data, pos)[0]
+            break
+        return self._metadata